@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for config parsing, merging, substitution and defaults.
+
+We generate configs with many sections, a deep extends chain,
+and lots of ${part:option} references between sections.
+For each benchmark we report the best and median time of several runs,
+and the peak memory use, measured in a separate run with tracemalloc.
+
+This only uses the standard library, so it runs offline::
+
+    python benchmarks/bench_config.py
+    python benchmarks/bench_config.py --scale large --repeat 10
+    python benchmarks/bench_config.py --json before.json
+    python benchmarks/bench_config.py --compare before.json
+
+With --compare we exit with an error when a benchmark is more than
+--tolerance times slower than in the saved results.
+"""
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from configcook.config import _merge_dicts
+from configcook.config import ConfigCookConfig
+from configcook.config import parse_toml_config
+from configcook.dependencies import find_part_dependencies
+from configcook.substitution import _template_cache
+from configcook.utils import OptionsValidator
+from configcook.utils import set_defaults
+from configcook.utils import to_bool
+from configcook.utils import to_int
+from configcook.utils import to_list
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+# Number of sections, length of the extends chain,
+# and number of references in each section.
+SCALES = {
+    "tiny": (20, 3, 2),
+    "small": (200, 5, 3),
+    "medium": (2000, 10, 5),
+    "large": (5000, 20, 10),
+}
+# Defaults like a recipe would have them.
+RECIPE_DEFAULTS = {
+    "recipe": {"required": True},
+    "enabled": {"default": True, "parser": to_bool},
+    "port": {"default": 8080, "parser": to_int},
+    "packages": {"default": [], "parser": to_list},
+    "name": {"required": True},
+    "missing": {"default": "default value"},
+}
+
+
+def _toml_value(value):
+    return json.dumps(value)
+
+
+def generate_layers(sections, depth, references):
+    """Generate a list of config dictionaries, from base to top.
+
+    The base layer has all sections.  The other layers change
+    and append to some options, like a real extends chain would do.
+    """
+    base = {"configcook": {"parts": ["part{0}".format(i) for i in range(sections)]}}
+    for i in range(sections):
+        section = {
+            "recipe": "configcook:commands",
+            "name": "part{0}".format(i),
+            "port": str(8000 + i),
+            "packages": ["package{0}".format(i)],
+            "commands": ["echo ${:name}"],
+        }
+        # References to earlier sections, so we get long chains.
+        for r in range(references):
+            other = (i - 1 - r * 7) % sections
+            if other >= i:
+                # Do not create cycles.
+                section["ref{0}".format(r)] = "fixed{0}".format(r)
+            else:
+                section["ref{0}".format(r)] = "${part%d:ref%d}/${part%d:name}" % (
+                    other,
+                    r,
+                    other,
+                )
+        base["part{0}".format(i)] = section
+    layers = [base]
+    for level in range(1, depth):
+        layer = {"configcook": {"parts+": []}}
+        for i in range(level, sections, depth):
+            layer["part{0}".format(i)] = {
+                "port": str(9000 + i),
+                "packages+": ["extra{0}-{1}".format(level, i)],
+                "level": level,
+            }
+        layers.append(layer)
+    return layers
+
+
+def write_layers(directory, layers):
+    """Write the layers as toml files in an extends chain.
+
+    Returns the path of the top file.
+    """
+    paths = []
+    for index, layer in enumerate(layers):
+        path = os.path.join(directory, "layer{0}.toml".format(index))
+        lines = []
+        for section_name, section in sorted(layer.items()):
+            lines.append("[{0}]".format(section_name))
+            if section_name == "configcook" and index > 0:
+                extends = [os.path.basename(paths[-1])]
+                lines.append("extends = {0}".format(_toml_value(extends)))
+            for key, value in sorted(section.items()):
+                lines.append("{0} = {1}".format(_toml_value(key), _toml_value(value)))
+            lines.append("")
+        with open(path, "w") as toml_file:
+            toml_file.write("\n".join(lines))
+        paths.append(path)
+    return paths[-1]
+
+
+def merge_layers(layers):
+    result = layers[0]
+    for layer in layers[1:]:
+        result = _merge_dicts(result, layer)
+    return result
+
+
+def substitute(merged):
+    _template_cache.clear()
+    config = ConfigCookConfig(merged)
+    config.substitute_all()
+    return config
+
+
+def apply_defaults(config):
+    for name in config["configcook"]["parts"]:
+        set_defaults(RECIPE_DEFAULTS, dict(config[name]))
+
+
+def validate(config):
+    validator = OptionsValidator(RECIPE_DEFAULTS)
+    for name in config["configcook"]["parts"]:
+        validator.check(dict(config[name]))
+
+
+def get_benchmarks(directory, scale):
+    """Get a list of (name, function) to benchmark."""
+    sections, depth, references = SCALES[scale]
+    layers = generate_layers(sections, depth, references)
+    top = write_layers(directory, layers)
+    merged = merge_layers(layers)
+    substituted = substitute(merged)
+    # Fill the config cache.
+    parse_toml_config(top, cache=True)
+    part_names = substituted["configcook"]["parts"]
+    return [
+        ("parse_toml_config", lambda: parse_toml_config(top)),
+        ("parse_toml_config cached", lambda: parse_toml_config(top, cache=True)),
+        ("merge_dicts", lambda: merge_layers(layers)),
+        ("substitute_all", lambda: substitute(merged)),
+        ("set_defaults", lambda: apply_defaults(substituted)),
+        ("OptionsValidator", lambda: validate(substituted)),
+        (
+            "find_part_dependencies",
+            lambda: find_part_dependencies(ConfigCookConfig(merged), part_names),
+        ),
+    ]
+
+
+def run_benchmark(function, repeat):
+    """Run a function several times.
+
+    Returns the best time, the median time, and the peak memory in bytes.
+    """
+    times = []
+    for _i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    # Measure memory separately: tracemalloc makes everything slower.
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times[0], times[len(times) // 2], peak
+
+
+def compare(results, baseline, tolerance):
+    """Compare results with a baseline.  Returns a list of regressions."""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result["best"] > old["best"] * tolerance:
+            regressions.append(
+                "{0}: {1:.4f} seconds, was {2:.4f}".format(
+                    name, result["best"], old["best"]
+                )
+            )
+    return regressions
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="medium")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--json", metavar="FILE", help="Save the results in this file."
+    )
+    parser.add_argument(
+        "--compare", metavar="FILE", help="Compare with results saved with --json."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="With --compare, fail when a benchmark is this many times slower. "
+        "Default: 1.25.",
+    )
+    options = parser.parse_args(args)
+    sections, depth, references = SCALES[options.scale]
+    print(
+        "Scale {0}: {1} sections, {2} files in extends chain, "
+        "{3} references per section.".format(
+            options.scale, sections, depth, references
+        )
+    )
+    directory = tempfile.mkdtemp(prefix="configcook-bench-")
+    results = {}
+    try:
+        line = "{0:<28} {1:>10} {2:>10} {3:>12}"
+        print(line.format("Benchmark", "Best (s)", "Median (s)", "Peak memory"))
+        for name, function in get_benchmarks(directory, options.scale):
+            best, median, peak = run_benchmark(function, options.repeat)
+            results[name] = {"best": best, "median": median, "peak_memory": peak}
+            print(
+                line.format(
+                    name,
+                    "{0:.4f}".format(best),
+                    "{0:.4f}".format(median),
+                    "{0:.1f} MiB".format(peak / 1024.0 / 1024.0),
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
+    data = {"scale": options.scale, "python": sys.version, "results": results}
+    if options.json:
+        with open(options.json, "w") as json_file:
+            json.dump(data, json_file, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as json_file:
+            baseline = json.load(json_file)
+        if baseline.get("scale") != options.scale:
+            print(
+                "Cannot compare: the baseline uses scale {0}.".format(
+                    baseline.get("scale")
+                )
+            )
+            return 2
+        regressions = compare(results, baseline["results"], options.tolerance)
+        if regressions:
+            print("Slower than the baseline:")
+            for regression in regressions:
+                print("- " + regression)
+            return 1
+        print("No regressions compared to {0}.".format(options.compare))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Compare the speed of the toml backends on big generated configs.
+
+We parse the files of the extends chain from bench_config.py
+with each toml library that is installed::
+
+    python benchmarks/bench_toml.py
+    python benchmarks/bench_toml.py --scale large --repeat 10
+"""
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from bench_config import generate_layers
+from bench_config import run_benchmark
+from bench_config import SCALES
+from bench_config import write_layers
+from configcook import tomlparser
+
+import os
+import shutil
+import sys
+import tempfile
+
+
+def main(args=None):
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="medium")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args(args)
+    backends = tomlparser.available_backends()
+    print("Available toml backends: {0}".format(", ".join(backends)))
+    print("Default backend: {0}".format(tomlparser.get_backend()))
+    directory = tempfile.mkdtemp(prefix="configcook-bench-")
+    try:
+        sections, depth, references = SCALES[options.scale]
+        write_layers(directory, generate_layers(sections, depth, references))
+        texts = []
+        for filename in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, filename)) as toml_file:
+                texts.append(toml_file.read())
+    finally:
+        shutil.rmtree(directory)
+    size = sum(len(text) for text in texts)
+    print(
+        "Scale {0}: {1} files, {2:.1f} KiB in total.".format(
+            options.scale, len(texts), size / 1024.0
+        )
+    )
+    line = "{0:<12} {1:>10} {2:>10} {3:>12} {4:>8}"
+    print(line.format("Backend", "Best (s)", "Median (s)", "Peak memory", "Speed"))
+    results = []
+    for backend in backends:
+
+        def parse(backend=backend):
+            for text in texts:
+                tomlparser.loads(text, backend=backend)
+
+        results.append((backend,) + run_benchmark(parse, options.repeat))
+    slowest = max(result[1] for result in results)
+    for backend, best, median, peak in results:
+        print(
+            line.format(
+                backend,
+                "{0:.4f}".format(best),
+                "{0:.4f}".format(median),
+                "{0:.1f} MiB".format(peak / 1024.0 / 1024.0),
+                "{0:.1f}x".format(slowest / best),
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
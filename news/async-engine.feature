@@ -0,0 +1 @@
+Added ``--async`` option: run the parts in an event loop. Recipes and extensions may use ``async def`` methods and hooks, and ``configcook.aio.run_command`` runs commands without blocking. Normal recipes run in threads.
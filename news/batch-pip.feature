@@ -0,0 +1 @@
+Install all missing extension packages, plus their ``packages`` and ``eggs`` options, with a single pip call.  After loading the extensions, do the same for all missing recipe packages, so the ``pip`` hooks of extensions are called for them.
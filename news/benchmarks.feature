@@ -0,0 +1 @@
+Added benchmarks for parsing, merging and substituting big configs, in the ``benchmarks`` directory.
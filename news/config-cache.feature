@@ -0,0 +1 @@
+Added ``--config-cache`` option: store the parsed config, including all files that it extends, in a hidden file next to the config, and reuse it while none of the files change.
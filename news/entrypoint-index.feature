@@ -0,0 +1,2 @@
+Find extensions and recipes with an index of entrypoints that is built once per run, instead of with ``pkg_resources``.
+With ``entrypoint-cache = true`` in the ``configcook`` section, the index is stored in the ``cache-directory`` and reused until ``sys.path`` changes.
@@ -0,0 +1 @@
+Extensions can define a ``subscriptions`` method to choose for which functions their ``run_before`` and ``run_after`` hooks are called.  The hooks are looked up once, after loading the extensions.
@@ -0,0 +1 @@
+Record installed parts in ``.installed.json``, and call the new ``update`` method of the recipe instead of ``install`` when a part has not changed.
@@ -0,0 +1 @@
+Faster start up: only import ``toml``, ``subprocess`` and the main machinery when needed, so ``configcook --help`` is quick.
@@ -0,0 +1 @@
+Merging extended config files no longer deep-copies the whole config for every file, and ``ConfigCookConfig._raw`` is a shallow copy instead of a deep copy.
@@ -0,0 +1,2 @@
+A value that is a single ``${part:option}`` reference now keeps the type of the referenced value, for example a list, instead of becoming a string.
+Added ``to_bool``, ``to_int`` and ``to_list`` parsers in ``configcook.utils`` for recipes.
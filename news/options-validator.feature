@@ -0,0 +1 @@
+Recipe and extension defaults are compiled once per class.  When the options of several parts are wrong, all errors are reported at once.
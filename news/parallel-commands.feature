@@ -0,0 +1 @@
+The ``configcook:commands`` recipe splits commands like a shell, so quotes work, and only uses a shell for commands with shell operators. New ``parallel`` and ``jobs`` options run the commands of a part at the same time, stopping all of them when one fails.
@@ -0,0 +1,2 @@
+Install parts in dependency order, based on ``${part:option}`` references and a new ``depends`` option.
+With the new ``--jobs`` option, independent parts are installed in parallel.
@@ -0,0 +1 @@
+Added ``--plan`` option to show what a run would do without changing anything: packages to install, parts per level, what each part would do, and estimated durations from the previous run.
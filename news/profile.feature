@@ -0,0 +1 @@
+Added ``--profile FILE`` option to profile the run with cProfile, and a ``configcook:profile`` extension to profile only selected functions or parts. Extension hooks are now also called for each part, with function name ``run_part``.
@@ -0,0 +1 @@
+Only call pip for packages that are not installed yet.  Use the new ``--force-pip`` option to always call pip.
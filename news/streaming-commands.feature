@@ -0,0 +1 @@
+Stream the output of commands to the log while they run, instead of collecting it in temporary files. The ``configcook:commands`` recipe has new ``log-file`` and ``timeout`` options.
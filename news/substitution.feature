@@ -0,0 +1 @@
+Substitution of ``${part:option}`` now also resolves chained references, regardless of the order of the sections.  Circular references give an error.
@@ -0,0 +1 @@
+The ``configcook:template`` recipe has new options ``input-file``, to read the template from a file, and ``foreach``, to render one file for each item in a list. Templates are compiled only once.
@@ -0,0 +1 @@
+The ``configcook:template`` recipe only writes its output file when the contents change, and writes it atomically. Unchanged files are not touched.
@@ -0,0 +1 @@
+Added ``--timings`` and ``--timings-json FILE`` options to show or save how long each phase, entry point lookup, pip call and part took.
@@ -0,0 +1 @@
+Parse TOML with the fastest available library: ``tomllib`` on Python 3.11+, then ``tomli``, then ``toml``.  Added a benchmark to compare them.
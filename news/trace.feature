@@ -0,0 +1 @@
+Added ``--trace FILE`` option to write a trace of the run in Chrome trace format, with nested spans for phases, parts and commands.
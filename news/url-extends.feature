@@ -0,0 +1 @@
+Allow urls in ``extends``, and as the main config. All files extended by one config are loaded at the same time. Urls are cached, and with ``--offline`` only the cache is used.
@@ -0,0 +1 @@
+Added ``--watch`` option to run again when the config file or a file that it extends changes.  Only changed files are parsed again, and only parts with changed options run again.
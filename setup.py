@@ -52,13 +52,22 @@ setup(
     namespace_packages=[],
     include_package_data=True,
     zip_safe=True,
-    install_requires=["setuptools", "six", "toml"],
-    extras_require={"test": ["pytest", "pytest-cov"]},
+    install_requires=[
+        "futures; python_version < '3'",
+        "setuptools",
+        "six",
+        "toml; python_version < '3.11'",
+    ],
+    extras_require={
+        "test": ["pytest", "pytest-cov"],
+        "tomli": ["tomli; python_version >= '3.7' and python_version < '3.11'"],
+    },
     entry_points={
         "console_scripts": ["configcook = configcook.cli:main"],
         "configcook.extension": [
             "configcook:extension_example = configcook.extensions:ExampleExtension",
             "configcook:pdb = configcook.extensions:PDBExtension",
+            "configcook:profile = configcook.extensions:ProfileExtension",
         ],
         "configcook.recipe": [
             "configcook:packages = configcook.recipes:BaseRecipe",
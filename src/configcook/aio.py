@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous engine for running parts.
+
+This needs Python 3.5 or higher.  Only import this module when needed:
+the rest of configcook still works on Python 2.7.
+
+Recipes and extensions may define their methods with 'async def'.
+When the --async option is used, all parts run in one event loop.
+Async methods run in the loop, so parts that mostly wait for the network
+or for subprocesses overlap without needing a thread each.
+Normal methods run in a pool of threads, so they do not block the loop.
+"""
+from . import timings
+from .dependencies import raise_part_errors
+from .dependencies import sort_parts
+from .exceptions import CommandTimeoutError
+from .process import command_label
+from .process import CommandResult
+from .process import MAX_LINE_LENGTH
+from .process import MAX_QUEUED_LINES
+from .utils import buffered_logs
+from .utils import describe_instance
+from .utils import LogBuffer
+from .utils import timing_key
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import functools
+import inspect
+import logging
+import subprocess
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_async(function):
+    """Is this function defined with 'async def'?"""
+    return inspect.iscoroutinefunction(function)
+
+
+def _current_task():
+    try:
+        return asyncio.current_task()
+    except AttributeError:
+        # Python 3.6
+        return asyncio.Task.current_task()
+    except RuntimeError:
+        # No event loop is running in this thread.
+        return None
+
+
+def _task_id():
+    """Get an id for the current task, to use in timings.
+
+    Tasks run at the same time in one thread,
+    so in a trace we show each task as a separate thread.
+    """
+    task = _current_task()
+    return None if task is None else id(task)
+
+
+def run(awaitable):
+    """Run an awaitable in a new event loop, and return the result."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+def run_all(awaitables):
+    """Run awaitables at the same time in a new event loop.
+
+    Returns a list of results.  When one of them fails, we raise its error,
+    after all of them are finished.
+    """
+
+    async def gather():
+        results = await asyncio.gather(*awaitables, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    return run(gather())
+
+
+def async_entrypoint_function(fun):
+    """Version of utils.entrypoint_function for 'async def' methods."""
+
+    @functools.wraps(fun)
+    async def wrapper_entrypoint_function(*args, **kwargs):
+        name = describe_instance(args[0])
+        logger.debug("Calling async function %s of %s.", fun.__name__, name)
+        start = time.time()
+        with timings.measure(*timing_key(args[0], fun), thread=_task_id()):
+            result = await fun(*args, **kwargs)
+        run_time = time.time() - start
+        logger.debug(
+            "Finished in %.4f seconds: async function %s of %s.",
+            run_time,
+            fun.__name__,
+            name,
+        )
+        return result
+
+    return wrapper_entrypoint_function
+
+
+class TaskLogBuffer(LogBuffer):
+    """Collect log records per part, for threads and for asyncio tasks.
+
+    Log records from an asyncio task started with call_async
+    are collected under the name that was passed.
+    """
+
+    def __init__(self):
+        super(TaskLogBuffer, self).__init__()
+        # task -> name
+        self._tasks = {}
+
+    def current_name(self):
+        name = super(TaskLogBuffer, self).current_name()
+        if name is None and self._tasks:
+            name = self._tasks.get(_current_task())
+        return name
+
+    async def call_async(self, name, function, *args, **kwargs):
+        task = _current_task()
+        self._records.setdefault(name, [])
+        self._tasks[task] = name
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            del self._tasks[task]
+
+
+async def _await_all(awaitables):
+    """Await the awaitables at the same time, and empty the list.
+
+    When one of them fails, we raise its error, after all of them are finished.
+    """
+    pending = list(awaitables)
+    del awaitables[:]
+    results = await asyncio.gather(*pending, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def _run_part(name, start_part, executor, logs):
+    """Run one part.
+
+    start_part(name, awaitables) returns the method to call, and a function
+    that we call afterwards with True or False, for success or failure.
+    Both add the awaitables of 'async def' hooks to the awaitables list,
+    and we await them, because we cannot start a new event loop here.
+    """
+    awaitables = []
+    method, finish = start_part(name, awaitables)
+    await _await_all(awaitables)
+    if method is None:
+        finish(True)
+        await _await_all(awaitables)
+        return
+    try:
+        if is_async(method):
+            await method()
+        else:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(executor, logs.call, name, method)
+    except Exception:
+        finish(False)
+        await _await_all(awaitables)
+        raise
+    finish(True)
+    await _await_all(awaitables)
+
+
+async def _run_parts(ordered, dependencies, start_part, jobs, executor, logs):
+    semaphore = asyncio.Semaphore(jobs)
+    tasks = {}
+    done = set()
+    finished = set()
+    errors = {}
+    not_started = []
+    flushed = [0]
+
+    async def run_one(name):
+        for dependency in dependencies[name]:
+            await tasks[dependency]
+        async with semaphore:
+            if errors or not dependencies[name] <= done:
+                not_started.append(name)
+            else:
+                try:
+                    await logs.call_async(
+                        name, _run_part, name, start_part, executor, logs
+                    )
+                except Exception as exc:
+                    errors[name] = exc
+                else:
+                    done.add(name)
+        finished.add(name)
+        # Show the logs of finished parts, in the original order.
+        while flushed[0] < len(ordered) and ordered[flushed[0]] in finished:
+            logs.flush(ordered[flushed[0]])
+            flushed[0] += 1
+
+    # The parts are sorted, so the tasks of dependencies are created first.
+    for name in ordered:
+        tasks[name] = asyncio.ensure_future(run_one(name))
+    await asyncio.gather(*tasks.values())
+    raise_part_errors(ordered, errors, not_started)
+
+
+def run_parts_async(part_names, dependencies, start_part, jobs=1):
+    """Run all parts in an event loop, respecting dependencies.
+
+    This is the async version of dependencies.run_parts.
+    At most 'jobs' parts run at the same time.
+    See _run_part for what start_part must do.
+
+    The log messages of each part are collected,
+    and shown per part, in the same order as when running serially.
+    When a part fails, we do not start new parts, wait for the
+    running parts to finish, and raise the error.
+    """
+    ordered = sort_parts(part_names, dependencies)
+    logger.debug("Running %d parts in event loop with %d jobs.", len(ordered), jobs)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        with buffered_logs(TaskLogBuffer()) as logs:
+            run(_run_parts(ordered, dependencies, start_part, jobs, executor, logs))
+
+
+async def _read_stream(stream, stream_name, lines):
+    """Read lines from a stream, and put them in the lines queue.
+
+    Lines longer than MAX_LINE_LENGTH are put in the queue in pieces.
+    At the end we put None in the queue.
+    """
+    pending = b""
+    while True:
+        chunk = await stream.read(MAX_LINE_LENGTH)
+        if not chunk:
+            break
+        pending += chunk
+        while pending:
+            end = pending.find(b"\n") + 1
+            if not end:
+                if len(pending) < MAX_LINE_LENGTH:
+                    break
+                end = MAX_LINE_LENGTH
+            await lines.put((stream_name, pending[:end]))
+            pending = pending[end:]
+    if pending:
+        await lines.put((stream_name, pending))
+    await lines.put((stream_name, None))
+
+
+async def run_command(
+    command,
+    capture_output=False,
+    capture_errors=False,
+    log=True,
+    log_file=None,
+    timeout=None,
+    check=False,
+    **kwargs
+):
+    """Run a command in the event loop, streaming its output to the log.
+
+    This is the async version of process.run_command,
+    with the same options, except 'cancel':
+    cancel the task that awaits this instead.
+    """
+    start = time.time()
+    start_clock = timings.clock()
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+    )
+    lines = asyncio.Queue(maxsize=MAX_QUEUED_LINES)
+    readers = [
+        asyncio.ensure_future(_read_stream(process.stdout, "out", lines)),
+        asyncio.ensure_future(_read_stream(process.stderr, "err", lines)),
+    ]
+    captured = {"out": [], "err": []}
+    capture = {"out": capture_output, "err": capture_errors}
+    tee = open(log_file, "ab") if log_file else None
+
+    async def consume():
+        open_pipes = len(readers)
+        while open_pipes:
+            stream_name, line = await lines.get()
+            if line is None:
+                open_pipes -= 1
+                continue
+            if tee is not None:
+                tee.write(line)
+            if capture[stream_name]:
+                captured[stream_name].append(line)
+            elif log:
+                logger.info("%s", line.decode("utf-8", "replace").rstrip("\r\n"))
+        return await process.wait()
+
+    try:
+        try:
+            returncode = await asyncio.wait_for(consume(), timeout)
+        except asyncio.TimeoutError:
+            raise CommandTimeoutError(
+                "Command timed out after {0} seconds: {1}".format(timeout, command)
+            )
+    finally:
+        if tee is not None:
+            tee.close()
+        for reader in readers:
+            reader.cancel()
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+        if timings.get_recorder() is not None:
+            timings.record(
+                "command",
+                command_label(command),
+                start_clock,
+                thread=_task_id(),
+                args={"pid": process.pid, "returncode": process.returncode},
+            )
+    result = CommandResult(
+        command,
+        returncode,
+        output=b"".join(captured["out"]) if capture_output else None,
+        errors=b"".join(captured["err"]) if capture_errors else None,
+        duration=time.time() - start,
+    )
+    logger.debug(
+        "Command finished in %.4f seconds with exit code %d: %s",
+        result.duration,
+        returncode,
+        command,
+    )
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, command, output=result.output)
+    return result
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-from .main import ConfigCook
 from argparse import ArgumentParser
 
 import logging
@@ -15,14 +14,33 @@ CONFIGFILE_DEFAULTS = ["cc.toml", "pyproject.toml"]
 def parse_options():
     parser = ArgumentParser()
     # Note: please keep these sorted alphabetically on long form.
+    parser.add_argument(
+        "--async",
+        action="store_true",
+        dest="use_async",
+        default=False,
+        help="Run the parts in an event loop. Recipes with 'async def' methods "
+        "run in the loop, other recipes in threads. "
+        "Use --jobs to set how many parts run at the same time. "
+        "Needs Python 3.",
+    )
     parser.add_argument(
         "-c",
         "--config",
         dest="configfile",
-        help="Config filename to load. If not given, falls back to the first of these in the current directory: {0}.".format(
+        help="Config filename or url to load. If not given, falls back to the first of these in the current directory: {0}.".format(
             ", ".join(CONFIGFILE_DEFAULTS)
         ),
     )
+    parser.add_argument(
+        "--config-cache",
+        action="store_true",
+        dest="config_cache",
+        default=False,
+        help="Cache the parsed config file, including all files that it extends, "
+        "in a hidden file next to the config file. "
+        "The cache is used as long as none of these files change.",
+    )
     parser.add_argument(
         "-D",
         "--debug",
@@ -31,6 +49,23 @@ def parse_options():
         default=False,
         help="Start Python debugger when exception occurs",
     )
+    parser.add_argument(
+        "--force-pip",
+        action="store_true",
+        dest="force_pip",
+        default=False,
+        help="Always call pip to install the packages from extensions and recipes, "
+        "even when they are already installed.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        dest="jobs",
+        default=1,
+        help="Number of parts to install at the same time. "
+        "Parts that depend on other parts wait for them to finish. Default: 1.",
+    )
     parser.add_argument(
         "--no-packages",
         action="store_true",
@@ -39,6 +74,54 @@ def parse_options():
         help="Do not install, upgrade or uninstall Python packages. "
         "This also means no new extensions or recipes.",
     )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        dest="offline",
+        default=False,
+        help="Do not download config files that are extended with a url, "
+        "but only use the versions from a previous download.",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        dest="plan",
+        default=False,
+        help="Do not install anything, but show what a run would do: "
+        "the packages to install, the parts in order, what each part would do, "
+        "and how long that took in the previous run.",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        metavar="FILE",
+        help="Profile the run with cProfile, and write the pstats data to this file. "
+        "View it with 'python -m pstats FILE'. "
+        "To profile only some phases or parts, use the configcook:profile extension.",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        dest="timings",
+        default=False,
+        help="At the end, show a table with how long each phase, "
+        "entrypoint lookup and part took.",
+    )
+    parser.add_argument(
+        "--timings-json",
+        dest="timings_json",
+        metavar="FILE",
+        help="At the end, write how long each phase, entrypoint lookup and part took "
+        "to this json file.",
+    )
+    parser.add_argument(
+        "--trace",
+        dest="trace",
+        metavar="FILE",
+        help="Write a trace of the run to this file, in Chrome trace json format, "
+        "with the phases, parts and commands. "
+        "Open it in chrome://tracing or https://ui.perfetto.dev",
+    )
     parser.add_argument(
         "-v",
         "--verbose",
@@ -47,6 +130,17 @@ def parse_options():
         default=False,
         help="Verbose mode",
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        default=False,
+        help="Keep running: watch the config file and the files that it extends, "
+        "and run again when they change. "
+        "Only changed files are parsed again, "
+        "and only parts with changed options are run again. "
+        "Stop with Ctrl-C.",
+    )
     options = parser.parse_args()
     if not options.configfile:
         for configfile in CONFIGFILE_DEFAULTS:
@@ -56,6 +150,10 @@ def parse_options():
         if not options.configfile:
             parser.print_help()
             sys.exit(1)
+    if options.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    if options.use_async and sys.version_info < (3, 5):
+        parser.error("--async needs Python 3.5 or higher.")
     return options
 
 
@@ -68,9 +166,67 @@ def main():
     logging.basicConfig(level=loglevel, format="%(levelname)s: %(message)s")
     logger.debug("Only shown when --verbose is used.")
     logger.info("Hello, I will be your config cook today.")
+    record_timings = options.timings or options.timings_json or options.trace
+    if record_timings:
+        from . import timings
+
+        timings.start()
+    try:
+        _run(options)
+    finally:
+        if record_timings:
+            _report_timings(options)
+
+
+def _report_timings(options):
+    from . import timings
+
+    recorder = timings.stop()
+    if options.timings:
+        logger.info("Timings:")
+        for line in recorder.format_table():
+            logger.info("%s", line)
+    if options.timings_json:
+        recorder.save_json(options.timings_json)
+        logger.info("Wrote timings to %s", options.timings_json)
+    if options.trace:
+        recorder.save_trace(options.trace)
+        logger.info("Wrote trace to %s", options.trace)
+
+
+def _profile(cook, filename):
+    """Call the cook with cProfile, and write the pstats data to a file."""
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
     try:
-        cook = ConfigCook(options)
         cook()
+    finally:
+        profiler.disable()
+        profiler.dump_stats(filename)
+        logger.info(
+            "Wrote profile to %s. View it with: python -m pstats %s", filename, filename
+        )
+
+
+def _run(options):
+    try:
+        # Import this here, so 'configcook --help' stays fast.
+        from .main import ConfigCook
+
+        cook = ConfigCook(options)
+        if options.plan:
+            for line in cook.plan().format_lines():
+                print(line)
+        elif options.watch:
+            from .watch import watch
+
+            watch(cook)
+        elif options.profile:
+            _profile(cook, options.profile)
+        else:
+            cook()
     except Exception:
         exc_info = sys.exc_info()
         import pdb
@@ -1,83 +1,330 @@
 # -*- coding: utf-8 -*-
+from . import tomlparser
 from .exceptions import ConfigError
-from .utils import substitute
+from .substitution import Resolver
+from .utils import atomic_write
+from .utils import is_url
+from .utils import join_location
 from .utils import to_path
-from copy import deepcopy
+import hashlib
+import logging
 import os
-import toml
+import pickle
+import six
+
+
+logger = logging.getLogger(__name__)
+# Increase this when the format of the config cache changes.
+CACHE_VERSION = 1
+# Maximum number of files that we load at the same time.
+MAX_LOAD_WORKERS = 8
 
 
 class ConfigCookConfig(dict):
     """Configuration object for configcook.
 
     This is a wrapper around the standard Python dict class.
-    In the init, it deepcopies the config to self._raw.
-    Then we have an original, unchanged copy,
+    In the init, it keeps a shallow copy of the config in self._raw.
+    Then we have the original sections and values,
     without any enhancements or trickery.
+
+    We do not deepcopy anything: we get our own copy of each section,
+    so substitution and other changes of options do not end up in _raw.
+    The values themselves are shared with _raw, so you should
+    never change a value in-place: always set a new value.
     """
 
     def __init__(self, config):
-        super(ConfigCookConfig, self).__init__(config)
-        self._raw = deepcopy(config)
+        super(ConfigCookConfig, self).__init__(
+            (key, dict(value) if isinstance(value, dict) else value)
+            for key, value in config.items()
+        )
+        self._raw = dict(config)
 
     def substitute_all(self):
-        """Substitute/interpolate ${part:name} in all options."""
-        # First interpolate in configcook section?
-        # It might be tricky allow configcook to interpolate from other sections.
-        # if "configcook" in self:
-        #     self.substitute_section("configcook")
-        for key in self:
-            self.substitute_section(key)
+        """Substitute/interpolate ${part:name} in all options.
+
+        References are resolved in any order,
+        so ${a:x} pointing to ${b:y} pointing to ${c:z} always works.
+        """
+        Resolver(self).resolve_all()
 
     def substitute_section(self, section_name):
         """Substitute/interpolate ${part:name} in one section."""
-        changed = False
-        section = self[section_name]
-        for key, value in section.items():
-            new_value = substitute(self, value, current_part=section_name)
-            if new_value == value:
-                continue
-            section[key] = new_value
-            # TODO: do something with 'changed' value.
-            # I think my idea was to do this recursively, and then we can
-            # use this to know when we are done.
-            changed = True
-
-
-def parse_toml_config(path):
+        Resolver(self).resolve_section(section_name)
+
+
+def parse_toml_config(path, cache=False, offline=False, fetcher=None, documents=None):
     """Parse config with toml.
 
-    TODO: support 'extends = path1 path2'
-    TODO: support urls
+    See the tomlparser module for which toml library we use.
+
+    The config can extend other configs with 'extends = [path1, path2]'.
+    These can be paths or urls.  Relative paths are relative to the file
+    that extends them, also within a config that we got from a url.
+    We first load all files, level by level, loading all files of one level
+    at the same time.  Then we merge them.
+
+    With cache=True, we store the result in a cache file next to the config,
+    with information about all files in the extends chain.
+    When none of those files have changed, the next call loads the cache.
+    We do not do this when there are urls in the chain.
+
+    For urls we use a fetcher.  By default this is a Fetcher from
+    configcook.fetch, which has its own cache for urls.
+    With offline=True it only uses that cache.
+
+    When you parse the same config again, for example in watch mode,
+    you can pass a documents dictionary, which we fill and use:
+    location -> (hash, parsed document).
+    Files that have not changed since the previous call are not parsed again.
+    Afterwards, it has exactly the files and urls of this config.
+    The cache option is ignored then.
     """
-    path = to_path(path)
-    with open(path) as fp:
-        result = toml.load(fp)
-    cc = result.get("configcook")
-    if cc:
-        extends = cc.get("extends")
-        if extends:
-            if not isinstance(extends, list):
-                raise ValueError(
-                    "Option extends must be of type list. Got type: {0} ({1}).".format(
-                        type(extends), extends
+    if documents is not None:
+        cache = False
+    if not is_url(path):
+        path = to_path(path)
+        if cache:
+            result = _load_cached_config(path)
+            if result is not None:
+                return ConfigCookConfig(result)
+    files = []
+    loaded = _load_documents(
+        path, files, offline=offline, fetcher=fetcher, parsed=documents
+    )
+    if documents is not None:
+        # Forget files that are no longer in the extends chain.
+        for location in list(documents):
+            if location not in loaded:
+                del documents[location]
+    result = _merge_extends(path, loaded)
+    if cache and not is_url(path):
+        if any(is_url(info[0]) for info in files):
+            logger.debug("Not caching config %s, because it extends urls.", path)
+        else:
+            _save_cached_config(path, files, result)
+    return ConfigCookConfig(result)
+
+
+def _read_file(path):
+    """Read a file.
+
+    Returns the data, and information about the file:
+    a tuple of path, size, modification time and hash.
+    """
+    with open(path, "rb") as config_file:
+        data = config_file.read()
+    stat = os.stat(path)
+    digest = hashlib.sha256(data).hexdigest()
+    return data, (path, stat.st_size, stat.st_mtime, digest)
+
+
+def _load_document(location, files, fetcher=None, parsed=None):
+    """Load and parse one toml file or url.
+
+    Returns a dictionary.
+    Information about the file is added to the files list.
+    See parse_toml_config for the parsed dictionary.
+    """
+    if is_url(location):
+        data = fetcher.fetch(location)
+        info = (location, None, None, hashlib.sha256(data).hexdigest())
+    else:
+        data, info = _read_file(location)
+    files.append(info)
+    digest = info[3]
+    if parsed is not None:
+        previous = parsed.get(location)
+        if previous is not None and previous[0] == digest and previous[1] is not None:
+            logger.debug("Not parsing %s again: it has not changed.", location)
+            return previous[1]
+        # When parsing fails, we still know about the file.
+        parsed[location] = (digest, None)
+    document = tomlparser.loads(data.decode("utf-8"), location=location)
+    if parsed is not None:
+        parsed[location] = (digest, document)
+    return document
+
+
+def _get_extends(document, location):
+    """Get the locations of the files that a document extends."""
+    extends = document.get("configcook", {}).get("extends")
+    if not extends:
+        return []
+    if not isinstance(extends, list):
+        raise ValueError(
+            "Option extends must be of type list. Got type: {0} ({1}).".format(
+                type(extends), extends
+            )
+        )
+    return [join_location(location, extend) for extend in extends]
+
+
+def _get_cache_directory(locations, documents):
+    """Get the cache-directory option from the loaded documents, or None.
+
+    The first location that has the option wins, so the main config first.
+    We ignore values with substitutions: we cannot resolve them yet.
+    """
+    for location in locations:
+        value = documents[location].get("configcook", {}).get("cache-directory")
+        if isinstance(value, six.string_types) and "${" not in value:
+            return value
+    return None
+
+
+def _load_documents(location, files, offline=False, fetcher=None, parsed=None):
+    """Load a config file and all files that it extends.
+
+    Returns a dictionary of location and parsed document.
+    See parse_toml_config for the parsed dictionary.
+    We load the files level by level.  When there is more than one file
+    in a level, we load them at the same time in threads.
+    This helps especially for urls.
+
+    The default fetcher keeps its cache in the cache-directory option
+    of the files that we have loaded before the first url.
+    """
+    documents = {}
+    # The locations in the order in which we loaded them.
+    locations = []
+    level = [location]
+    executor = None
+    try:
+        while level:
+            if fetcher is None and any(is_url(item) for item in level):
+                from .fetch import Fetcher
+
+                cache_directory = _get_cache_directory(locations, documents)
+                if cache_directory is not None:
+                    cache_directory = os.path.join(to_path(cache_directory), "http")
+                fetcher = Fetcher(cache_directory=cache_directory, offline=offline)
+            if len(level) == 1:
+                results = [_load_document(level[0], files, fetcher, parsed)]
+            else:
+                if executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    executor = ThreadPoolExecutor(max_workers=MAX_LOAD_WORKERS)
+                results = list(
+                    executor.map(
+                        lambda item: _load_document(item, files, fetcher, parsed),
+                        level,
                     )
                 )
-            dirname = os.path.dirname(path)
-            # Build a new extends line that gets the correct order
-            # for nested extends.
-            new_extends = []
-            for extend in cc["extends"]:
-                new_extends.append(extend)
-                if not os.path.isabs(extend):
-                    extend = os.path.join(dirname, extend)
-                extra_result = parse_toml_config(extend)
-                new_extends.extend(
-                    extra_result.get("configcook", {}).get("extends", [])
-                )
-                result = _merge_dicts(result, extra_result)
-            result["configcook"]["extends"] = new_extends
-    return ConfigCookConfig(result)
+            next_level = []
+            for item, document in zip(level, results):
+                documents[item] = document
+                locations.append(item)
+            for item in level:
+                for extend in _get_extends(documents[item], item):
+                    if extend not in documents and extend not in next_level:
+                        next_level.append(extend)
+            level = next_level
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return documents
+
+
+def _merge_extends(location, documents, seen=()):
+    """Merge a loaded document with the documents that it extends.
+
+    The extended documents are merged recursively first.
+    """
+    if location in seen:
+        raise ConfigError(
+            "Circular extends: {0}".format(" -> ".join(seen + (location,)))
+        )
+    result = documents[location]
+    cc = result.get("configcook")
+    if not cc or not cc.get("extends"):
+        return result
+    # Build a new extends line that gets the correct order
+    # for nested extends.
+    new_extends = []
+    for extend in cc["extends"]:
+        new_extends.append(extend)
+        extra_result = _merge_extends(
+            join_location(location, extend), documents, seen + (location,)
+        )
+        new_extends.extend(extra_result.get("configcook", {}).get("extends", []))
+        result = _merge_dicts(result, extra_result)
+    # Do not change the loaded document.
+    result = dict(result)
+    result["configcook"] = dict(result["configcook"])
+    result["configcook"]["extends"] = new_extends
+    return result
+
+
+def _cache_path(path):
+    """Get the path of the cache file for a config file."""
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, ".{0}.cache".format(basename))
+
+
+def _file_unchanged(path, size, mtime, digest):
+    """Check if a file has not changed since we cached it."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    if stat.st_size != size:
+        return False
+    if stat.st_mtime == mtime:
+        # Fast path: we do not need to read the file.
+        return True
+    # Maybe only the modification time has changed.
+    with open(path, "rb") as config_file:
+        return hashlib.sha256(config_file.read()).hexdigest() == digest
+
+
+def _load_cached_config(path):
+    """Load a parsed config from the cache.
+
+    Returns None when there is no usable cache.
+    """
+    cache_path = _cache_path(path)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "rb") as cache_file:
+            data = pickle.load(cache_file)
+        if data["version"] != CACHE_VERSION:
+            return None
+        files = data["files"]
+        result = data["config"]
+    except Exception as exc:
+        # A cache file from a different Python, or a corrupt file.
+        logger.debug("Ignoring config cache %s: %s", cache_path, exc)
+        return None
+    for info in files:
+        if not _file_unchanged(*info):
+            logger.debug("Config cache %s is outdated: %s changed.", cache_path, info[0])
+            return None
+    logger.debug("Loaded config from cache %s.", cache_path)
+    return result
+
+
+def _save_cached_config(path, files, result):
+    """Save a parsed config in the cache.
+
+    Failing to write the cache is not an error.
+    """
+    cache_path = _cache_path(path)
+    data = {"version": CACHE_VERSION, "files": files, "config": result}
+    try:
+        text = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    except Exception as exc:
+        logger.debug("Cannot cache config %s: %s", path, exc)
+        return
+    try:
+        atomic_write(cache_path, text, binary=True)
+    except (IOError, OSError) as exc:
+        logger.debug("Cannot write config cache %s: %s", cache_path, exc)
+        return
+    logger.debug("Wrote config cache %s.", cache_path)
 
 
 def _merge_dicts(orig, new):
@@ -120,8 +367,12 @@ def _merge_dicts(orig, new):
 
     As long as the two values have the same type, this seems safe.
 
+    We never change orig or new in-place, but we do not deepcopy either:
+    only the dictionaries that get changed are copied,
+    and the result shares all other values with orig and new.
+    So merging costs time for the keys in new, not for the size of orig.
     """
-    result = deepcopy(orig)
+    result = dict(orig)
     for key, new_value in new.items():
         if key.endswith("+"):
             # key += value
@@ -143,7 +394,8 @@ def _merge_dicts(orig, new):
                             key, type(result[key]), type(new_value)
                         )
                     )
-                result[key] += new_value
+                # Note: not +=, because that would change a list in-place.
+                result[key] = result[key] + new_value
             else:
                 result[key] = new_value
     return result
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+from .exceptions import ConfigError
+from .substitution import compile_file_template
+from .substitution import compile_template
+from .utils import buffered_logs
+from .utils import to_path
+import logging
+import six
+
+
+logger = logging.getLogger(__name__)
+
+
+def find_references(value, current_part=""):
+    """Find the ${part:option} references in a value.
+
+    Returns a list of (part, option) tuples.
+    ${:option} points to the current part.
+    """
+    if not isinstance(value, six.string_types):
+        return []
+    return compile_template(value).get_references(current_part=current_part)
+
+
+def find_file_references(config, name):
+    """Find the ${part:option} references in the template file of a part.
+
+    This is the file in the input-file option, as used by the template recipe.
+    Returns a list of (part, option) tuples.
+    When the file cannot be read, we return an empty list:
+    the recipe reports this when it runs.
+    """
+    path = config.get(name, {}).get("input-file")
+    if not isinstance(path, six.string_types) or "${" in path:
+        return []
+    try:
+        template = compile_file_template(to_path(path))
+    except (IOError, OSError, ValueError) as exc:
+        logger.debug("Cannot read input-file of part %s: %s", name, exc)
+        return []
+    return template.get_references(current_part=name)
+
+
+def find_part_dependencies(config, part_names):
+    """Find the dependencies between parts.
+
+    Returns a dictionary with the part name as key,
+    and the set of part names it depends on as value.
+
+    A part depends on another part when one of its options refers to
+    an option of that other part with ${part:option}, either directly
+    or via options in sections that are not parts.
+    We look in the raw config for this, because after substitution
+    the references are gone.  We also look in the template file
+    of the input-file option, see find_file_references.
+
+    A part can also explicitly list the parts it depends on
+    in its 'depends' option.
+    """
+    raw = getattr(config, "_raw", config)
+    parts = set(part_names)
+    dependencies = {}
+    for name in part_names:
+        found = set()
+        # Walk all references, starting with those of the part itself.
+        todo = find_file_references(config, name)
+        for value in raw.get(name, {}).values():
+            todo.extend(find_references(value, current_part=name))
+        seen = set()
+        while todo:
+            reference = todo.pop()
+            if reference in seen:
+                continue
+            seen.add(reference)
+            part, option = reference
+            if part != name and part in parts:
+                # The other part takes care of its own dependencies.
+                found.add(part)
+                continue
+            value = raw.get(part, {}).get(option)
+            todo.extend(find_references(value, current_part=part))
+        depends = config[name].get("depends", [])
+        if isinstance(depends, six.string_types):
+            depends = depends.split()
+        if not isinstance(depends, list):
+            raise ConfigError(
+                "depends option in part {0} must be a list or string, "
+                "found a {1} ({2!r}).".format(name, type(depends), depends)
+            )
+        for part in depends:
+            if part not in parts:
+                raise ConfigError(
+                    "Part {0} depends on {1}, but this is missing from "
+                    "the [configcook] parts option.".format(name, part)
+                )
+            if part != name:
+                found.add(part)
+        if found:
+            logger.debug("Part %s depends on: %s", name, ", ".join(sorted(found)))
+        dependencies[name] = found
+    return dependencies
+
+
+def _find_cycle(part_names, dependencies):
+    """Find a dependency cycle between these parts.
+
+    Returns a list of part names, where the last one depends on the first.
+    """
+    for start in part_names:
+        path = [start]
+        while True:
+            candidates = [dep for dep in dependencies[path[-1]] if dep in part_names]
+            if not candidates:
+                break
+            dep = sorted(candidates)[0]
+            if dep in path:
+                return path[path.index(dep) :]
+            path.append(dep)
+    return []
+
+
+def sort_parts(part_names, dependencies):
+    """Sort parts so that each part comes after the parts it depends on.
+
+    The sort is stable: when there are no dependencies,
+    we keep the order of the parts option.
+
+    Raises a ConfigError when there is a dependency cycle.
+    """
+    result = []
+    done = set()
+    pending = list(part_names)
+    while pending:
+        for name in pending:
+            if dependencies[name] <= done:
+                break
+        else:
+            cycle = _find_cycle(pending, dependencies)
+            raise ConfigError(
+                "Dependency cycle between parts: {0}.".format(
+                    " -> ".join(cycle + cycle[:1])
+                )
+            )
+        pending.remove(name)
+        done.add(name)
+        result.append(name)
+    return result
+
+
+def part_levels(part_names, dependencies):
+    """Group parts in levels.
+
+    Parts in the first level do not depend on other parts.
+    Parts in the next levels only depend on parts in earlier levels,
+    so all parts of one level could run at the same time.
+    Returns a list of lists of part names.
+    """
+    levels = []
+    level_of = {}
+    for name in sort_parts(part_names, dependencies):
+        level = max([level_of[dep] + 1 for dep in dependencies[name]] or [0])
+        level_of[name] = level
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(name)
+    return levels
+
+
+def run_parts(part_names, dependencies, function, jobs=1):
+    """Call function(part_name) for all parts, respecting dependencies.
+
+    With jobs=1 we run the parts one after another.
+    Otherwise we run at most 'jobs' parts at the same time.
+    A part is started when all parts it depends on have finished.
+
+    In parallel mode, the log messages of each part are collected,
+    and shown per part, in the same order as when running serially.
+    When a part fails, we do not start new parts, wait for the
+    running parts to finish, and raise the error.
+    """
+    ordered = sort_parts(part_names, dependencies)
+    if jobs <= 1 or len(ordered) <= 1:
+        for name in ordered:
+            function(name)
+        return
+
+    from concurrent.futures import FIRST_COMPLETED
+    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import wait
+
+    logger.debug("Running %d parts with %d jobs.", len(ordered), jobs)
+    pending = list(ordered)
+    running = {}
+    done = set()
+    errors = {}
+    with buffered_logs() as logs:
+        flushed = 0
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while running or (pending and not errors):
+                if not errors:
+                    for name in list(pending):
+                        if len(running) >= jobs:
+                            break
+                        if dependencies[name] <= done:
+                            pending.remove(name)
+                            future = executor.submit(logs.call, name, function, name)
+                            running[future] = name
+                finished, _not_done = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    done.add(name)
+                    error = future.exception()
+                    if error is not None:
+                        errors[name] = error
+                # Show the logs of finished parts, in the original order.
+                while flushed < len(ordered) and ordered[flushed] in done:
+                    logs.flush(ordered[flushed])
+                    flushed += 1
+        # When there were errors, some parts may not have been flushed yet.
+        for name in ordered[flushed:]:
+            if name in done:
+                logs.flush(name)
+    raise_part_errors(ordered, errors, pending)
+
+
+def raise_part_errors(ordered, errors, not_started):
+    """Report the parts that failed when running in parallel.
+
+    errors is a dictionary of part name and exception.
+    We log an error for each failed part, because several parts may fail
+    at the same time, and then raise the error of the first one.
+    """
+    failed = [name for name in ordered if name in errors]
+    if not failed:
+        return
+    for name in failed:
+        error = errors[name]
+        logger.error("Part %s failed: %s: %s", name, type(error).__name__, error)
+    if not_started:
+        logger.error("Parts not started: %s", ", ".join(not_started))
+    raise errors[failed[0]]
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
+from .utils import atomic_write
 from .utils import entrypoint_function
-from .utils import set_defaults
+from .utils import OptionsValidator
+from .utils import to_list
+import hashlib
+import importlib
+import json
 import logging
+import os
+import re
+import sys
 
 
 logger = logging.getLogger(__name__)
@@ -23,21 +31,311 @@ class Entrypoint(object):
         self.options = options
         self.parse_options()
 
+    @classmethod
+    def get_validator(cls):
+        """Get the validator for our defaults.
+
+        This is created once per class, and again when the class
+        gets a different defaults dictionary.
+        Do not change the defaults dictionary in-place.
+        """
+        validator = cls.__dict__.get("_validator")
+        if validator is None or validator.defaults is not cls.defaults:
+            validator = OptionsValidator(cls.defaults)
+            cls._validator = validator
+        return validator
+
     def parse_options(self):
         """Do special handling on options if needed.
         """
-        if not self.defaults:
-            pass
-        set_defaults(self.defaults, self.options)
+        self.get_validator().validate(self.options)
 
     @property
     @entrypoint_function
     def packages(self):
-        # Look for option 'packages' with fallback to 'eggs'.
-        for opt in ("packages", "eggs"):
-            if opt in self.options:
-                value = self.options[opt]
-                if isinstance(value, (list, tuple)):
-                    return value
-                return value.split()
-        return []
+        return packages_from_options(self.options)
+
+
+def packages_from_options(options):
+    """Get the packages that an extension or recipe wants to install.
+
+    Look for option 'packages' with fallback to 'eggs'.
+    """
+    for opt in ("packages", "eggs"):
+        if opt in options:
+            return to_list(options[opt])
+    return []
+
+
+def normalize_name(name):
+    """Normalize a distribution name, as PEP 503 does."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class IndexedEntrypoint(object):
+    """An entrypoint, as found by EntrypointIndex.
+
+    This has the attributes and methods of a pkg_resources.EntryPoint
+    that we need, plus the name and version of the distribution.
+    """
+
+    def __init__(self, group, name, value, dist_name="", dist_version=""):
+        self.group = group
+        self.name = name
+        self.value = value
+        self.dist_name = dist_name
+        self.dist_version = dist_version
+
+    def __repr__(self):
+        return "<IndexedEntrypoint {0} = {1} ({2})>".format(
+            self.name, self.value, self.dist_name
+        )
+
+    def load(self):
+        """Import the object that the entrypoint points to."""
+        # The value looks like 'package.module:Class.attribute [extra1,extra2]'.
+        value = self.value.split("[")[0]
+        module_name, _colon, attrs = value.partition(":")
+        result = importlib.import_module(module_name.strip())
+        for attr in attrs.strip().split("."):
+            if attr:
+                result = getattr(result, attr)
+        return result
+
+
+def _parse_entry_points(lines):
+    """Parse the lines of an entry_points.txt file.
+
+    Returns a dictionary of groups with a dictionary of name and value.
+    """
+    result = {}
+    group = None
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            group = result.setdefault(line[1:-1].strip(), {})
+            continue
+        if group is None or "=" not in line:
+            continue
+        name, value = line.split("=", 1)
+        group.setdefault(name.strip(), value.strip())
+    return result
+
+
+def _parse_entry_points_txt(path):
+    """Parse an entry_points.txt file.  See _parse_entry_points."""
+    with open(path) as ep_file:
+        return _parse_entry_points(ep_file)
+
+
+def _read_egg(path):
+    """Read the entrypoints of an egg that is in sys.path itself.
+
+    This is how Buildout and easy_install install packages:
+    a directory or zip file 'name-version-py3.7.egg' with an EGG-INFO directory.
+    Returns a dictionary like _parse_entry_points, or None for a zip file
+    without entrypoints.
+    """
+    if os.path.isdir(path):
+        ep_path = os.path.join(path, "EGG-INFO", "entry_points.txt")
+        if not os.path.isfile(ep_path):
+            return None
+        return _parse_entry_points_txt(ep_path)
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(path) as egg:
+            data = egg.read("EGG-INFO/entry_points.txt")
+    except (IOError, OSError, KeyError, zipfile.BadZipfile):
+        return None
+    return _parse_entry_points(data.decode("utf-8").splitlines())
+
+
+def _read_version(path):
+    """Read the version from a METADATA or PKG-INFO file."""
+    if not os.path.isfile(path):
+        return ""
+    with open(path) as metadata_file:
+        for line in metadata_file:
+            if line.startswith("Version:"):
+                return line.split(":", 1)[1].strip()
+            if not line.strip():
+                # End of the headers.
+                break
+    return ""
+
+
+class EntrypointIndex(object):
+    """Index of entrypoints and distributions in sys.path.
+
+    Iterating over all entrypoints with pkg_resources for every
+    extension and recipe is slow, and importing pkg_resources is slow too.
+    So we scan the *.dist-info and *.egg-info directories in sys.path once,
+    plus the *.egg directories and zip files that are in sys.path themselves,
+    and keep the entrypoints in a dictionary: group -> name -> entrypoint.
+
+    When you pass a cache_file, we store the index in this file,
+    together with the modification times of the sys.path entries.
+    When those have not changed, the next run loads the index from there.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        # group -> name -> IndexedEntrypoint
+        self.entrypoints = None
+        # normalized distribution name -> version
+        self.distributions = None
+        # Did we load the index from the cache file?
+        self.from_cache = False
+
+    def _cache_key(self):
+        entries = []
+        for entry in sys.path:
+            try:
+                mtime = os.stat(entry or os.curdir).st_mtime
+            except OSError:
+                mtime = None
+            entries.append((os.path.abspath(entry), mtime))
+        text = json.dumps([sys.executable, entries])
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _load_cache(self, key):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file) as cache:
+                data = json.load(cache)
+            if data["key"] != key:
+                logger.debug("Entrypoint cache %s is outdated.", self.cache_file)
+                return False
+            entrypoints = {}
+            for group, names in data["entrypoints"].items():
+                entrypoints[group] = dict(
+                    (name, IndexedEntrypoint(group, name, *info))
+                    for name, info in names.items()
+                )
+            distributions = data["distributions"]
+        except (ValueError, KeyError, TypeError):
+            logger.debug("Ignoring invalid entrypoint cache %s.", self.cache_file)
+            return False
+        self.entrypoints = entrypoints
+        self.distributions = distributions
+        return True
+
+    def _save_cache(self, key):
+        if not self.cache_file:
+            return
+        data = {"key": key, "distributions": self.distributions, "entrypoints": {}}
+        for group, names in self.entrypoints.items():
+            data["entrypoints"][group] = dict(
+                (name, [ep.value, ep.dist_name, ep.dist_version])
+                for name, ep in names.items()
+            )
+        try:
+            cache_dir = os.path.dirname(self.cache_file)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            atomic_write(self.cache_file, json.dumps(data))
+        except (IOError, OSError) as exc:
+            logger.debug("Could not write entrypoint cache %s: %s", self.cache_file, exc)
+
+    def _scan(self):
+        """Scan sys.path for distributions and their entrypoints."""
+        entrypoints = {}
+        distributions = {}
+
+        def add(dist_name, version, groups):
+            for group, names in groups.items():
+                group_index = entrypoints.setdefault(group, {})
+                for name, value in names.items():
+                    if name in group_index:
+                        continue
+                    group_index[name] = IndexedEntrypoint(
+                        group, name, value, dist_name, version
+                    )
+
+        for entry in sys.path:
+            entry = entry or os.curdir
+            if entry.endswith(".egg") and os.path.exists(entry):
+                # 'name-version-py3.7.egg', a directory or zip file.
+                parts = os.path.basename(entry)[: -len(".egg")].split("-")
+                dist_name = normalize_name(parts[0])
+                if dist_name in distributions:
+                    continue
+                version = parts[1] if len(parts) > 1 else ""
+                distributions[dist_name] = version
+                groups = _read_egg(entry)
+                if groups:
+                    add(dist_name, version, groups)
+                continue
+            if not os.path.isdir(entry):
+                # For example a zip file.
+                continue
+            try:
+                dir_names = sorted(os.listdir(entry))
+            except OSError:
+                continue
+            for dir_name in dir_names:
+                if dir_name.endswith(".dist-info"):
+                    metadata_name = "METADATA"
+                elif dir_name.endswith(".egg-info"):
+                    metadata_name = "PKG-INFO"
+                else:
+                    continue
+                path = os.path.join(entry, dir_name)
+                if not os.path.isdir(path):
+                    continue
+                # 'name-version.dist-info' or 'name-version-py3.7.egg-info'
+                # or, for development eggs, 'name.egg-info'.
+                parts = dir_name.rsplit(".", 1)[0].split("-")
+                dist_name = normalize_name(parts[0])
+                if dist_name in distributions:
+                    # The first one in sys.path wins.
+                    continue
+                if len(parts) > 1:
+                    version = parts[1]
+                else:
+                    version = _read_version(os.path.join(path, metadata_name))
+                distributions[dist_name] = version
+                ep_path = os.path.join(path, "entry_points.txt")
+                if not os.path.isfile(ep_path):
+                    continue
+                add(dist_name, version, _parse_entry_points_txt(ep_path))
+        self.entrypoints = entrypoints
+        self.distributions = distributions
+
+    def build(self):
+        """Build the index, from the cache file if possible."""
+        key = self._cache_key()
+        if self._load_cache(key):
+            logger.debug("Loaded entrypoint index from %s.", self.cache_file)
+            self.from_cache = True
+            return
+        self.refresh(key=key)
+
+    def refresh(self, key=None):
+        """Scan sys.path again, for example after installing packages."""
+        logger.debug("Scanning sys.path for entrypoints.")
+        self._scan()
+        self.from_cache = False
+        self._save_cache(key or self._cache_key())
+
+    def get(self, group, name):
+        """Get an entrypoint or None."""
+        if self.entrypoints is None:
+            self.build()
+        entrypoint = self.entrypoints.get(group, {}).get(name)
+        if entrypoint is None and self.from_cache:
+            # The cache may be outdated, for example when the
+            # entry_points.txt of a development egg has changed.
+            self.refresh()
+            entrypoint = self.entrypoints.get(group, {}).get(name)
+        return entrypoint
+
+    def get_distribution_version(self, name):
+        """Get the version of an installed distribution, or None."""
+        if self.distributions is None:
+            self.build()
+        return self.distributions.get(normalize_name(name))
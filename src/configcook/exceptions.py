@@ -20,3 +20,8 @@ class ConfigError(ConfigCookError):
 class LogicError(ConfigCookError):
     """Error in logic/programming.
     """
+
+
+class CommandTimeoutError(ConfigCookError):
+    """A command took longer than its timeout.
+    """
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 from .entrypoints import Entrypoint
+from .utils import to_path
 import logging
+import os
 import pdb
+import threading
 
 
 logger = logging.getLogger(__name__)
@@ -9,6 +12,11 @@ logger = logging.getLogger(__name__)
 
 class BaseExtension(Entrypoint):
     """Base configcook extension.
+
+    An extension can have run_before and run_after hooks.
+    By default they are called for all functions.
+    Define a subscriptions method to choose the functions,
+    see configcook.utils.HookTable.
     """
 
     is_extension = True
@@ -34,13 +42,18 @@ class PDBExtension(BaseExtension):
     def __call__(self):
         pdb.set_trace()
 
+    def subscriptions(self):
+        """Only call our hooks for the functions in the options."""
+        return {
+            "run_before": self.options["before"],
+            "run_after": self.options["after"],
+        }
+
     def run_before(self, function_name, instance, *args, **kwargs):
         """A hook that is run before a function in configcook.
 
         instance is the configcook object.
         """
-        if function_name not in self.options["before"]:
-            return
         logger.info(
             "Entered PDB before calling configcook function %s "
             "with args %r and keyword args %r.",
@@ -55,8 +68,6 @@ class PDBExtension(BaseExtension):
 
         instance is the configcook object.
         """
-        if function_name not in self.options["after"]:
-            return
         logger.info(
             "Entered PDB after calling configcook function %s "
             "with args %r and keyword args %r.",
@@ -65,3 +76,107 @@ class PDBExtension(BaseExtension):
             kwargs,
         )
         pdb.set_trace()
+
+
+class ProfileExtension(BaseExtension):
+    """configcook extension that profiles functions or parts with cProfile.
+
+    Options:
+
+    - functions: names of configcook functions to profile,
+      like load_recipes or run_recipes.
+    - parts: names of parts to profile.
+    - directory: directory for the profile files.
+
+    For each function or part we write a file with pstats data,
+    like load_recipes.pstats or part-name.pstats.
+    View them with 'python -m pstats filename', or a tool like snakeviz.
+    cProfile only sees the thread in which it is started.
+    For a part that is the thread that runs the part,
+    except with --async, where it is the thread of the event loop.
+    """
+
+    defaults = {
+        "directory": {"default": "profiles", "parser": to_path},
+        "functions": {"default": [], "type": list},
+        "parts": {"default": [], "type": list},
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(ProfileExtension, self).__init__(*args, **kwargs)
+        # (function name, part name or None) -> cProfile.Profile
+        self.profilers = {}
+        self._lock = threading.Lock()
+
+    def subscriptions(self):
+        """Only call our hooks for the functions and parts in the options."""
+        function_names = list(self.options["functions"])
+        if self.options["parts"]:
+            function_names.append("run_part")
+        return {"run_before": function_names, "run_after": function_names}
+
+    def _get_key(self, function_name, args):
+        if function_name == "run_part":
+            part_name = args[0]
+            if part_name in self.options["parts"]:
+                return function_name, part_name
+            return None
+        if function_name in self.options["functions"]:
+            return function_name, None
+        return None
+
+    def _get_filename(self, key):
+        function_name, part_name = key
+        if part_name is None:
+            filename = "{0}.pstats".format(function_name)
+        else:
+            filename = "part-{0}.pstats".format(part_name)
+        return os.path.join(self.options["directory"], filename)
+
+    def run_before(self, function_name, instance, *args, **kwargs):
+        """Start profiling, if this function or part is selected."""
+        key = self._get_key(function_name, args)
+        if key is None:
+            return
+        import cProfile
+        import sys
+
+        if sys.getprofile() is not None:
+            # Another profiler is active, for example from --profile.
+            # Starting ours would stop the other one.
+            logger.warning(
+                "Not profiling for %s: another profiler is active.",
+                self._get_filename(key),
+            )
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as exc:
+            # Python 3.12+ refuses when another profiler is active.
+            logger.warning("Not profiling for %s: %s", self._get_filename(key), exc)
+            return
+        with self._lock:
+            self.profilers[key] = profiler
+
+    def run_after(self, function_name, instance, *args, **kwargs):
+        """Stop profiling and write the profile file."""
+        key = self._get_key(function_name, args)
+        if key is None:
+            return
+        with self._lock:
+            profiler = self.profilers.pop(key, None)
+        if profiler is None:
+            return
+        profiler.disable()
+        filename = self._get_filename(key)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Maybe another thread created it.
+                if not os.path.isdir(directory):
+                    raise
+        profiler.dump_stats(filename)
+        logger.info("Wrote profile to %s", filename)
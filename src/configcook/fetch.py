@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+from .exceptions import ConfigError
+from .utils import atomic_write
+from .utils import DEFAULT_CACHE_DIRECTORY
+from six.moves import http_client
+from six.moves.urllib.parse import urljoin
+from six.moves.urllib.parse import urlsplit
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+# Maximum number of redirects that we follow.
+MAX_REDIRECTS = 5
+
+
+class Fetcher(object):
+    """Fetch files from urls, with a cache on disk.
+
+    We keep the contents of each url in the cache directory,
+    with its ETag and Last-Modified headers.
+    The next time, we ask the server if the file has changed,
+    and use the cached contents when it has not.
+    In offline mode we only use the cache.
+
+    Connections to the same server are reused.
+    Connections cannot be shared between threads,
+    so each thread has its own connections.
+    """
+
+    def __init__(self, cache_directory=None, offline=False, timeout=30):
+        if cache_directory is None:
+            cache_directory = os.path.join(
+                os.path.expanduser(DEFAULT_CACHE_DIRECTORY), "http"
+            )
+        self.cache_directory = cache_directory
+        self.offline = offline
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _cache_paths(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_directory, digest)
+        return base + ".json", base + ".data"
+
+    def _read_cache(self, url):
+        """Read cached headers and contents, or (None, None)."""
+        info_path, data_path = self._cache_paths(url)
+        try:
+            with open(info_path) as info_file:
+                info = json.load(info_file)
+            with open(data_path, "rb") as data_file:
+                data = data_file.read()
+        except (IOError, OSError, ValueError):
+            return None, None
+        if info.get("url") != url:
+            return None, None
+        return info, data
+
+    def _write_cache(self, url, headers, data):
+        info_path, data_path = self._cache_paths(url)
+        info = {"url": url}
+        for header in ("ETag", "Last-Modified"):
+            value = headers.get(header.lower())
+            if value:
+                info[header] = value
+        try:
+            if not os.path.isdir(self.cache_directory):
+                os.makedirs(self.cache_directory)
+            # Write the data first: the info file is only valid with data.
+            atomic_write(data_path, data, binary=True)
+            atomic_write(info_path, json.dumps(info))
+        except (IOError, OSError) as exc:
+            logger.warning("Could not write cache for %s: %s", url, exc)
+
+    def _get_connection(self, scheme, netloc):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        if key not in connections:
+            if scheme == "https":
+                connection_class = http_client.HTTPSConnection
+            elif scheme == "http":
+                connection_class = http_client.HTTPConnection
+            else:
+                raise ConfigError("Unsupported url scheme: {0}".format(scheme))
+            connections[key] = connection_class(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def _drop_connection(self, scheme, netloc):
+        connection = self._local.connections.pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+
+    def _request(self, url, headers):
+        """Do a GET request, reusing a connection if possible.
+
+        Returns status, response headers and body.
+        """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        for attempt in (1, 2):
+            connection = self._get_connection(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http_client.HTTPException, IOError, OSError):
+                # The server may have closed a connection that we reused.
+                self._drop_connection(parts.scheme, parts.netloc)
+                if attempt == 2:
+                    raise
+                continue
+            if response.getheader("Connection", "").lower() == "close":
+                self._drop_connection(parts.scheme, parts.netloc)
+            # Header names are case insensitive.
+            response_headers = dict(
+                (name.lower(), value) for name, value in response.getheaders()
+            )
+            return response.status, response_headers, body
+
+    def fetch(self, url):
+        """Get the contents of a url as bytes."""
+        if url.startswith("file://"):
+            with open(urlsplit(url).path, "rb") as local_file:
+                return local_file.read()
+        info, data = self._read_cache(url)
+        if self.offline:
+            if data is None:
+                raise ConfigError(
+                    "Offline mode, and {0} is not in the cache.".format(url)
+                )
+            logger.debug("Offline mode: using cached %s.", url)
+            return data
+        headers = {}
+        if data is not None:
+            if "ETag" in info:
+                headers["If-None-Match"] = info["ETag"]
+            if "Last-Modified" in info:
+                headers["If-Modified-Since"] = info["Last-Modified"]
+        location = url
+        for _redirect in range(MAX_REDIRECTS + 1):
+            logger.debug("Fetching %s", location)
+            try:
+                status, response_headers, body = self._request(location, headers)
+            except (http_client.HTTPException, IOError, OSError) as exc:
+                if data is None:
+                    raise ConfigError("Could not fetch {0}: {1}".format(url, exc))
+                logger.warning("Could not fetch %s, using cached version: %s", url, exc)
+                return data
+            if status in (301, 302, 303, 307, 308):
+                location = urljoin(location, response_headers.get("location", ""))
+                continue
+            break
+        else:
+            raise ConfigError("Too many redirects for {0}.".format(url))
+        if status == 304 and data is not None:
+            logger.debug("Not modified, using cached %s.", url)
+            return data
+        if status != 200:
+            raise ConfigError("Could not fetch {0}: HTTP status {1}.".format(url, status))
+        self._write_cache(url, response_headers, body)
+        return body
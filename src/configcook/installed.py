@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+from .utils import atomic_write
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+def part_signature(recipe_name, recipe_version, options):
+    """Get a signature for a part.
+
+    This is a hash of the recipe name and version,
+    and of the options of the part, after substitution and defaults.
+    When the signature changes, the part needs to be installed again.
+    """
+    data = {"recipe": recipe_name, "version": recipe_version, "options": options}
+    # Options may contain values that json does not know, like dates.
+    text = json.dumps(data, sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class InstalledState(object):
+    """Information about installed parts.
+
+    This is similar to the .installed.cfg file of Buildout.
+    We store it in a json file, which we write after each installed part.
+
+    For each part we store:
+
+    - signature: see part_signature
+    - recipe: the recipe name
+    - version: the version of the package that has the recipe
+
+    We also store how long the last install and update of each part took,
+    so we can estimate how long a next run takes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.parts = {}
+        # part name -> {"install": seconds, "update": seconds}
+        self.durations = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.debug("Installed state file %s does not exist yet.", self.path)
+            return
+        try:
+            with open(self.path) as state_file:
+                data = json.load(state_file)
+            parts = data["parts"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(
+                "Ignoring invalid installed state file %s. All parts will be installed.",
+                self.path,
+            )
+            return
+        self.parts = parts
+        durations = data.get("durations")
+        if isinstance(durations, dict):
+            self.durations = durations
+        logger.debug("Loaded installed state of parts: %s", ", ".join(sorted(parts)))
+
+    def save(self):
+        data = {"parts": self.parts}
+        if self.durations:
+            data["durations"] = self.durations
+        text = json.dumps(data, indent=2, sort_keys=True)
+        atomic_write(self.path, text + "\n")
+
+    def is_installed(self, name, signature):
+        """Is this part installed with exactly this signature?"""
+        info = self.parts.get(name)
+        if not info:
+            return False
+        return info.get("signature") == signature
+
+    def set(self, name, signature, recipe_name="", recipe_version=""):
+        """Mark a part as installed and save the state.
+        """
+        with self._lock:
+            self.parts[name] = {
+                "signature": signature,
+                "recipe": recipe_name,
+                "version": recipe_version,
+            }
+            self.save()
+
+    def set_duration(self, name, action, duration):
+        """Remember how long an install or update of a part took.
+
+        action is "install" or "update".
+        This is saved the next time that the state is saved.
+        """
+        with self._lock:
+            self.durations.setdefault(name, {})[action] = duration
+
+    def get_duration(self, name, action):
+        """Get how long the last install or update of a part took, or None."""
+        return self.durations.get(name, {}).get(action)
+
+    def remove(self, *names):
+        """Mark parts as not installed and save the state.
+
+        We keep the durations: a failed install is usually tried again,
+        and then the estimate is still useful.
+        """
+        with self._lock:
+            changed = False
+            for name in names:
+                if name in self.parts:
+                    del self.parts[name]
+                    changed = True
+            if changed:
+                self.save()
+
+    def forget(self, *names):
+        """Remove everything about parts, also the durations, and save the state.
+
+        Use this for parts that are no longer in the parts list.
+        """
+        with self._lock:
+            changed = False
+            for name in names:
+                if name in self.parts:
+                    del self.parts[name]
+                    changed = True
+                if name in self.durations:
+                    del self.durations[name]
+                    changed = True
+            if changed:
+                self.save()
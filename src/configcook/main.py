@@ -1,18 +1,35 @@
 # -*- coding: utf-8 -*-
+from . import timings
 from .config import parse_toml_config
+from .dependencies import find_part_dependencies
+from .dependencies import run_parts
+from .dependencies import sort_parts
+from .entrypoints import EntrypointIndex
+from .entrypoints import packages_from_options
 from .exceptions import ConfigCookError
 from .exceptions import ConfigError
 from .exceptions import LogicError
+from .installed import InstalledState
+from .installed import part_signature
 from .utils import call_extensions
+from .utils import call_hooks
 from .utils import call_or_fail
+from .utils import DEFAULT_CACHE_DIRECTORY
 from .utils import format_command_for_print
+from .utils import HookTable
+from .utils import is_awaitable
+from .utils import is_url
+from .utils import requirement_is_satisfied
 from .utils import set_defaults
+from .utils import start_hooks
 from .utils import to_path
 from copy import deepcopy
+import hashlib
+import importlib
 import logging
 import os
-import pkg_resources
 import sys
+import time
 
 
 logger = logging.getLogger(__name__)
@@ -26,13 +43,15 @@ DEFAULTS = {
     # 'allow-picked-versions': 'true',
     # 'allow-unknown-extras': 'false',
     "bin-directory": {"default": "bin", "parser": to_path},
+    "cache-directory": {"default": DEFAULT_CACHE_DIRECTORY, "parser": to_path},
     # 'develop-eggs-directory': 'develop-eggs',
     # 'eggs-directory': 'eggs',
+    "entrypoint-cache": {"default": False, "type": bool},
     # 'executable': sys.executable,
     "extends": {"default": [], "type": list},
     # 'find-links': '',
     # 'install-from-cache': 'false',
-    # 'installed': '.installed.cfg',
+    "installed": {"default": ".installed.json", "parser": to_path},
     # 'log-format': '',
     # 'log-level': 'INFO',
     # 'newest': 'true',
@@ -48,21 +67,45 @@ DEFAULTS = {
 
 
 class ConfigCook(object):
-    def __init__(self, options):
+    def __init__(self, options, documents=None):
         self.options = options
+        # Parsed config files, see parse_toml_config.
+        self.documents = documents
+        # Call update for parts that are installed with the same options.
+        # When False, we skip those parts.
+        self.update_unchanged = True
         self.extensions = []
+        # Which extension hooks to call for which function.
+        self.hooks = HookTable()
         self.recipes = []
         self.config = None
+        self.installed = None
+        self._entrypoint_index = None
         self._extension_names = []
         self._part_names = []
+        self._part_dependencies = {}
+        self._recipe_versions = {}
+        # Packages that we have passed to pip install during this run.
+        self._handled_packages = set()
         logger.debug("Initialized ConfigCook.")
 
     def __call__(self):
         logger.debug("Calling ConfigCook.")
 
-        self._read_config()
-        self._load_extensions()
-        self._install_packages_from_extensions()
+        # These are not wrapped with @call_extensions,
+        # because most of them run before the extensions are loaded.
+        with timings.measure("phase", "read_config"):
+            self._read_config()
+        with timings.measure("phase", "install_planned_packages"):
+            self._install_planned_packages(recipes=False)
+        with timings.measure("phase", "load_extensions"):
+            self._load_extensions()
+        with timings.measure("phase", "install_packages_from_extensions"):
+            self._install_packages_from_extensions()
+        # Now the pip hooks of extensions are called,
+        # and we see the changes that extensions made to the config.
+        with timings.measure("phase", "install_planned_recipe_packages"):
+            self._install_planned_packages(extensions=False)
 
         # We will use @call_extensions around these functions.
         self.load_recipes()
@@ -71,9 +114,98 @@ class ConfigCook(object):
 
         logger.debug("End of ConfigCook call.")
 
+    def next_run(self):
+        """Get a ConfigCook to run again in this process, for watch mode.
+
+        It reuses the parsed config files that have not changed,
+        the entrypoints, and the packages that we have already handled.
+        Parts that are installed with the same options are skipped,
+        instead of updated.
+        """
+        cook = ConfigCook(self.options, documents=self.documents)
+        cook.update_unchanged = False
+        cook._entrypoint_index = self._entrypoint_index
+        cook._handled_packages = self._handled_packages
+        return cook
+
+    def plan(self):
+        """Find out what a run would do, without changing anything.
+
+        We read the config and look up the extensions and recipes,
+        but we do not install packages, load extensions, or run parts.
+        Returns a configcook.plan.Plan.
+        """
+        from .plan import Plan
+
+        logger.debug("Making a plan.")
+        with timings.measure("phase", "read_config"):
+            self._read_config()
+        ccc = self.config["configcook"]
+        plan = Plan(configfile=ccc["configfile"], jobs=self.options.jobs)
+        packages = self._get_planned_packages()
+        if self.options.no_packages:
+            # A run would refuse to install these.
+            plan.packages = self._get_missing_packages(packages)
+            plan.packages_refused = True
+        elif self.options.force_pip:
+            plan.packages = sorted(packages, key=str.lower)
+        else:
+            plan.packages = self._get_missing_packages(packages)
+        extension_names = ccc.get("extensions", [])
+        if isinstance(extension_names, list):
+            for name in extension_names:
+                entrypoint = self._get_entrypoint("configcook.extension", name)
+                plan.extensions.append((name, entrypoint is not None))
+        installed = InstalledState(ccc["installed"])
+
+        def plan_part(name):
+            plan.parts.append(self._plan_part(name, installed))
+
+        part_names = self._call_for_parts(plan_part)
+        plan.dependencies = find_part_dependencies(self.config, part_names)
+        # Check for dependency cycles.
+        sort_parts(part_names, plan.dependencies)
+        return plan
+
+    def _plan_part(self, name, installed):
+        """Find out what a run would do for a part.  Returns a PartPlan."""
+        from .plan import PartPlan
+
+        options = self.config[name]
+        if "recipe" not in options:
+            raise ConfigError("recipe option missing from {0} section".format(name))
+        recipe_name = options["recipe"]
+        entrypoint = self._get_entrypoint("configcook.recipe", recipe_name)
+        if entrypoint is None:
+            return PartPlan(
+                name,
+                recipe_name,
+                "install",
+                estimate=installed.get_duration(name, "install"),
+                note="recipe is not installed yet",
+            )
+        recipe = entrypoint.load()(name, self.config, options)
+        signature = part_signature(recipe_name, entrypoint.dist_version, recipe.options)
+        if installed.is_installed(name, signature):
+            action = "update"
+        else:
+            action = "install"
+        plan_method = getattr(recipe, "plan", None)
+        commands = plan_method(action) if plan_method is not None else []
+        estimate = installed.get_duration(name, action)
+        if estimate is None and action == "update":
+            # Not updated yet.  Installing is usually the most work.
+            estimate = installed.get_duration(name, "install")
+        return PartPlan(name, recipe_name, action, commands=commands, estimate=estimate)
+
     def _read_config(self):
         logger.debug("Reading config.")
-        self.config = parse_toml_config(self.options.configfile)
+        self.config = parse_toml_config(
+            self.options.configfile,
+            cache=self.options.config_cache,
+            offline=self.options.offline,
+            documents=self.documents,
+        )
         logger.debug("Sections: %s", ", ".join(self.config.keys()))
         if "configcook" not in self.config:
             raise ConfigError("Section 'configcook' missing from config file.")
@@ -106,7 +238,15 @@ class ConfigCook(object):
 
     @call_extensions
     def load_recipes(self, *args):
-        # Do we want all parts/sections/recipes?
+        self._part_names = self._call_for_parts(self._load_part)
+        self._part_dependencies = find_part_dependencies(self.config, self._part_names)
+        # Check for dependency cycles before we start installing anything.
+        order = sort_parts(self._part_names, self._part_dependencies)
+        if order != self._part_names:
+            logger.info("Order of parts after sorting: %s", ", ".join(order))
+
+    def _get_parts(self):
+        """Get the parts option of the configcook section, after checking it."""
         ccc = self.config["configcook"]
         if "parts" not in ccc:
             raise ConfigError("Missing parts option in configcook section.")
@@ -115,15 +255,37 @@ class ConfigCook(object):
             # We could turn "item1" into ["item1"] but we choose not too.
             # Would give problems with  "parts+"="item2" which could become "item1item2".
             raise ConfigError("parts option in configcook section must be a list.")
-        for part in parts:
+        return parts
+
+    def _call_for_parts(self, function):
+        """Call function(part) for all parts.
+
+        We report the errors of all parts at once.
+        Returns the part names.
+        """
+        names = []
+        errors = []
+        for part in self._get_parts():
             if part not in self.config:
-                raise ConfigError(
+                errors.append(
                     "[configcook] parts option has {0}, "
                     "but this is missing from the sections.".format(part)
                 )
-            # TODO: check dependencies between parts.
-            self._part_names.append(part)
-            self._load_part(part)
+                continue
+            names.append(part)
+            try:
+                function(part)
+            except (ConfigError, ValueError) as exc:
+                errors.extend(
+                    "[{0}] {1}".format(part, line) for line in str(exc).splitlines()
+                )
+        if len(errors) == 1:
+            raise ConfigError(errors[0])
+        if errors:
+            raise ConfigError(
+                "Found {0} errors in parts:\n{1}".format(len(errors), "\n".join(errors))
+            )
+        return names
 
     def _find_and_install_packages(self, extensions=False, recipes=False):
         """Install packages from self.extensions or self.recipes."""
@@ -163,22 +325,242 @@ class ConfigCook(object):
         logger.debug("Gathering list of all packages that the recipes want to install.")
         self._find_and_install_packages(recipes=True)
 
+    def _install_planned_packages(self, extensions=True, recipes=True):
+        """Install all packages that we know we need, with one pip call.
+
+        Installing them all at once is a lot faster than calling pip
+        for each of them.
+        Extensions and recipes may still want extra packages later,
+        but usually we have everything after this.
+        We do this once for the extensions, and once for the recipes,
+        after loading the extensions, so their hooks are called.
+        """
+        if self.options.no_packages:
+            logger.debug("Option --no-packages used, so not planning packages.")
+            return
+        packages = self._get_planned_packages(extensions=extensions, recipes=recipes)
+        if not packages:
+            logger.debug("No packages needed.")
+            return
+        if self._install_packages(*packages):
+            self._reload_entrypoints()
+
+    def _get_planned_packages(self, extensions=True, recipes=True):
+        """Get the packages that we know we need.
+
+        These are the packages that contain extensions and recipes that
+        we do not have yet, plus the packages (or eggs) options
+        of the extensions and parts.
+        """
+        logger.debug("Planning which packages to install.")
+        ccc = self.config["configcook"]
+        packages = set()
+        # (group, name, section name) of extensions and recipes
+        wanted = []
+        extension_names = ccc.get("extensions", []) if extensions else []
+        if isinstance(extension_names, list):
+            for name in extension_names:
+                section_name = name.replace(":", "_")
+                wanted.append(("configcook.extension", name, section_name))
+        part_names = ccc.get("parts", []) if recipes else []
+        if isinstance(part_names, list):
+            for name in part_names:
+                recipe_name = self.config.get(name, {}).get("recipe")
+                if recipe_name:
+                    wanted.append(("configcook.recipe", recipe_name, name))
+        for group, name, section_name in wanted:
+            if self._get_entrypoint(group, name) is None:
+                # We support both package and package:name.
+                packages.add(name.split(":")[0])
+            options = self.config.get(section_name, {})
+            try:
+                packages.update(packages_from_options(options))
+            except ValueError:
+                # Not a string or list.  We will complain later.
+                pass
+        return packages
+
     def _install_packages(self, *packages):
+        """Install packages with pip.
+
+        Returns True when pip was called, False otherwise.
+        """
+        packages = set(packages) - self._handled_packages
+        if not packages:
+            logger.debug("All packages were already handled.")
+            return False
         sorted_packages = sorted(packages, key=str.lower)
         logger.info("Full list of packages: %s", ", ".join(sorted_packages))
         if self.options.verbose:
             logger.debug("One package per line for easier viewing:")
             for package in sorted_packages:
                 logger.debug(package)
-        logger.info("Installing all packages.")
-        # Note: we could use pkg_resources to check if these packages
-        # are already installed, but I guess pip is better at that.
+        if not self.options.force_pip:
+            sorted_packages = self._get_missing_packages(sorted_packages)
+            if not sorted_packages:
+                logger.info("All packages are already installed.")
+                self._handled_packages.update(packages)
+                return False
+        logger.info("Installing packages: %s", ", ".join(sorted_packages))
         self.pip("install", *sorted_packages)
+        self._handled_packages.update(packages)
+        return True
+
+    def _get_missing_packages(self, packages):
+        """Get the packages that are not installed, sorted.
+
+        Calling pip takes a few seconds, even when it has nothing to do,
+        so we only pass it these packages, unless --force-pip is used.
+        """
+        get_version = self._get_entrypoint_index().get_distribution_version
+        return [
+            package
+            for package in sorted(packages, key=str.lower)
+            if not requirement_is_satisfied(package, get_version)
+        ]
+
+    def _reload_entrypoints(self):
+        """Make newly installed packages and their entrypoints available."""
+        logger.debug("Reloading entrypoints.")
+        invalidate_caches = getattr(importlib, "invalidate_caches", None)
+        if invalidate_caches is not None:
+            # Not on Python 2.7, which has no import caches to invalidate.
+            invalidate_caches()
+        self._get_entrypoint_index().refresh()
+        # pkg_resources may have been used for checking requirements.
+        pkg_resources = sys.modules.get("pkg_resources")
+        if pkg_resources is not None:
+            for entry in sys.path:
+                pkg_resources.working_set.add_entry(entry)
+
+    def _get_entrypoint_index(self):
+        if self._entrypoint_index is None:
+            cache_file = None
+            ccc = self.config["configcook"]
+            if ccc.get("entrypoint-cache"):
+                # Use a different file for each Python, for example per virtualenv.
+                digest = hashlib.sha1(sys.executable.encode("utf-8")).hexdigest()
+                cache_file = os.path.join(
+                    ccc["cache-directory"], "entrypoints-{0}.json".format(digest[:12])
+                )
+            self._entrypoint_index = EntrypointIndex(cache_file=cache_file)
+        return self._entrypoint_index
+
+    def _get_entrypoint(self, group, name):
+        """Get an entrypoint or None."""
+        return self._get_entrypoint_index().get(group, name)
 
     @call_extensions
     def run_recipes(self):
+        self.installed = InstalledState(self.config["configcook"]["installed"])
+        removed = sorted(set(self.installed.parts) - set(self._part_names))
+        if removed:
+            logger.info("Parts no longer in the parts list: %s", ", ".join(removed))
+            self.installed.forget(*removed)
+        try:
+            if self.options.use_async:
+                from .aio import run_parts_async
+
+                run_parts_async(
+                    self._part_names,
+                    self._part_dependencies,
+                    self._start_part,
+                    jobs=self.options.jobs,
+                )
+            else:
+                run_parts(
+                    self._part_names,
+                    self._part_dependencies,
+                    self._run_part,
+                    jobs=self.options.jobs,
+                )
+        finally:
+            if self.installed.durations:
+                # Save the durations of updated parts, also when a part failed.
+                self.installed.save()
+
+    def _run_part(self, name):
+        """Install or update a part."""
+        method, finish = self._start_part(name)
+        if method is None:
+            finish(True)
+            return
+        try:
+            result = method()
+            if is_awaitable(result):
+                # An 'async def' method, without --async.
+                from .aio import run
+
+                run(result)
+        except Exception:
+            finish(False)
+            raise
+        finish(True)
+
+    def _start_part(self, name, awaitables=None):
+        """Find out what to do for a part.
+
+        When the recipe and the options of the part are the same as during
+        the previous run, we call the update method of the recipe.
+        Otherwise we call the install method.
+
+        Returns the method to call, or None, and a function that must be
+        called after the method, with True on success, or False on failure.
+        The async engine uses this to await 'async def' methods.
+        It passes a list as awaitables: the awaitables of 'async def'
+        part hooks are added to it, instead of being run in a new event loop.
+        """
         for recipe in self.recipes:
-            recipe.install()
+            if recipe.name == name:
+                break
+        else:
+            raise LogicError("No recipe loaded for part {0}.".format(name))
+        recipe_name = self.config[name]["recipe"]
+        recipe_version = self._recipe_versions.get(recipe_name, "")
+        signature = part_signature(recipe_name, recipe_version, recipe.options)
+        # Extensions can use their run_before and run_after hooks
+        # with function name "run_part" to do something for each part.
+        # These are called in the thread that runs the part.
+        self._call_part_hooks("run_before", name, awaitables)
+        # Remember how long the part takes, for the estimates of --plan.
+        start = time.time()
+        if self.installed.is_installed(name, signature):
+            if self.update_unchanged:
+                logger.info("Part %s is unchanged.", name)
+                method = getattr(recipe, "update", None)
+            else:
+                logger.info("Part %s is unchanged, so we skip it.", name)
+                method = None
+
+            def finish(success):
+                if success and method is not None:
+                    duration = round(time.time() - start, 3)
+                    self.installed.set_duration(name, "update", duration)
+                self._call_part_hooks("run_after", name, awaitables)
+
+            return method, finish
+        logger.info("Installing part %s.", name)
+
+        def finish(success):
+            if success:
+                duration = round(time.time() - start, 3)
+                self.installed.set_duration(name, "install", duration)
+                self.installed.set(name, signature, recipe_name, recipe_version)
+            else:
+                # The part may be half installed.
+                self.installed.remove(name)
+            self._call_part_hooks("run_after", name, awaitables)
+
+        return recipe.install, finish
+
+    def _call_part_hooks(self, hook_name, name, awaitables=None):
+        hooks = self.hooks.get(hook_name, "run_part")
+        if not hooks:
+            return
+        if awaitables is None:
+            call_hooks(hooks, "run_part", self, name)
+        else:
+            awaitables.extend(start_hooks(hooks, "run_part", self, name))
 
     def _load_extensions(self):
         # We could do self._pip('freeze') here as start
@@ -213,9 +595,15 @@ class ConfigCook(object):
             # Instantiate the extension and call it.
             extension = extension_class(name, self.config, options)
             if callable(extension):
-                extension()
+                result = extension()
+                if is_awaitable(result):
+                    # An 'async def __call__'.
+                    from .aio import run
+
+                    run(result)
             logger.info("Loaded extension %s.", name)
             self.extensions.append(extension)
+        self.hooks = HookTable(self.extensions)
         logger.debug("Loaded extensions.")
 
     def _load_extension(self, name):
@@ -236,19 +624,16 @@ class ConfigCook(object):
         - When install=True, we can try a pip install.
         """
         logger.debug("Searching %s entrypoint with name %s.", group, name)
-        for entrypoint in pkg_resources.iter_entry_points(group=group):
-            if entrypoint.name == name:
-                logger.debug("Found %s entrypoint with name %s.", group, name)
-                return entrypoint
+        with timings.measure("entrypoint", name):
+            entrypoint = self._get_entrypoint(group, name)
+        if entrypoint is not None:
+            logger.debug("Found %s entrypoint with name %s.", group, name)
+            return entrypoint
         # Check if package is installed.
         # We support both package and package:name.
         package_name = name.split(":")[0]
-        try:
-            pkg_resources.get_distribution(package_name)
-        except pkg_resources.DistributionNotFound:
-            # We do not have the package yet.  We can try to install it.
-            pass
-        else:
+        index = self._get_entrypoint_index()
+        if index.get_distribution_version(package_name) is not None:
             # TODO: check dist.version.
             raise ConfigCookError(
                 "We have package {0} but could not find a {1} entrypoint "
@@ -263,7 +648,8 @@ class ConfigCook(object):
             )
         logger.debug("We do not yet have a %s entrypoint with name %s.", group, name)
         logger.info("Trying to install package %s.", package_name)
-        self.pip("install", package_name)
+        self._install_packages(package_name)
+        self._reload_entrypoints()
         # Retry, but this time do not allow to install.
         logger.info(
             "Retrying searching for %s entrypoint with name %s "
@@ -293,6 +679,8 @@ class ConfigCook(object):
         # Load the entrypoint class.
         recipe_class = entrypoint.load()
         logger.debug("Loaded recipe %s.", recipe_class)
+        # Remember the version, so we can reinstall parts when it changes.
+        self._recipe_versions[name] = entrypoint.dist_version
         return recipe_class
 
     def _load_part(self, name):
@@ -320,12 +708,13 @@ class ConfigCook(object):
         ccc["executable"] = to_path(sys.executable)
         ccc["configcook-script"] = to_path(sys.argv[0])
         ccc["pip"] = to_path(os.path.join(ccc["bin-directory"], "pip"))
-        configfile = to_path(self.options.configfile)
-        ccc["configfile"] = configfile
-        if "://" in configfile:
-            # a url
+        configfile = self.options.configfile
+        if is_url(configfile):
+            ccc["configfile"] = configfile
             ccc["base-directory"] = os.getcwd()
         else:
+            configfile = to_path(configfile)
+            ccc["configfile"] = configfile
             ccc["base-directory"] = os.path.dirname(configfile)
 
         # Substitute ${part:name} in all options.
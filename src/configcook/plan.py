@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""What a run would do, for the --plan option."""
+from .dependencies import part_levels
+from .dependencies import sort_parts
+
+
+class PartPlan(object):
+    """What a run would do for one part.
+
+    - action: "install" or "update".
+    - commands: descriptions of what the recipe would do,
+      from the plan method of the recipe.
+    - estimate: how many seconds the same action took in the previous run,
+      or None when we do not know.  For an update that has not run yet,
+      this is how long the install took.
+    - note: extra information, for example that the recipe is not installed yet.
+    """
+
+    def __init__(self, name, recipe_name, action, commands=(), estimate=None, note=""):
+        self.name = name
+        self.recipe_name = recipe_name
+        self.action = action
+        self.commands = list(commands)
+        self.estimate = estimate
+        self.note = note
+
+    def __repr__(self):
+        return "<PartPlan {0} {1}>".format(self.name, self.action)
+
+
+class Plan(object):
+    """What a run would do.
+
+    - packages: packages that pip would install.
+    - packages_refused: True when the --no-packages option is used,
+      so a run would refuse to install the packages and fail.
+    - extensions: list of (name, found), where found is False
+      when the extension is not installed yet.
+    - parts: list of PartPlan, in the order of the parts option.
+    - dependencies: part name -> set of names of parts that it depends on.
+    """
+
+    def __init__(self, configfile="", jobs=1):
+        self.configfile = configfile
+        self.jobs = jobs
+        self.packages = []
+        self.packages_refused = False
+        self.extensions = []
+        self.parts = []
+        self.dependencies = {}
+
+    def get_part(self, name):
+        for part in self.parts:
+            if part.name == name:
+                return part
+        return None
+
+    def levels(self):
+        """Get the part names grouped in levels, see dependencies.part_levels."""
+        return part_levels([part.name for part in self.parts], self.dependencies)
+
+    def estimate(self):
+        """Estimate how many seconds running the parts takes.
+
+        We do what run_parts does: start a part when the parts that it
+        depends on are done, with at most self.jobs parts at the same time.
+        Parts without an estimate count as zero seconds.
+        """
+        estimates = dict((part.name, part.estimate or 0.0) for part in self.parts)
+        pending = sort_parts([part.name for part in self.parts], self.dependencies)
+        # part name -> time at which it is done
+        running = {}
+        done = set()
+        now = 0.0
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= self.jobs:
+                    break
+                if self.dependencies[name] <= done:
+                    pending.remove(name)
+                    running[name] = now + estimates[name]
+            name = min(running, key=running.get)
+            now = running.pop(name)
+            done.add(name)
+        return now
+
+    def format_lines(self):
+        """Get the plan as lines of text."""
+        lines = ["Plan for {0}:".format(self.configfile)]
+        if self.packages:
+            line = "Packages to install: {0}".format(", ".join(self.packages))
+            if self.packages_refused:
+                line += " (would be refused: --no-packages)"
+            lines.append(line)
+        else:
+            lines.append("Packages to install: none")
+        if self.extensions:
+            lines.append("Extensions:")
+            for name, found in self.extensions:
+                if found:
+                    lines.append("  {0}".format(name))
+                else:
+                    lines.append("  {0} (not installed yet)".format(name))
+        levels = self.levels()
+        lines.append("Parts, in {0} level(s):".format(len(levels)))
+        for number, names in enumerate(levels, 1):
+            lines.append("  Level {0}:".format(number))
+            for name in names:
+                part = self.get_part(name)
+                if part.estimate is None:
+                    estimate = "no estimate"
+                else:
+                    estimate = "estimated {0:.3f} seconds".format(part.estimate)
+                line = "    {0} [{1}]: {2}, {3}".format(
+                    name, part.recipe_name, part.action, estimate
+                )
+                if self.dependencies[name]:
+                    line += ", after {0}".format(
+                        ", ".join(sorted(self.dependencies[name]))
+                    )
+                if part.note:
+                    line += " ({0})".format(part.note)
+                lines.append(line)
+                for command in part.commands:
+                    lines.append("      {0}".format(command))
+        unknown = [part.name for part in self.parts if part.estimate is None]
+        line = "Estimated duration: {0:.3f} seconds with {1} job(s).".format(
+            self.estimate(), self.jobs
+        )
+        if unknown:
+            line += " No estimate for: {0}.".format(", ".join(unknown))
+        lines.append(line)
+        return lines
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""Run commands, streaming their output to the log.
+
+This module imports subprocess, so only import it when you need it.
+"""
+from . import timings
+from .exceptions import CommandTimeoutError
+from .utils import format_command_for_print
+from six.moves import queue
+
+import logging
+import six
+import subprocess
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+# Maximum length of a line that we read in one go.
+# Longer lines are logged in several pieces.
+MAX_LINE_LENGTH = 64 * 1024
+# Maximum number of lines that we keep in memory before logging them.
+# When the logging is slower than the command, the command waits.
+MAX_QUEUED_LINES = 1000
+
+
+class CommandResult(object):
+    """Result of running a command.
+
+    output and errors are bytes when they were captured, otherwise None.
+    """
+
+    def __init__(self, command, returncode, output=None, errors=None, duration=0.0):
+        self.command = command
+        self.returncode = returncode
+        self.output = output
+        self.errors = errors
+        self.duration = duration
+
+    def __repr__(self):
+        return "<CommandResult {0!r} returncode={1}>".format(
+            self.command, self.returncode
+        )
+
+
+def command_label(command):
+    """Get a short text for a command, for timings.
+
+    A command can be a list of arguments, or a string when shell=True.
+    """
+    if isinstance(command, six.string_types):
+        return command
+    return format_command_for_print(command)
+
+
+def _read_pipe(pipe, stream_name, lines, stop):
+    """Read lines from a pipe and put them in the lines queue.
+
+    This runs in a thread.  At the end we put None in the queue.
+    When the stop event is set, nobody reads the queue anymore,
+    so we stop as well.
+    """
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                lines.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for line in iter(lambda: pipe.readline(MAX_LINE_LENGTH), b""):
+            if not put((stream_name, line)):
+                return
+    finally:
+        pipe.close()
+    put((stream_name, None))
+
+
+def _kill(process):
+    try:
+        process.kill()
+    except OSError:
+        # Already gone.
+        pass
+    process.wait()
+
+
+def run_command(
+    command,
+    capture_output=False,
+    capture_errors=False,
+    log=True,
+    log_file=None,
+    timeout=None,
+    check=False,
+    cancel=None,
+    **kwargs
+):
+    """Run a command, streaming its output and errors to the log.
+
+    Both pipes are read at the same time, line by line, in two threads.
+    The lines are logged in the calling thread, so when parts run
+    in parallel, the lines end up with the log messages of the right part.
+    We never keep more than MAX_QUEUED_LINES lines in memory,
+    unless you ask to capture them.
+
+    - capture_output, capture_errors: keep the output and errors as bytes
+      in the result.
+    - log: log each line with level INFO, except captured lines.
+    - log_file: also write all output and errors to this file.
+    - timeout: kill the command after this many seconds,
+      and raise CommandTimeoutError.
+    - check: raise subprocess.CalledProcessError when the command fails.
+    - cancel: a threading.Event.  When it is set, we kill the command,
+      and return the result with the exit code of the killed command.
+      Output that the command has not written yet is lost.
+
+    Other keyword arguments, like cwd and env, are passed to subprocess.Popen.
+    Returns a CommandResult.
+    """
+    start = time.time()
+    start_clock = timings.clock()
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs
+    )
+    lines = queue.Queue(maxsize=MAX_QUEUED_LINES)
+    stop = threading.Event()
+    readers = [
+        threading.Thread(
+            target=_read_pipe, args=(process.stdout, "out", lines, stop)
+        ),
+        threading.Thread(
+            target=_read_pipe, args=(process.stderr, "err", lines, stop)
+        ),
+    ]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    captured = {"out": [], "err": []}
+    capture = {"out": capture_output, "err": capture_errors}
+    open_pipes = len(readers)
+    tee = open(log_file, "ab") if log_file else None
+    deadline = start + timeout if timeout is not None else None
+    try:
+        while open_pipes:
+            if cancel is not None and cancel.is_set():
+                logger.debug("Cancelled command: %s", command)
+                _kill(process)
+                break
+            if deadline is not None and time.time() >= deadline:
+                _kill(process)
+                raise CommandTimeoutError(
+                    "Command timed out after {0} seconds: {1}".format(
+                        timeout, command
+                    )
+                )
+            # Wake up regularly to check the timeout and cancel event.
+            wait = 0.1 if cancel is not None else None
+            if deadline is not None:
+                remaining = max(deadline - time.time(), 0)
+                wait = remaining if wait is None else min(wait, remaining)
+            try:
+                stream_name, line = lines.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_pipes -= 1
+                continue
+            if tee is not None:
+                tee.write(line)
+            if capture[stream_name]:
+                captured[stream_name].append(line)
+            elif log:
+                logger.info("%s", line.decode("utf-8", "replace").rstrip("\r\n"))
+        returncode = process.wait()
+    finally:
+        stop.set()
+        if tee is not None:
+            tee.close()
+        if process.returncode is None:
+            _kill(process)
+        if timings.get_recorder() is not None:
+            timings.record(
+                "command",
+                command_label(command),
+                start_clock,
+                args={"pid": process.pid, "returncode": process.returncode},
+            )
+    result = CommandResult(
+        command,
+        returncode,
+        output=b"".join(captured["out"]) if capture_output else None,
+        errors=b"".join(captured["err"]) if capture_errors else None,
+        duration=time.time() - start,
+    )
+    logger.debug(
+        "Command finished in %.4f seconds with exit code %d: %s",
+        result.duration,
+        returncode,
+        command,
+    )
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, command, output=result.output)
+    return result
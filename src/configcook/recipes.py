@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 from .entrypoints import Entrypoint
+from .exceptions import ConfigError
+from .substitution import compile_file_template
+from .substitution import compile_template
+from .substitution import Resolver
+from .utils import buffered_logs
 from .utils import call_or_fail
 from .utils import entrypoint_function
-from .utils import substitute
+from .utils import format_command_for_print
+from .utils import split_command
 from .utils import to_path
+from .utils import write_if_changed
 import logging
 import six
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
@@ -24,46 +33,275 @@ class BaseRecipe(Entrypoint):
     def install(self):
         logger.debug("Empty install for part %s.", self.name)
 
+    @entrypoint_function
+    def update(self):
+        """Update the part.
+
+        This is called instead of install when the part was already
+        installed in a previous run, and its options have not changed.
+        """
+        logger.debug("Empty update for part %s.", self.name)
+
+    def plan(self, action="install"):
+        """Describe what install or update would do, for the --plan option.
 
-# TODO update method?  When is that called?
-# We don't yet have a .installed.cfg.
+        action is "install" or "update".
+        Returns a list of strings, for example commands.
+        This must not change anything.
+        """
+        return []
 
 
 class CommandsRecipe(BaseRecipe):
     """Basic configcook recipe that runs one or more commands.
+
+    The output of the commands is logged while they run.
+    Options:
+
+    - commands: list of commands, or a string with one command per line.
+      A command is split like a shell would do, so you can use quotes.
+      It only runs in a shell when it needs one, for example for a pipe,
+      a redirect, a variable, or an environment variable like FOO=1.
+      A command can also be a list of arguments.
+    - parallel: run the commands at the same time.
+    - jobs: run at most this many commands at the same time.
+      This implies parallel.  By default all commands run at the same time.
+    - log-file: also write the output of the commands to this file.
+    - timeout: stop a command when it takes longer than this many seconds.
+
+    When a command fails, running commands are stopped,
+    and commands that have not started yet are skipped.
     """
 
-    defaults = {"commands": {"required": True, "type": (list, six.string_types)}}
+    defaults = {
+        "commands": {"required": True, "type": (list, six.string_types)},
+        "jobs": {"type": six.integer_types},
+        "log-file": {"type": six.string_types},
+        "parallel": {"default": False, "type": bool},
+        "timeout": {"type": six.integer_types + (float,)},
+    }
 
-    @entrypoint_function
-    def install(self):
+    def parse_options(self):
+        super(CommandsRecipe, self).parse_options()
+        # Find mistakes like an unbalanced quote now, instead of during the run.
+        try:
+            self.commands
+        except ValueError as exc:
+            raise ConfigError(
+                "Part {0} has an invalid command in the commands option: {1}".format(
+                    self.name, exc
+                )
+            )
+
+    @property
+    def commands(self):
+        """Get the commands, each as a list of arguments."""
         commands = self.options["commands"]
         if isinstance(commands, six.string_types):
             commands = commands.splitlines()
+        result = []
         for command in commands:
-            command = command.split()
-            if not command:
-                continue
-            logger.debug("Calling command: %s", command)
-            call_or_fail(command)
+            if isinstance(command, six.string_types):
+                command = split_command(command)
+            if command:
+                result.append(command)
+        return result
+
+    def plan(self, action="install"):
+        if action == "update":
+            # We do nothing on update.
+            return []
+        return [format_command_for_print(command) for command in self.commands]
+
+    @entrypoint_function
+    def install(self):
+        commands = self.commands
+        jobs = self.options["jobs"]
+        if jobs is None and self.options["parallel"]:
+            jobs = len(commands)
+        if jobs is None or jobs <= 1 or len(commands) <= 1:
+            for command in commands:
+                self.run_command(command)
+            return
+        self.run_commands_parallel(commands, jobs)
+
+    def run_command(self, command, cancel=None):
+        """Run one command, logging how long it took."""
+        logger.debug("Calling command: %s", command)
+        log_file = self.options["log-file"]
+        if log_file:
+            log_file = to_path(log_file)
+        start = time.time()
+        result = call_or_fail(
+            command, log_file=log_file, timeout=self.options["timeout"], cancel=cancel
+        )
+        logger.info(
+            "Part %s: command finished in %.2f seconds: %s",
+            self.name,
+            time.time() - start,
+            format_command_for_print(command),
+        )
+        return result
+
+    def run_commands_parallel(self, commands, jobs):
+        """Run the commands at the same time, at most 'jobs' at once.
+
+        The output of each command is shown together,
+        in the order of the commands.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        logger.debug(
+            "Part %s: running %d commands with %d jobs.", self.name, len(commands), jobs
+        )
+        cancel = threading.Event()
+        errors = []
+
+        def run(index, command):
+            if cancel.is_set():
+                logger.info("Part %s: skipped command: %s", self.name, command)
+                return
+            try:
+                self.run_command(command, cancel=cancel)
+            except Exception as exc:
+                if not cancel.is_set():
+                    # The first failure: stop the others.
+                    errors.append(exc)
+                    cancel.set()
+                raise
+
+        with buffered_logs() as logs:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [
+                    executor.submit(logs.call, index, run, index, command)
+                    for index, command in enumerate(commands)
+                ]
+                for index, future in enumerate(futures):
+                    # Wait for this one, and show its output.
+                    future.exception()
+                    logs.flush(index)
+        if errors:
+            raise errors[0]
 
 
 class TemplateRecipe(BaseRecipe):
-    """Basic configcook recipe that renders an inline template to a file.
+    """Basic configcook recipe that renders a template to a file.
+
+    Options:
+
+    - input: the template, inline.
+    - input-file: a file with the template.  Use this or input.
+    - output: the file to write.
+    - foreach: a list.  For each item we write a file.
+      In the template and in the output you can use ${item},
+      ${item.key} when items are tables, and ${index}.
+
+    Templates are compiled once, so rendering many files is fast.
+    The output file is only written when its contents change,
+    so a run without changes does not touch any files.
     """
 
     defaults = {
-        "input": {"required": True},
+        "foreach": {"type": list},
+        "input": {},
+        "input-file": {"type": six.string_types},
         "output": {"parser": to_path, "required": True},
     }
+    # Names of local variables that you can use with foreach.
+    variables = ("index", "item")
+
+    def __init__(self, *args, **kwargs):
+        super(TemplateRecipe, self).__init__(*args, **kwargs)
+        # Output files that we have written, or that were unchanged.
+        self.written = []
+        self.unchanged = []
+
+    def get_template(self, variables=()):
+        """Get the compiled template, from input or input-file."""
+        has_input = self.options.get("input") is not None
+        if has_input == bool(self.options["input-file"]):
+            raise ConfigError(
+                "Part {0} must have either the input or the input-file option.".format(
+                    self.name
+                )
+            )
+        if has_input:
+            value = self.options["input"]
+            if not isinstance(value, six.string_types):
+                # The input was a reference to a list or other non-string value.
+                value = "{0!r}".format(value)
+            return compile_template(value, variables)
+        return compile_file_template(to_path(self.options["input-file"]), variables)
+
+    def write(self, output, value):
+        """Write a value to an output file, when it has changed."""
+        if write_if_changed(output, value):
+            self.written.append(output)
+            logger.info("Part %s wrote to output file %s", self.name, output)
+            logger.debug("Value written: %r", value)
+        else:
+            self.unchanged.append(output)
+            logger.debug("Part %s: output file %s is unchanged.", self.name, output)
+
+    def render(self, resolver, template, variables=None):
+        value = resolver.render(template, current_part=self.name, variables=variables)
+        if not isinstance(value, six.string_types):
+            # ${configcook:parts} gives a list.
+            value = "{0!r}".format(value)
+        return value
+
+    def get_outputs(self, resolver):
+        """Get the output files.
+
+        Returns a list of output paths and the variables for rendering them.
+        """
+        foreach = self.options["foreach"]
+        if foreach is None:
+            return [(self.options["output"], None)]
+        output_template = compile_template(self.options["output"], self.variables)
+        result = []
+        outputs = set()
+        for index, item in enumerate(foreach):
+            variables = {"index": index, "item": item}
+            output = to_path(self.render(resolver, output_template, variables))
+            if output in outputs:
+                raise ConfigError(
+                    "Part {0} renders item {1} to the same output file "
+                    "as an earlier item: {2}".format(self.name, index, output)
+                )
+            outputs.add(output)
+            result.append((output, variables))
+        return result
+
+    def plan(self, action="install"):
+        # Update does the same as install.
+        outputs = self.get_outputs(Resolver(self.config))
+        return ["write {0}".format(output) for output, _variables in outputs]
 
     @entrypoint_function
     def install(self):
-        value = self.options["input"]
-        output = self.options["output"]
-        # ${configcook:parts} should become a list.
-        value = substitute(self.config, value, current_part=self.name)
-        with open(output, "w") as outfile:
-            outfile.write(value)
-        logger.info("Part %s wrote to output file %s", self.name, output)
-        logger.debug("Value written: %r", value)
+        self.written = []
+        self.unchanged = []
+        resolver = Resolver(self.config)
+        if self.options["foreach"] is None:
+            template = self.get_template()
+        else:
+            template = self.get_template(self.variables)
+        for output, variables in self.get_outputs(resolver):
+            self.write(output, self.render(resolver, template, variables))
+        logger.info(
+            "Part %s: %d file(s) written, %d unchanged.",
+            self.name,
+            len(self.written),
+            len(self.unchanged),
+        )
+
+    @entrypoint_function
+    def update(self):
+        """Update the part.
+
+        Rendering is cheap, and we only write files that have changed,
+        so we do the same as install.
+        This restores output files that were removed or edited.
+        """
+        self.install()
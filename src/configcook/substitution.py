@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+from .exceptions import ConfigError
+import hashlib
+import logging
+import os
+import re
+import six
+
+
+logger = logging.getLogger(__name__)
+# pattern for ${part:option}
+substitution_pattern = re.compile(r"\${([^:${}]*):([^}]+)}")
+# Cache of compiled templates.  We clear it when it gets too big.
+_template_cache = {}
+TEMPLATE_CACHE_SIZE = 10000
+# Cache of templates from files, keyed on hash and variable names.
+_file_template_cache = {}
+# (path, size, mtime) -> hash of the contents
+_file_digests = {}
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(
+        "This {0} is shared between options and cannot be changed. "
+        "Make a copy first.".format(type(self).__name__)
+    )
+
+
+class FrozenList(list):
+    """A list that cannot be changed.
+
+    When an option is a reference to an option with a list value,
+    both options share this same list.
+    So changing it in one option would change it in the other one too,
+    which is why we do not allow this.
+    It is still a list, so isinstance(value, list) works.
+    """
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    __setslice__ = __delslice__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = clear = _read_only
+
+    def __reduce__(self):
+        # Support copy, deepcopy and pickle.
+        return (type(self), (list(self),))
+
+
+class FrozenDict(dict):
+    """A dictionary that cannot be changed.
+
+    See FrozenList.
+    """
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+
+def freeze(value):
+    """Get a read-only version of a value.
+
+    Lists and dictionaries are copied once into a FrozenList or FrozenDict.
+    Other values are returned as is.
+    """
+    if isinstance(value, (FrozenList, FrozenDict)):
+        return value
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    return value
+
+
+class Variable(object):
+    """A reference to a local variable in a template, like ${item}.
+
+    With ${item.key} we get a key of the variable, when it is a dictionary.
+    """
+
+    __slots__ = ("name", "key")
+
+    def __init__(self, name, key=None):
+        self.name = name
+        self.key = key
+
+    def __repr__(self):
+        if self.key is None:
+            return "<Variable {0}>".format(self.name)
+        return "<Variable {0}.{1}>".format(self.name, self.key)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Variable)
+            and self.name == other.name
+            and self.key == other.key
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.name, self.key))
+
+    def get(self, variables):
+        try:
+            value = variables[self.name]
+        except (KeyError, TypeError):
+            raise ConfigError("Unknown variable '${{{0}}}'.".format(self.name))
+        if self.key is None:
+            return value
+        try:
+            return value[self.key]
+        except (KeyError, TypeError, IndexError):
+            raise ConfigError(
+                "Unable to get '${{{0}.{1}}}' from {2!r}.".format(
+                    self.name, self.key, value
+                )
+            )
+
+
+def _variables_pattern(names):
+    """Get a pattern for ${part:option}, and ${name} or ${name.key} for names."""
+    names = "|".join(re.escape(name) for name in names)
+    return re.compile(r"\${(?:([^:${}]*):([^}]+)|(" + names + r")(?:\.([^}]+))?)}")
+
+
+class Template(object):
+    """A text, compiled into literal text and ${part:option} references.
+
+    The text is scanned only once.
+    segments is a tuple with strings for literal text,
+    and (part, option) tuples for references.
+    For ${:option} the part is an empty string.
+
+    You can pass names of local variables.
+    Then ${name} and ${name.key} in the text become Variable segments.
+    You pass their values when rendering.
+    """
+
+    __slots__ = ("text", "segments", "references", "variables")
+
+    def __init__(self, text, variables=()):
+        self.text = text
+        self.variables = tuple(variables)
+        pattern = substitution_pattern
+        if self.variables:
+            pattern = _variables_pattern(self.variables)
+        segments = []
+        references = []
+        position = 0
+        for match in pattern.finditer(text):
+            if match.start() > position:
+                segments.append(text[position : match.start()])
+            groups = match.groups()
+            if len(groups) > 2 and groups[2] is not None:
+                segments.append(Variable(groups[2], groups[3]))
+            else:
+                reference = groups[:2]
+                segments.append(reference)
+                references.append(reference)
+            position = match.end()
+        if position < len(text):
+            segments.append(text[position:])
+        self.segments = tuple(segments)
+        self.references = tuple(references)
+
+    def __repr__(self):
+        return "<Template {0!r}>".format(self.text)
+
+    @property
+    def is_reference(self):
+        """Is the complete text a single reference, like '${part:option}'?"""
+        return len(self.segments) == 1 and bool(self.references)
+
+    def get_references(self, current_part=""):
+        """Get the references, with ${:option} pointing to current_part."""
+        return [(part or current_part, option) for part, option in self.references]
+
+    def render(self, lookup, current_part="", variables=None):
+        """Render the template.
+
+        lookup is a function that gets a part and option,
+        and returns the value.
+        variables is a dictionary with the values of local variables.
+
+        When the complete text is a single reference or variable,
+        we return the value as is, so a list stays a list.
+        Otherwise we interpolate the values in the text.
+        """
+        if len(self.segments) == 1:
+            segment = self.segments[0]
+            if isinstance(segment, Variable):
+                return segment.get(variables)
+            if isinstance(segment, tuple):
+                part, option = segment
+                return lookup(part or current_part, option)
+        if len(self.segments) <= 1:
+            # Only text.
+            return self.text
+        result = []
+        for segment in self.segments:
+            if isinstance(segment, tuple):
+                part, option = segment
+                segment = lookup(part or current_part, option)
+            elif isinstance(segment, Variable):
+                segment = segment.get(variables)
+            # value used to be a string, but can now be a list, boolean, etc.
+            if not isinstance(segment, six.string_types):
+                segment = "{0!r}".format(segment)
+            result.append(segment)
+        return "".join(result)
+
+
+def compile_template(text, variables=()):
+    """Compile text into a Template, or get it from the cache."""
+    key = (text, tuple(variables)) if variables else text
+    try:
+        return _template_cache[key]
+    except KeyError:
+        pass
+    if len(_template_cache) >= TEMPLATE_CACHE_SIZE:
+        _template_cache.clear()
+    template = _template_cache[key] = Template(text, variables)
+    return template
+
+
+def compile_file_template(path, variables=(), encoding="utf-8"):
+    """Compile the contents of a file into a Template, or get it from the cache.
+
+    The cache is keyed on the hash of the contents,
+    so files with the same contents share a template.
+    We remember the size and modification time of the file,
+    so we only read it again when it has changed.
+    """
+    variables = tuple(variables)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    digest = _file_digests.get(key)
+    template = _file_template_cache.get((digest, variables))
+    if template is not None:
+        return template
+    with open(path, "rb") as template_file:
+        data = template_file.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if len(_file_digests) >= TEMPLATE_CACHE_SIZE:
+        _file_digests.clear()
+    _file_digests[key] = digest
+    template = _file_template_cache.get((digest, variables))
+    if template is None:
+        if len(_file_template_cache) >= TEMPLATE_CACHE_SIZE:
+            _file_template_cache.clear()
+        template = Template(data.decode(encoding), variables)
+        _file_template_cache[(digest, variables)] = template
+    return template
+
+
+def _format_reference(reference):
+    return "${%s:%s}" % reference
+
+
+class Resolver(object):
+    """Resolve ${part:option} references in a config.
+
+    The config is a dictionary of dictionaries.
+    Values are resolved when they are needed, in any order,
+    and each value is resolved only once.
+    A reference that (indirectly) points to itself gives a ConfigError.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # (part, option) -> resolved value
+        self._resolved = {}
+
+    def _get_raw(self, reference, referrer=None):
+        part, option = reference
+        try:
+            return self.config[part][option]
+        except (KeyError, TypeError):
+            if referrer is None:
+                raise ConfigError(
+                    "Unable to substitute '{0}' from config.".format(
+                        _format_reference(reference)
+                    )
+                )
+            raise ConfigError(
+                "Unable to substitute '{0}' from config, used in {1}.".format(
+                    _format_reference(reference), _format_reference(referrer)
+                )
+            )
+
+    def get(self, part, option):
+        """Get the fully resolved value of an option."""
+        reference = (part, option)
+        if reference in self._resolved:
+            return self._resolved[reference]
+        # We do this without recursion, so long chains of references
+        # do not hit the recursion limit.
+        # 'path' contains the references that we are resolving,
+        # in order: each one is waiting for the next one.
+        path = []
+        waiting = set()
+        stack = [(reference, None)]
+        while stack:
+            reference, referrer = stack[-1]
+            if reference in self._resolved:
+                stack.pop()
+                continue
+            value = self._get_raw(reference, referrer)
+            if not isinstance(value, six.string_types):
+                self._resolved[reference] = value
+                stack.pop()
+                continue
+            template = compile_template(value)
+            if not template.references:
+                self._resolved[reference] = value
+                stack.pop()
+                continue
+            references = template.get_references(current_part=reference[0])
+            missing = [ref for ref in references if ref not in self._resolved]
+            if missing and reference not in waiting:
+                # First time we see this one: resolve the references first.
+                path.append(reference)
+                waiting.add(reference)
+                for ref in reversed(missing):
+                    if ref in waiting:
+                        cycle = path[path.index(ref) :] + [ref]
+                        raise ConfigError(
+                            "Circular reference in substitution: {0}".format(
+                                " -> ".join(_format_reference(ref) for ref in cycle)
+                            )
+                        )
+                    stack.append((ref, reference))
+                continue
+            if reference in waiting:
+                # All its references are resolved, so it is the last one.
+                path.pop()
+                waiting.remove(reference)
+            value = self._render(template, current_part=reference[0])
+            logger.debug("Substituted %s with %r", _format_reference(reference), value)
+            self._resolved[reference] = value
+            stack.pop()
+        return self._resolved[(part, option)]
+
+    def render(self, text, current_part="", variables=None):
+        """Substitute all references in a text.
+
+        text can also be a compiled Template.
+        variables is a dictionary with the values of local variables,
+        like ${item}.
+        """
+        if isinstance(text, Template):
+            template = text
+        elif not isinstance(text, six.string_types):
+            # Nothing to substitute here.
+            return text
+        else:
+            template = compile_template(text, sorted(variables or ()))
+        return self._render(template, current_part=current_part, variables=variables)
+
+    def _render(self, template, current_part="", variables=None):
+        if template.is_reference:
+            return template.render(self._get_shared, current_part=current_part)
+        return template.render(self.get, current_part=current_part, variables=variables)
+
+    def _get_shared(self, part, option):
+        """Get the value of an option, for sharing with another option.
+
+        Lists and dictionaries are made read-only,
+        also in the original option, so they can be safely shared.
+        """
+        value = self.get(part, option)
+        frozen = freeze(value)
+        if frozen is not value:
+            self._resolved[(part, option)] = frozen
+            self.config[part][option] = frozen
+        return frozen
+
+    def resolve_section(self, section_name):
+        """Resolve all options in a section, changing it in-place."""
+        section = self.config[section_name]
+        if not isinstance(section, dict):
+            return
+        for key in list(section):
+            value = self.get(section_name, key)
+            if value is not section[key]:
+                section[key] = value
+
+    def resolve_all(self):
+        """Resolve all options in all sections, changing them in-place."""
+        for section_name in list(self.config):
+            self.resolve_section(section_name)
@@ -19,3 +19,69 @@ def safe_working_dir():
     # will fail if the current working directory no longer exists.
     # So we always change the dir without comparing.
     os.chdir(orig_working_dir)
+
+
+class FakeServer(object):
+    """Info about a local http server for tests.
+
+    Set files[path] = contents to serve a file.
+    """
+
+    def __init__(self, port):
+        self.url = "http://127.0.0.1:{0}".format(port)
+        self.files = {}
+        # list of (path, status)
+        self.requests = []
+        # client addresses, one for each connection
+        self.clients = set()
+
+
+@pytest.fixture
+def http_server():
+    from six.moves import BaseHTTPServer
+    from six.moves import socketserver
+
+    import hashlib
+    import threading
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        # Support keep-alive.
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            server_info.clients.add(self.client_address)
+            contents = server_info.files.get(self.path)
+            if contents is None:
+                status = 404
+                body = b"Not found"
+                etag = None
+            else:
+                body = contents.encode("utf-8")
+                etag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    status = 304
+                    body = b""
+                else:
+                    status = 200
+            server_info.requests.append((self.path, status))
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server_info = FakeServer(server.server_address[1])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server_info
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+from subprocess import CalledProcessError
+
+import asyncio
+import logging
+import pytest
+import sys
+import threading
+import time
+
+
+def make_start_part(calls, duration=0.2, failing=()):
+    """Get a start_part function for run_parts_async.
+
+    Parts starting with 'sync' have a normal method, others an async one.
+    calls gets a list of ('start'/'end', name), and ('finish', name, success).
+    """
+    logger = logging.getLogger("configcook.tests")
+
+    def start_part(name, awaitables):
+        async def async_method():
+            calls.append(("start", name))
+            logger.info("Part %s: first", name)
+            await asyncio.sleep(duration)
+            logger.info("Part %s: second", name)
+            calls.append(("end", name))
+            if name in failing:
+                raise ValueError(name)
+
+        def sync_method():
+            assert threading.current_thread() is not threading.main_thread()
+            calls.append(("start", name))
+            logger.info("Part %s: first", name)
+            time.sleep(duration)
+            logger.info("Part %s: second", name)
+            calls.append(("end", name))
+            if name in failing:
+                raise ValueError(name)
+
+        def finish(success):
+            calls.append(("finish", name, success))
+
+        if name.startswith("sync"):
+            return sync_method, finish
+        return async_method, finish
+
+    return start_part
+
+
+def test_run_parts_async_overlap(caplog):
+    from configcook.aio import run_parts_async
+
+    caplog.set_level(logging.INFO, logger="configcook.tests")
+    names = ["a", "b", "sync1", "sync2"]
+    deps = dict((name, set()) for name in names)
+    calls = []
+    start = time.time()
+    run_parts_async(names, deps, make_start_part(calls), jobs=4)
+    # All parts ran at the same time.
+    assert time.time() - start < 0.6
+    assert set(calls[:4]) == set(("start", name) for name in names)
+    assert ("finish", "a", True) in calls
+    # The log messages are shown per part, in the original order.
+    messages = [
+        record.getMessage()
+        for record in caplog.records
+        if record.name == "configcook.tests"
+    ]
+    expected = []
+    for name in names:
+        expected.append("Part {0}: first".format(name))
+        expected.append("Part {0}: second".format(name))
+    assert messages == expected
+
+
+def test_run_parts_async_jobs_and_dependencies():
+    from configcook.aio import run_parts_async
+
+    names = ["a", "b", "c"]
+    calls = []
+    start = time.time()
+    run_parts_async(
+        names, {"a": set(), "b": set(), "c": set()}, make_start_part(calls), jobs=1
+    )
+    assert time.time() - start >= 0.6
+    assert [call[1] for call in calls if call[0] == "start"] == names
+    # a depends on sync1, b depends on a.
+    calls = []
+    names = ["a", "b", "sync1"]
+    deps = {"a": {"sync1"}, "b": {"a"}, "sync1": set()}
+    run_parts_async(names, deps, make_start_part(calls, duration=0.01), jobs=4)
+    assert [call[1] for call in calls if call[0] == "start"] == ["sync1", "a", "b"]
+
+
+def test_run_parts_async_error():
+    from configcook.aio import run_parts_async
+
+    names = ["a", "b", "c"]
+    deps = {"a": set(), "b": set(), "c": {"a"}}
+    calls = []
+    with pytest.raises(ValueError) as exc:
+        run_parts_async(
+            names,
+            deps,
+            make_start_part(calls, duration=0.01, failing=["a"]),
+            jobs=2,
+        )
+    assert str(exc.value) == "a"
+    assert ("finish", "a", False) in calls
+    assert ("finish", "b", True) in calls
+    # c depends on a, so it has not started.
+    assert ("start", "c") not in calls
+
+
+def test_run_parts_async_errors(caplog):
+    from configcook.aio import run_parts_async
+
+    caplog.set_level(logging.ERROR, logger="configcook.dependencies")
+    names = ["a", "sync_b", "c"]
+    deps = {"a": set(), "sync_b": set(), "c": {"a"}}
+    calls = []
+    with pytest.raises(ValueError) as exc:
+        run_parts_async(
+            names,
+            deps,
+            make_start_part(calls, duration=0.01, failing=["a", "sync_b"]),
+            jobs=2,
+        )
+    assert str(exc.value) == "a"
+    messages = [
+        record.getMessage()
+        for record in caplog.records
+        if record.name == "configcook.dependencies"
+    ]
+    assert messages == [
+        "Part a failed: ValueError: a",
+        "Part sync_b failed: ValueError: sync_b",
+        "Parts not started: c",
+    ]
+
+
+def test_run_all():
+    from configcook.aio import run_all
+
+    async def double(value):
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def fail():
+        raise ValueError("failed")
+
+    assert run_all([double(1), double(2)]) == [2, 4]
+    with pytest.raises(ValueError):
+        run_all([double(1), fail()])
+
+
+def test_async_entrypoint_function():
+    from configcook.aio import is_async
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+
+    class AsyncRecipe(BaseRecipe):
+        @entrypoint_function
+        async def install(self):
+            await asyncio.sleep(0)
+            return "installed"
+
+    recipe = AsyncRecipe("part", {}, {"recipe": "async"})
+    assert is_async(recipe.install)
+    assert not is_async(BaseRecipe("part", {}, {}).install)
+    assert asyncio.run(recipe.install()) == "installed"
+
+
+def test_call_extensions_async_hooks():
+    from configcook.utils import call_extensions
+
+    calls = []
+
+    class Extension(object):
+        def __init__(self, name):
+            self.name = name
+
+        async def run_before(self, function_name, instance):
+            calls.append(("start", self.name))
+            await asyncio.sleep(0.2)
+            calls.append(("before", self.name, function_name))
+
+    class Sync(object):
+        def run_after(self, function_name, instance):
+            calls.append(("after", function_name))
+
+    class Instance(object):
+        extensions = [Extension("one"), Extension("two"), Sync()]
+
+        @call_extensions
+        def work(self):
+            calls.append(("work",))
+
+    start = time.time()
+    Instance().work()
+    # The async hooks ran at the same time.
+    assert time.time() - start < 0.35
+    assert calls == [
+        ("start", "one"),
+        ("start", "two"),
+        ("before", "one", "work"),
+        ("before", "two", "work"),
+        ("work",),
+        ("after", "work"),
+    ]
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_command(caplog, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.aio import run
+    from configcook.aio import run_command
+    from configcook.process import MAX_LINE_LENGTH
+
+    import os
+
+    caplog.set_level(logging.INFO, logger="configcook.aio")
+    code = "import sys; print('out'); sys.stderr.write('err\\n')"
+    result = run(run_command(python_command(code)))
+    assert result.returncode == 0
+    messages = [record.getMessage() for record in caplog.records]
+    assert "out" in messages
+    assert "err" in messages
+    # capture and log file
+    log_file = os.path.join(str(tmp_path), "part.log")
+    code = "import sys; print('x' * {0}); print('end')".format(MAX_LINE_LENGTH * 2)
+    result = run(
+        run_command(
+            python_command(code), capture_output=True, log_file=log_file, log=False
+        )
+    )
+    assert result.output == b"x" * MAX_LINE_LENGTH * 2 + b"\nend\n"
+    with open(log_file, "rb") as myfile:
+        assert myfile.read() == result.output
+    # check
+    with pytest.raises(CalledProcessError):
+        run(run_command(python_command("import sys; sys.exit(2)"), check=True))
+
+
+def test_run_command_timeout():
+    from configcook.aio import run
+    from configcook.aio import run_command
+    from configcook.exceptions import CommandTimeoutError
+
+    async def overlap():
+        # Two commands run at the same time.
+        return await asyncio.gather(
+            run_command(python_command("import time; time.sleep(0.3)")),
+            run_command(python_command("import time; time.sleep(0.3)")),
+        )
+
+    start = time.time()
+    run(overlap())
+    assert time.time() - start < 0.55
+    with pytest.raises(CommandTimeoutError):
+        run(run_command(python_command("import time; time.sleep(30)"), timeout=0.3))
@@ -2,9 +2,56 @@
 from textwrap import dedent
 import os
 import pytest
+import subprocess
 import sys
 
 
+# Maximum time in seconds that importing our modules may take on start up.
+# This is generous, to avoid random failures on slow machines,
+# but it catches for example an accidental top level import of pkg_resources.
+IMPORT_BUDGET_HELP = 0.5
+IMPORT_BUDGET_RUN = 1.0
+# Modules that should never be imported for a simple 'configcook --help'.
+HEAVY_MODULES = [
+    "configcook.main",
+    "pkg_resources",
+    "subprocess",
+    "toml",
+    "tomli",
+    "tomllib",
+]
+
+
+def import_times(cwd, *args):
+    """Call configcook with 'python -X importtime'.
+
+    Returns a dictionary of imported module names with their
+    cumulative import time in seconds.
+    """
+    command = [sys.executable, "-X", "importtime", "-m", "configcook"]
+    command.extend(args)
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    _out, err = process.communicate()
+    assert process.returncode == 0, err
+    times = {}
+    for line in err.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self, cumulative, name = line.split(":", 1)[1].split("|")
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+        times[name.strip()] = int(cumulative) / 1000000.0
+    return times
+
+
 def test_parse_options_configfile(safe_sys_argv):
     from configcook.cli import parse_options
 
@@ -67,8 +114,29 @@ def test_parse_options_other_than_configfile(tmp_path, safe_sys_argv, safe_worki
     sys.argv = ["configcook"]
     options = parse_options()
     assert options.configfile == "cc.toml"
+    assert not options.config_cache
     assert not options.debug
+    assert not options.offline
     assert not options.verbose
+    assert options.jobs == 1
+    assert not options.force_pip
+    assert not options.use_async
+    assert not options.timings
+    assert options.timings_json is None
+    assert options.trace is None
+    assert options.profile is None
+    assert not options.plan
+    assert not options.watch
+
+    # --async
+    sys.argv = "configcook --async".split()
+    options = parse_options()
+    assert options.use_async
+
+    # --config-cache
+    sys.argv = "configcook --config-cache".split()
+    options = parse_options()
+    assert options.config_cache
 
     # -D / --debug
     sys.argv = "configcook -D".split()
@@ -78,6 +146,48 @@ def test_parse_options_other_than_configfile(tmp_path, safe_sys_argv, safe_worki
     options = parse_options()
     assert options.debug
 
+    # --force-pip
+    sys.argv = "configcook --force-pip".split()
+    options = parse_options()
+    assert options.force_pip
+
+    # -j / --jobs
+    sys.argv = "configcook -j 4".split()
+    options = parse_options()
+    assert options.jobs == 4
+    sys.argv = "configcook --jobs 2".split()
+    options = parse_options()
+    assert options.jobs == 2
+    sys.argv = "configcook --jobs 0".split()
+    with pytest.raises(SystemExit):
+        parse_options()
+
+    # --offline
+    sys.argv = "configcook --offline".split()
+    options = parse_options()
+    assert options.offline
+
+    # --plan
+    sys.argv = "configcook --plan".split()
+    options = parse_options()
+    assert options.plan
+
+    # --profile
+    sys.argv = "configcook --profile cook.pstats".split()
+    options = parse_options()
+    assert options.profile == "cook.pstats"
+
+    # --timings and --timings-json
+    sys.argv = "configcook --timings --timings-json timings.json".split()
+    options = parse_options()
+    assert options.timings
+    assert options.timings_json == "timings.json"
+
+    # --trace
+    sys.argv = "configcook --trace trace.json".split()
+    options = parse_options()
+    assert options.trace == "trace.json"
+
     # -v / --verbose
     sys.argv = "configcook -v".split()
     options = parse_options()
@@ -86,6 +196,11 @@ def test_parse_options_other_than_configfile(tmp_path, safe_sys_argv, safe_worki
     options = parse_options()
     assert options.verbose
 
+    # --watch
+    sys.argv = "configcook --watch".split()
+    options = parse_options()
+    assert options.watch
+
 
 def test_cli_main_without_config_file(safe_sys_argv):
     from configcook.cli import main
@@ -148,3 +263,421 @@ commands = "echo Hello"
     # Maybe because I am using PyPy3?
     # captured = capsys.readouterr()
     # captured.out == 'foo'
+
+
+def test_cli_main_commands_log_file(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["test"]
+
+[test]
+recipe = "configcook:commands"
+commands = ["echo Hello", "echo World"]
+log-file = "test.log"
+timeout = 30
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    config_file = os.path.join(str_path, "a.toml")
+    with open(config_file, "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages -c a.toml".split()
+    main()
+    with open(os.path.join(str_path, "test.log")) as log_file:
+        assert log_file.read() == "Hello\nWorld\n"
+    # A command that takes too long is stopped.
+    with open(config_file, "w") as cf:
+        cf.write(
+            contents.replace('"echo World"', '"sleep 30"').replace(
+                "timeout = 30", "timeout = 0.2"
+            )
+        )
+    with pytest.raises(SystemExit) as exc:
+        main()
+    assert exc.value.code == 1
+
+
+def test_cli_main_timings(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    import json
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["test"]
+
+[test]
+recipe = "configcook:commands"
+commands = "echo Hello"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages --timings --timings-json t.json".split()
+    main()
+    with open(os.path.join(str_path, "t.json")) as myfile:
+        data = json.load(myfile)
+    keys = set((item["category"], item["name"]) for item in data["summary"])
+    assert ("phase", "read_config") in keys
+    assert ("phase", "load_recipes") in keys
+    assert ("phase", "run_recipes") in keys
+    assert ("entrypoint", "configcook:commands") in keys
+    assert ("part", "test install") in keys
+    assert ("command", "echo Hello") in keys
+
+
+def test_cli_main_trace(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    import json
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["one", "two"]
+
+[one]
+recipe = "configcook:commands"
+commands = ["echo one", "echo more"]
+
+[two]
+recipe = "configcook:commands"
+commands = "echo two"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages --jobs 2 --trace trace.json".split()
+    main()
+    with open(os.path.join(str_path, "trace.json")) as myfile:
+        events = json.load(myfile)["traceEvents"]
+    spans = [event for event in events if event["ph"] == "X"]
+    by_name = dict((event["name"], event) for event in spans)
+    run = by_name["configcook"]
+    phase = by_name["run_recipes"]
+    part = by_name["one install"]
+    command = by_name["echo more"]
+    assert run["cat"] == "run"
+    assert phase["cat"] == "phase"
+    assert part["cat"] == "part"
+    assert command["cat"] == "command"
+    assert command["args"]["pid"] != os.getpid()
+    assert command["args"]["returncode"] == 0
+    # The spans are nested.
+    for outer, inner in [(run, phase), (phase, part), (part, command)]:
+        assert outer["ts"] <= inner["ts"]
+        assert inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"] + 1
+    # A part and its commands run in the same thread.
+    assert part["tid"] == command["tid"]
+    assert all(event["pid"] == os.getpid() for event in spans)
+
+
+def test_cli_main_profile(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    import pstats
+
+    contents = dedent(
+        """
+[configcook]
+extensions = ["configcook:profile"]
+parts = ["one", "two"]
+
+[configcook_profile]
+functions = ["load_recipes"]
+parts = ["two"]
+
+[one]
+recipe = "configcook:commands"
+commands = "echo one"
+
+[two]
+recipe = "configcook:template"
+input = "two"
+output = "two.txt"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages".split()
+    main()
+
+    def functions(filename):
+        stats = pstats.Stats(os.path.join(str_path, filename))
+        return set(function for _file, _line, function in stats.stats)
+
+    # The extension profiled a function and a part.
+    assert "load_recipes" in functions(os.path.join("profiles", "load_recipes.pstats"))
+    assert "install" in functions(os.path.join("profiles", "part-two.pstats"))
+    assert sorted(os.listdir(os.path.join(str_path, "profiles"))) == [
+        "load_recipes.pstats",
+        "part-two.pstats",
+    ]
+
+    # Profile the complete run.
+    # The extension sees that another profiler is active, and does nothing.
+    sys.argv = "configcook --no-packages --profile cook.pstats".split()
+    main()
+    assert "_start_part" in functions("cook.pstats")
+    assert "install" in functions("cook.pstats")
+
+
+def test_cli_main_jobs(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["first", "second", "third"]
+
+[first]
+recipe = "configcook:commands"
+commands = "touch ${second:filename}.done"
+depends = ["second"]
+
+[second]
+recipe = "configcook:commands"
+commands = "touch ${:filename}"
+filename = "second.txt"
+
+[third]
+recipe = "configcook:commands"
+commands = "touch third.txt"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    config_file = os.path.join(str_path, "a.toml")
+    with open(config_file, "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages -j 2 -c a.toml".split()
+    main()
+    assert os.path.exists("second.txt")
+    assert os.path.exists("second.txt.done")
+    assert os.path.exists("third.txt")
+
+    # A dependency cycle is an error.
+    with open(config_file, "w") as cf:
+        cf.write(contents.replace("[second]", '[second]\ndepends = ["first"]'))
+    with pytest.raises(SystemExit) as exc:
+        main()
+    assert exc.value.code == 1
+
+
+def test_cli_main_installed(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["first", "second"]
+
+[first]
+recipe = "configcook:commands"
+commands = "touch first.txt"
+
+[second]
+recipe = "configcook:commands"
+commands = "touch second.txt"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    config_file = os.path.join(str_path, "a.toml")
+    with open(config_file, "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages -c a.toml".split()
+    main()
+    assert os.path.exists(".installed.json")
+    os.remove("first.txt")
+    os.remove("second.txt")
+    # Nothing has changed, so the commands are not run again.
+    main()
+    assert not os.path.exists("first.txt")
+    assert not os.path.exists("second.txt")
+    # When the options of a part change, the part is installed again.
+    with open(config_file, "w") as cf:
+        cf.write(contents.replace("touch second.txt", "touch second.txt again.txt"))
+    main()
+    assert not os.path.exists("first.txt")
+    assert os.path.exists("second.txt")
+    assert os.path.exists("again.txt")
+
+
+def test_cli_main_packages_installed(tmp_path, safe_sys_argv, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["test"]
+
+[test]
+recipe = "configcook:packages"
+packages = ["six", "toml"]
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    config_file = os.path.join(str_path, "a.toml")
+    with open(config_file, "w") as cf:
+        cf.write(contents)
+    # The packages are already installed, so pip is not needed.
+    sys.argv = "configcook --no-packages -c a.toml".split()
+    main()
+    # When we force calling pip, --no-packages refuses this.
+    sys.argv = "configcook --no-packages --force-pip -c a.toml".split()
+    with pytest.raises(SystemExit) as exc:
+        main()
+    assert exc.value.code == 1
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs Python 3.7")
+def test_import_time_help(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    times = import_times(str(tmp_path), "--help")
+    assert "configcook.cli" in times
+    for module in HEAVY_MODULES:
+        assert module not in times
+    assert times["configcook.cli"] < IMPORT_BUDGET_HELP
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="-X importtime needs Python 3.7")
+def test_import_time_no_packages(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    str_path = str(tmp_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(
+            dedent(
+                """
+[configcook]
+parts = ["test"]
+
+[test]
+recipe = "configcook:commands"
+commands = "echo Hello"
+"""
+            )
+        )
+    times = import_times(str_path, "--no-packages")
+    # Now we need our main module, but still not pkg_resources.
+    assert "configcook.main" in times
+    assert "pkg_resources" not in times
+    total = sum(
+        seconds
+        for module, seconds in times.items()
+        if module in ("configcook", "configcook.cli", "configcook.main", "toml")
+    )
+    assert total < IMPORT_BUDGET_RUN
+
+
+def test_cli_main_plan(tmp_path, safe_sys_argv, safe_working_dir, capsys):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["one", "two", "three"]
+
+[one]
+recipe = "configcook:commands"
+commands = ["echo one", "echo 'one more'"]
+
+[two]
+recipe = "configcook:template"
+input = "${one:recipe}"
+output = "two.txt"
+
+[three]
+recipe = "configcook:commands"
+commands = "echo three"
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages --plan".split()
+    main()
+    # Nothing has been done.
+    assert sorted(os.listdir(str_path)) == ["cc.toml"]
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Plan for {0}:".format(os.path.join(str_path, "cc.toml"))
+    assert lines[1:] == [
+        "Packages to install: none",
+        "Parts, in 2 level(s):",
+        "  Level 1:",
+        "    one [configcook:commands]: install, no estimate",
+        "      echo one",
+        "      echo 'one more'",
+        "    three [configcook:commands]: install, no estimate",
+        "      echo three",
+        "  Level 2:",
+        "    two [configcook:template]: install, no estimate, after one",
+        "      write {0}".format(os.path.join(str_path, "two.txt")),
+        "Estimated duration: 0.000 seconds with 1 job(s). "
+        "No estimate for: one, two, three.",
+    ]
+
+    # After an install, we know how long it takes.  We have not updated
+    # yet, so we use the install duration as estimate for an update.
+    sys.argv = "configcook --no-packages".split()
+    main()
+    capsys.readouterr()
+    sys.argv = "configcook --no-packages --plan --jobs 2".split()
+    main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[4].startswith("    one [configcook:commands]: update, estimated ")
+    # The commands recipe does nothing on update, so no commands are shown.
+    assert not lines[5].startswith("      ")
+    assert "      echo one" not in lines
+    assert "No estimate" not in lines[-1]
+    assert lines[-1].endswith("seconds with 2 job(s).")
+
+
+def test_cli_main_plan_no_packages(tmp_path, safe_sys_argv, safe_working_dir, capsys):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.cli import main
+
+    contents = dedent(
+        """
+[configcook]
+parts = ["one"]
+
+[one]
+recipe = "configcook:commands"
+commands = "echo one"
+packages = ["configcook-no-such-package", "six"]
+"""
+    )
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    with open(os.path.join(str_path, "cc.toml"), "w") as cf:
+        cf.write(contents)
+    sys.argv = "configcook --no-packages --plan".split()
+    main()
+    lines = capsys.readouterr().out.splitlines()
+    # A run would need pip for the missing package, which --no-packages refuses.
+    assert lines[1] == (
+        "Packages to install: configcook-no-such-package "
+        "(would be refused: --no-packages)"
+    )
@@ -32,37 +32,40 @@ def test_ConfigCookConfig_is_dict_like():
     # This works the same as when you do new_dict = dict(old_dict):
     # changes in mutable keys (dict, list) get passed along,
     # but new values are really new.
+    # The same is true for _raw: we do not make a deep copy.
     a_data.append(2)
     orig["b"] = 5
     assert ccc != orig
     assert ccc._raw != orig
-    assert ccc._raw != ccc
+    assert ccc._raw == ccc
     assert ccc is not orig
     assert ccc._raw is not orig
     assert ccc._raw is not ccc
     assert orig.get("a") == a_data
     assert ccc.get("a") == a_data
-    assert ccc._raw.get("a") == [1]
+    assert ccc._raw.get("a") == a_data
     assert orig.get("b") == 5
     assert ccc.get("b") is None
     assert ccc._raw.get("b") is None
 
     # Now change the data in our class.
-    ccc["a"].append(3)
     ccc["c"] = 42
     assert ccc != orig
     assert ccc._raw != orig
     assert ccc._raw != ccc
-    assert ccc is not orig
-    assert ccc._raw is not orig
-    assert ccc._raw is not ccc
-    assert orig.get("a") == a_data
-    assert ccc.get("a") == a_data
-    assert ccc._raw.get("a") == [1]
     assert orig.get("c") is None
     assert ccc.get("c") == 42
     assert ccc._raw.get("c") is None
 
+    # Sections are copied, so changed options do not end up in _raw.
+    orig = {"section": {"a": "1"}}
+    ccc = ConfigCookConfig(orig)
+    ccc["section"]["a"] = "2"
+    ccc["section"]["b"] = "3"
+    assert ccc == {"section": {"a": "2", "b": "3"}}
+    assert ccc._raw == {"section": {"a": "1"}}
+    assert orig == {"section": {"a": "1"}}
+
 
 def test_ConfigCookConfig_substitute():
     from configcook.config import ConfigCookConfig
@@ -73,6 +76,29 @@ def test_ConfigCookConfig_substitute():
     assert cooked == {"A": {"a": "value of b", "b": "value of b"}}
 
 
+def test_ConfigCookConfig_substitute_chained():
+    from configcook.config import ConfigCookConfig
+    from configcook.exceptions import ConfigError
+
+    # The order of the sections does not matter.
+    conf = {
+        "A": {"a": "${B:b}"},
+        "B": {"b": "${C:c}"},
+        "C": {"c": "value of c"},
+    }
+    cooked = ConfigCookConfig(conf)
+    cooked.substitute_all()
+    assert cooked == {
+        "A": {"a": "value of c"},
+        "B": {"b": "value of c"},
+        "C": {"c": "value of c"},
+    }
+    # Circular references give an error.
+    cooked = ConfigCookConfig({"A": {"a": "${B:b}"}, "B": {"b": "${A:a}"}})
+    with pytest.raises(ConfigError):
+        cooked.substitute_all()
+
+
 def test_parse_toml_config_paths(tmp_path, safe_working_dir):
     # tmp_path is a pathlib/pathlib2.Path object.
     from configcook.config import ConfigCookConfig
@@ -222,10 +248,164 @@ def test_parse_toml_config_plus_string(tmp_path):
     }
 
 
+def test_parse_toml_config_cache(tmp_path):
+    from configcook.config import _cache_path
+    from configcook.config import ConfigCookConfig
+    from configcook.config import parse_toml_config
+
+    tempdir = str(tmp_path)
+    file_path1 = os.path.join(tempdir, "file1.toml")
+    file_path2 = os.path.join(tempdir, "file2.toml")
+    with open(file_path1, "w") as ccfile:
+        ccfile.write("[configcook]\nextends = ['file2.toml']\na = 1")
+    with open(file_path2, "w") as ccfile:
+        ccfile.write("[configcook]\nb = 2\ninline = {c = 3}")
+    expected = {
+        "configcook": {"a": 1, "b": 2, "extends": ["file2.toml"], "inline": {"c": 3}}
+    }
+    cache_path = _cache_path(file_path1)
+    assert cache_path == os.path.join(tempdir, ".file1.toml.cache")
+    # Without cache=True, no cache is written.
+    assert parse_toml_config(file_path1) == expected
+    assert not os.path.exists(cache_path)
+    assert parse_toml_config(file_path1, cache=True) == expected
+    assert os.path.exists(cache_path)
+
+    # Now we load from the cache.  Prove this by breaking the original files.
+    stat = os.stat(file_path2)
+    with open(file_path2, "w") as ccfile:
+        ccfile.write("[configcook]\nb = 5\ninline = {c = 3}")
+    os.utime(file_path2, (stat.st_atime, stat.st_mtime))
+    result = parse_toml_config(file_path1, cache=True)
+    assert result == expected
+    assert isinstance(result, ConfigCookConfig)
+    # Changes in the result do not end up in the cache.
+    result["configcook"]["a"] = 42
+    assert parse_toml_config(file_path1, cache=True) == expected
+
+    # When only the modification time changes, we still use the cache.
+    with open(file_path2, "w") as ccfile:
+        ccfile.write("[configcook]\nb = 2\ninline = {c = 3}")
+    os.utime(file_path2, (stat.st_atime, stat.st_mtime + 10))
+    assert parse_toml_config(file_path1, cache=True) == expected
+
+    # When the contents of an extended file change, we parse again.
+    with open(file_path2, "w") as ccfile:
+        ccfile.write("[configcook]\nb = 3")
+    assert parse_toml_config(file_path1, cache=True) == {
+        "configcook": {"a": 1, "b": 3, "extends": ["file2.toml"]}
+    }
+
+    # A corrupt cache file is ignored.
+    with open(cache_path, "w") as cache_file:
+        cache_file.write("corrupt")
+    assert parse_toml_config(file_path1, cache=True) == {
+        "configcook": {"a": 1, "b": 3, "extends": ["file2.toml"]}
+    }
+
+
+def test_parse_toml_config_urls(http_server, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.config import parse_toml_config
+    from configcook.exceptions import ConfigError
+    from configcook.fetch import Fetcher
+
+    tempdir = str(tmp_path)
+    cache_dir = os.path.join(tempdir, "cache")
+    # A local file extends two remote files.
+    file_path1 = os.path.join(tempdir, "file1.toml")
+    with open(file_path1, "w") as ccfile:
+        ccfile.write(
+            "[configcook]\nextends = ['{0}/base/one.toml', '{0}/two.toml']\na = 1".format(
+                http_server.url
+            )
+        )
+    # The remote file extends another one with a relative path.
+    http_server.files["/base/one.toml"] = (
+        "[configcook]\nextends = ['three.toml']\nb = 2\n\"a+\" = 1"
+    )
+    http_server.files["/two.toml"] = "[configcook]\nc = 3"
+    http_server.files["/base/three.toml"] = "[configcook]\nd = 4"
+    expected = {
+        "configcook": {
+            "a": 2,
+            "b": 2,
+            "c": 3,
+            "d": 4,
+            "extends": [
+                "{0}/base/one.toml".format(http_server.url),
+                "three.toml",
+                "{0}/two.toml".format(http_server.url),
+            ],
+        }
+    }
+    fetcher = Fetcher(cache_directory=cache_dir)
+    assert parse_toml_config(file_path1, fetcher=fetcher) == expected
+    assert sorted(http_server.requests) == [
+        ("/base/one.toml", 200),
+        ("/base/three.toml", 200),
+        ("/two.toml", 200),
+    ]
+    # We can start with a url as well.
+    http_server.files["/file1.toml"] = "[configcook]\nextends = ['two.toml']"
+    assert parse_toml_config(
+        http_server.url + "/file1.toml", fetcher=fetcher
+    ) == {"configcook": {"c": 3, "extends": ["two.toml"]}}
+    # Offline, we use the cache.
+    http_server.requests = []
+    offline_fetcher = Fetcher(cache_directory=cache_dir, offline=True)
+    assert parse_toml_config(file_path1, fetcher=offline_fetcher) == expected
+    assert http_server.requests == []
+    # We do not cache configs that extend urls.
+    assert parse_toml_config(file_path1, cache=True, fetcher=fetcher) == expected
+    assert not os.path.exists(os.path.join(tempdir, ".file1.toml.cache"))
+    # Circular extends give an error.
+    http_server.files["/base/three.toml"] = "[configcook]\nextends = ['one.toml']"
+    with pytest.raises(ConfigError):
+        parse_toml_config(file_path1, fetcher=fetcher)
+
+
+def test_parse_toml_config_urls_cache_directory(http_server, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.config import parse_toml_config
+
+    tempdir = str(tmp_path)
+    cache_dir = os.path.join(tempdir, "cache")
+    file_path = os.path.join(tempdir, "cc.toml")
+    with open(file_path, "w") as ccfile:
+        ccfile.write(
+            "[configcook]\nextends = ['{0}/base.toml']\ncache-directory = '{1}'".format(
+                http_server.url, cache_dir
+            )
+        )
+    http_server.files["/base.toml"] = "[configcook]\nb = 2"
+    assert parse_toml_config(file_path)["configcook"]["b"] == 2
+    # The default fetcher uses the cache-directory option.
+    assert len(os.listdir(os.path.join(cache_dir, "http"))) == 2
+    http_server.requests = []
+    assert parse_toml_config(file_path, offline=True)["configcook"]["b"] == 2
+    assert http_server.requests == []
+
+
 def test_merge_dicts():
     from configcook.config import _merge_dicts as md
     from configcook.exceptions import ConfigError
 
+    # We do not change the original dicts, or their values.
+    orig = {"a": {"a": ["1"], "b": "1"}, "b": {"b": "1"}}
+    new = {"a": {"a +": ["2"]}, "c": {"c": "3"}}
+    result = md(orig, new)
+    assert result == {
+        "a": {"a": ["1", "2"], "b": "1"},
+        "b": {"b": "1"},
+        "c": {"c": "3"},
+    }
+    assert orig == {"a": {"a": ["1"], "b": "1"}, "b": {"b": "1"}}
+    assert new == {"a": {"a +": ["2"]}, "c": {"c": "3"}}
+    # Unchanged values are not copied.
+    assert result["b"] is orig["b"]
+    assert result["c"] is new["c"]
+
     # We do not make inline changes: the result is a new dict.
     a = {}
     b = {}
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import logging
+import pytest
+import threading
+import time
+
+
+def test_find_references():
+    from configcook.dependencies import find_references as fr
+
+    assert fr("") == []
+    assert fr(1) == []
+    assert fr(["${a:b}"]) == []
+    assert fr("${a:b}") == [("a", "b")]
+    assert fr("${a:b} and ${c:d}") == [("a", "b"), ("c", "d")]
+    assert fr("${:b}") == [("", "b")]
+    assert fr("${:b}", current_part="a") == [("a", "b")]
+
+
+def test_find_part_dependencies():
+    from configcook.config import ConfigCookConfig
+    from configcook.dependencies import find_part_dependencies
+    from configcook.exceptions import ConfigError
+
+    config = ConfigCookConfig(
+        {
+            "configcook": {"parts": ["a", "b", "c", "d"], "base": "${b:x}"},
+            # a refers to b directly, and to c via a section that is not a part.
+            "a": {"x": "${b:x}", "y": "${settings:z}", "z": "${:x}"},
+            "b": {"x": "${configcook:parts}"},
+            "c": {"x": "1"},
+            "d": {"depends": ["c"], "x": "${configcook:base}"},
+            "settings": {"z": "${c:x}"},
+        }
+    )
+    deps = find_part_dependencies(config, config["configcook"]["parts"])
+    assert deps == {"a": {"b", "c"}, "b": set(), "c": set(), "d": {"b", "c"}}
+
+    # depends can be a string.
+    config["c"]["depends"] = "a b"
+    deps = find_part_dependencies(config, config["configcook"]["parts"])
+    assert deps["c"] == {"a", "b"}
+
+    # But it cannot be an integer.
+    config["c"]["depends"] = 1
+    with pytest.raises(ConfigError):
+        find_part_dependencies(config, config["configcook"]["parts"])
+
+    # And it can only point to parts.
+    config["c"]["depends"] = ["settings"]
+    with pytest.raises(ConfigError):
+        find_part_dependencies(config, config["configcook"]["parts"])
+
+
+def test_find_part_dependencies_input_file(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.config import ConfigCookConfig
+    from configcook.dependencies import find_part_dependencies
+
+    import os
+
+    template_path = os.path.join(str(tmp_path), "template.in")
+    with open(template_path, "w") as template_file:
+        template_file.write("port ${server:port}, name ${:name}, ${item}\n")
+    config = ConfigCookConfig(
+        {
+            "configcook": {"parts": ["server", "template", "missing"]},
+            "server": {"port": "8080"},
+            "template": {"input-file": template_path, "name": "${settings:name}"},
+            "missing": {"input-file": os.path.join(str(tmp_path), "missing.in")},
+            "settings": {"name": "test"},
+        }
+    )
+    deps = find_part_dependencies(config, config["configcook"]["parts"])
+    assert deps == {"server": set(), "template": {"server"}, "missing": set()}
+
+
+def test_sort_parts():
+    from configcook.dependencies import sort_parts
+    from configcook.exceptions import ConfigError
+
+    assert sort_parts([], {}) == []
+    # Without dependencies, we keep the order.
+    deps = {"a": set(), "b": set(), "c": set()}
+    assert sort_parts(["a", "b", "c"], deps) == ["a", "b", "c"]
+    assert sort_parts(["c", "b", "a"], deps) == ["c", "b", "a"]
+    # With dependencies, only the needed changes are made.
+    deps["a"] = {"b"}
+    assert sort_parts(["a", "b", "c"], deps) == ["b", "a", "c"]
+    deps["b"] = {"c"}
+    assert sort_parts(["a", "b", "c"], deps) == ["c", "b", "a"]
+    # Cycles are reported.
+    deps["c"] = {"a"}
+    with pytest.raises(ConfigError) as exc:
+        sort_parts(["a", "b", "c"], deps)
+    assert "a -> b -> c -> a" in str(exc.value)
+
+
+def test_run_parts_serial():
+    from configcook.dependencies import run_parts
+
+    called = []
+    deps = {"a": {"b"}, "b": set(), "c": set()}
+    run_parts(["a", "b", "c"], deps, called.append)
+    assert called == ["b", "a", "c"]
+
+
+def test_run_parts_parallel(caplog):
+    from configcook.dependencies import run_parts
+
+    logger = logging.getLogger("configcook.tests")
+    threads = set()
+    called = []
+
+    def function(name):
+        threads.add(threading.current_thread().ident)
+        logger.info("start %s", name)
+        # Let the first parts take longer, so the others finish first.
+        time.sleep({"a": 0.2, "b": 0.1}.get(name, 0))
+        logger.info("end %s", name)
+        called.append(name)
+
+    deps = {"a": set(), "b": set(), "c": {"a"}, "d": set()}
+    with caplog.at_level(logging.INFO, logger="configcook.tests"):
+        run_parts(["a", "b", "c", "d"], deps, function, jobs=3)
+    assert len(threads) > 1
+    # c must wait for a.
+    assert called.index("c") > called.index("a")
+    # d does not need to wait.
+    assert called.index("d") < called.index("a")
+    # The log messages are shown per part, in the original order.
+    messages = [
+        record.getMessage()
+        for record in caplog.records
+        if record.name == "configcook.tests"
+    ]
+    assert messages == [
+        "start a",
+        "end a",
+        "start b",
+        "end b",
+        "start c",
+        "end c",
+        "start d",
+        "end d",
+    ]
+
+
+def test_run_parts_parallel_error():
+    from configcook.dependencies import run_parts
+
+    called = []
+
+    def function(name):
+        if name == "a":
+            raise ValueError("failing {0}".format(name))
+        called.append(name)
+
+    deps = {"a": set(), "b": {"a"}, "c": set()}
+    with pytest.raises(ValueError) as exc:
+        run_parts(["a", "b", "c"], deps, function, jobs=2)
+    assert str(exc.value) == "failing a"
+    # b depends on a, so it is never started.
+    assert "b" not in called
+
+
+def test_run_parts_parallel_errors(caplog):
+    from configcook.dependencies import run_parts
+
+    caplog.set_level(logging.ERROR, logger="configcook.dependencies")
+
+    def function(name):
+        time.sleep(0.05)
+        if name in ("a", "b"):
+            raise ValueError("failing {0}".format(name))
+
+    deps = {"a": set(), "b": set(), "c": {"a"}}
+    with pytest.raises(ValueError) as exc:
+        run_parts(["a", "b", "c"], deps, function, jobs=2)
+    assert str(exc.value) == "failing a"
+    # Both failures are reported.
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == [
+        "Part a failed: ValueError: failing a",
+        "Part b failed: ValueError: failing b",
+        "Parts not started: c",
+    ]
+
+
+def test_part_levels():
+    from configcook.dependencies import part_levels
+
+    dependencies = {"a": set(), "b": {"c"}, "c": set(), "d": {"a", "b"}}
+    assert part_levels(["a", "b", "c", "d"], dependencies) == [
+        ["a", "c"],
+        ["b"],
+        ["d"],
+    ]
+    assert part_levels([], {}) == []
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import sys
+
+
+@pytest.fixture
+def site_dir(tmp_path, monkeypatch):
+    """Create a fake site-packages directory as only sys.path entry."""
+    # tmp_path is a pathlib/pathlib2.Path object.
+    site = os.path.join(str(tmp_path), "site-packages")
+    os.mkdir(site)
+    # A distribution with entrypoints.
+    dist_info = os.path.join(site, "my_package-1.2.dist-info")
+    os.mkdir(dist_info)
+    with open(os.path.join(dist_info, "entry_points.txt"), "w") as ep_file:
+        ep_file.write(
+            "[configcook.recipe]\n"
+            "my.package = os.path:join\n"
+            "my.package:special = os:path.join [extra]\n"
+            "\n"
+            "[console_scripts]\n"
+            "my-script = my_package:main\n"
+        )
+    # A development egg, without version in the directory name.
+    egg_info = os.path.join(site, "Other.Package.egg-info")
+    os.mkdir(egg_info)
+    with open(os.path.join(egg_info, "PKG-INFO"), "w") as info_file:
+        info_file.write("Metadata-Version: 1.1\nName: Other.Package\nVersion: 3.0\n")
+    with open(os.path.join(egg_info, "entry_points.txt"), "w") as ep_file:
+        ep_file.write("[configcook.extension]\nother = os:sep\n")
+    monkeypatch.setattr(sys, "path", [site])
+    return site
+
+
+def test_normalize_name():
+    from configcook.entrypoints import normalize_name
+
+    assert normalize_name("foo") == "foo"
+    assert normalize_name("Foo.Bar_baz--qux") == "foo-bar-baz-qux"
+
+
+def test_entrypoint_index(site_dir):
+    from configcook.entrypoints import EntrypointIndex
+
+    index = EntrypointIndex()
+    entrypoint = index.get("configcook.recipe", "my.package")
+    assert entrypoint.name == "my.package"
+    assert entrypoint.group == "configcook.recipe"
+    assert entrypoint.dist_name == "my-package"
+    assert entrypoint.dist_version == "1.2"
+    assert entrypoint.load() is os.path.join
+    assert index.get("configcook.recipe", "my.package:special").load() is os.path.join
+    assert index.get("configcook.recipe", "other") is None
+    assert index.get("configcook.extension", "other").load() == os.sep
+    assert index.get("configcook.extension", "other").dist_version == "3.0"
+    assert index.get("console_scripts", "my-script").value == "my_package:main"
+    assert index.get_distribution_version("My_Package") == "1.2"
+    assert index.get_distribution_version("other.package") == "3.0"
+    assert index.get_distribution_version("configcook") is None
+
+
+def test_entrypoint_index_eggs(site_dir, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.entrypoints import EntrypointIndex
+
+    import zipfile
+
+    # Eggs as Buildout installs them: directories and zip files in sys.path.
+    egg_dir = os.path.join(str(tmp_path), "egg_recipe-2.0-py3.7.egg")
+    os.makedirs(os.path.join(egg_dir, "EGG-INFO"))
+    with open(os.path.join(egg_dir, "EGG-INFO", "entry_points.txt"), "w") as ep_file:
+        ep_file.write("[configcook.recipe]\negg.recipe = os.path:join\n")
+    egg_zip = os.path.join(str(tmp_path), "zipped_extension-0.5-py3.7.egg")
+    with zipfile.ZipFile(egg_zip, "w") as egg:
+        egg.writestr(
+            "EGG-INFO/entry_points.txt", "[configcook.extension]\nzipped = os:sep\n"
+        )
+    sys.path.extend([egg_dir, egg_zip])
+    index = EntrypointIndex()
+    entrypoint = index.get("configcook.recipe", "egg.recipe")
+    assert entrypoint.dist_version == "2.0"
+    assert entrypoint.load() is os.path.join
+    assert index.get("configcook.extension", "zipped").value == "os:sep"
+    assert index.get_distribution_version("zipped-extension") == "0.5"
+    # The normal distributions are still found.
+    assert index.get("configcook.recipe", "my.package").dist_version == "1.2"
+
+
+def test_entrypoint_index_cache(site_dir, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.entrypoints import EntrypointIndex
+
+    cache_file = os.path.join(str(tmp_path), "cache", "entrypoints.json")
+    index = EntrypointIndex(cache_file=cache_file)
+    assert index.get("configcook.recipe", "my.package").dist_version == "1.2"
+    assert not index.from_cache
+    assert os.path.exists(cache_file)
+
+    # A new index loads the cache.
+    index = EntrypointIndex(cache_file=cache_file)
+    entrypoint = index.get("configcook.recipe", "my.package")
+    assert index.from_cache
+    assert entrypoint.dist_version == "1.2"
+    assert entrypoint.load() is os.path.join
+
+    # When the site directory changes, we scan again.
+    new_dist_info = os.path.join(site_dir, "new-1.0.dist-info")
+    os.mkdir(new_dist_info)
+    # Make sure the modification time is different.
+    stat = os.stat(site_dir)
+    os.utime(site_dir, (stat.st_atime, stat.st_mtime + 10))
+    index = EntrypointIndex(cache_file=cache_file)
+    assert index.get_distribution_version("new") == "1.0"
+    assert not index.from_cache
+
+    # When an entrypoint is missing from the cache, we scan again.
+    index = EntrypointIndex(cache_file=cache_file)
+    assert index.get_distribution_version("new") == "1.0"
+    assert index.from_cache
+    with open(os.path.join(new_dist_info, "entry_points.txt"), "w") as ep_file:
+        ep_file.write("[configcook.recipe]\nnew = os:sep\n")
+    assert index.get("configcook.recipe", "new").load() == os.sep
+    assert not index.from_cache
+
+
+def test_get_validator():
+    from configcook.entrypoints import Entrypoint
+    from configcook.utils import to_int
+
+    class One(Entrypoint):
+        defaults = {"number": {"default": "1", "parser": to_int}}
+
+    class Two(One):
+        pass
+
+    class Three(One):
+        defaults = {"name": {"required": True}}
+
+    validator = One.get_validator()
+    # It is cached on the class.
+    assert One.get_validator() is validator
+    assert One("one", {}, {}).options == {"number": 1}
+    # A subclass with the same defaults gets the same kind of validator.
+    assert Two.get_validator().defaults is One.defaults
+    # A subclass with other defaults gets its own.
+    assert Three.get_validator().defaults is Three.defaults
+    assert One.get_validator() is validator
+    with pytest.raises(ValueError):
+        Three("three", {}, {})
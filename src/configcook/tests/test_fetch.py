@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+
+def test_fetcher(http_server, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.exceptions import ConfigError
+    from configcook.fetch import Fetcher
+
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    http_server.files["/a.toml"] = "a = 1"
+    http_server.files["/b.toml"] = "b = 2"
+    fetcher = Fetcher(cache_directory=cache_dir)
+    url = http_server.url + "/a.toml"
+    assert fetcher.fetch(url) == b"a = 1"
+    assert fetcher.fetch(http_server.url + "/b.toml") == b"b = 2"
+    # The second time, the server tells us that we can use the cache.
+    assert fetcher.fetch(url) == b"a = 1"
+    assert http_server.requests == [
+        ("/a.toml", 200),
+        ("/b.toml", 200),
+        ("/a.toml", 304),
+    ]
+    # All requests used the same connection.
+    assert len(http_server.clients) == 1
+    # When the file changes, we get the new version.
+    http_server.files["/a.toml"] = "a = 2"
+    assert fetcher.fetch(url) == b"a = 2"
+    assert http_server.requests[-1] == ("/a.toml", 200)
+    # Errors.
+    with pytest.raises(ConfigError):
+        fetcher.fetch(http_server.url + "/missing.toml")
+    with pytest.raises(ConfigError):
+        fetcher.fetch("ftp://127.0.0.1/a.toml")
+
+    # In offline mode we only use the cache.
+    count = len(http_server.requests)
+    fetcher = Fetcher(cache_directory=cache_dir, offline=True)
+    assert fetcher.fetch(url) == b"a = 2"
+    with pytest.raises(ConfigError):
+        fetcher.fetch(http_server.url + "/c.toml")
+    assert len(http_server.requests) == count
+
+
+def test_fetcher_server_gone(http_server, tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.exceptions import ConfigError
+    from configcook.fetch import Fetcher
+
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    http_server.files["/a.toml"] = "a = 1"
+    url = http_server.url + "/a.toml"
+    assert Fetcher(cache_directory=cache_dir).fetch(url) == b"a = 1"
+    # Use a port where nothing listens.
+    gone = "http://127.0.0.1:1/a.toml"
+    with pytest.raises(ConfigError):
+        Fetcher(cache_directory=cache_dir, timeout=1).fetch(gone)
+
+
+def test_fetcher_file_url(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.fetch import Fetcher
+
+    path = os.path.join(str(tmp_path), "a.toml")
+    with open(path, "w") as local_file:
+        local_file.write("a = 1")
+    fetcher = Fetcher(cache_directory=os.path.join(str(tmp_path), "cache"))
+    assert fetcher.fetch("file://" + path) == b"a = 1"
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+
+def test_part_signature():
+    from configcook.installed import part_signature as ps
+
+    sig = ps("recipe", "1.0", {"a": 1})
+    assert sig == ps("recipe", "1.0", {"a": 1})
+    assert sig != ps("other", "1.0", {"a": 1})
+    assert sig != ps("recipe", "1.1", {"a": 1})
+    assert sig != ps("recipe", "1.0", {"a": 2})
+    assert sig != ps("recipe", "1.0", {"a": 1, "b": 1})
+    # The order of the options does not matter.
+    assert ps("recipe", "1.0", {"a": 1, "b": 2}) == ps(
+        "recipe", "1.0", {"b": 2, "a": 1}
+    )
+
+
+def test_installed_state(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.installed import InstalledState
+
+    path = os.path.join(str(tmp_path), "installed.json")
+    state = InstalledState(path)
+    assert state.parts == {}
+    assert not state.is_installed("a", "sig")
+    # Nothing is written until we set something.
+    assert not os.path.exists(path)
+    state.set("a", "sig", "configcook:commands", "1.0")
+    assert state.is_installed("a", "sig")
+    assert not state.is_installed("a", "other")
+    with open(path) as state_file:
+        assert json.load(state_file) == {
+            "parts": {
+                "a": {
+                    "recipe": "configcook:commands",
+                    "signature": "sig",
+                    "version": "1.0",
+                }
+            }
+        }
+    # No temporary files are left behind.
+    assert os.listdir(str(tmp_path)) == ["installed.json"]
+
+    # A new state object reads the file.
+    state = InstalledState(path)
+    assert state.is_installed("a", "sig")
+    state.set("b", "sig")
+    state.remove("a", "c")
+    assert not state.is_installed("a", "sig")
+    assert InstalledState(path).parts == {
+        "b": {"recipe": "", "signature": "sig", "version": ""}
+    }
+
+
+def test_installed_state_invalid(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.installed import InstalledState
+
+    path = os.path.join(str(tmp_path), "installed.json")
+    for contents in ("", "[]", "{}", "not json"):
+        with open(path, "w") as state_file:
+            state_file.write(contents)
+        assert InstalledState(path).parts == {}
+
+
+def test_installed_state_durations(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.installed import InstalledState
+
+    path = os.path.join(str(tmp_path), "installed.json")
+    state = InstalledState(path)
+    assert state.get_duration("a", "install") is None
+    state.set_duration("a", "install", 1.5)
+    state.set("a", "sig")
+    state.set_duration("a", "update", 0.1)
+    state.save()
+    state = InstalledState(path)
+    assert state.get_duration("a", "install") == 1.5
+    assert state.get_duration("a", "update") == 0.1
+    # When an install fails, we keep the durations.
+    state.remove("a")
+    assert not state.is_installed("a", "sig")
+    assert InstalledState(path).get_duration("a", "install") == 1.5
+    # For a part that is no longer in the parts list, we forget them.
+    state.forget("a")
+    assert state.get_duration("a", "install") is None
+    assert InstalledState(path).durations == {}
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+from argparse import Namespace
+
+import pytest
+
+
+def make_cook(config, **options):
+    from configcook.config import ConfigCookConfig
+    from configcook.main import ConfigCook
+
+    defaults = {
+        "configfile": "cc.toml",
+        "config_cache": False,
+        "debug": False,
+        "force_pip": False,
+        "jobs": 1,
+        "no_packages": False,
+        "offline": False,
+        "use_async": False,
+        "verbose": False,
+    }
+    defaults.update(options)
+    cook = ConfigCook(Namespace(**defaults))
+    cook.config = ConfigCookConfig(config)
+    cook.pip_calls = []
+
+    def pip(*args):
+        cook.pip_calls.append(args)
+
+    cook.pip = pip
+    return cook
+
+
+def test_install_planned_packages():
+    config = {
+        "configcook": {
+            "extensions": ["configcook:pdb", "configcook_no_such_extension"],
+            "parts": ["one", "two", "three"],
+        },
+        "configcook_pdb": {"packages": ["configcook_extension_package"]},
+        "one": {"recipe": "configcook:commands", "packages": "six toml"},
+        "two": {"recipe": "configcook_no_such_recipe:special", "eggs": ["egg"]},
+        "three": {"recipe": "configcook:packages", "packages": ["egg"]},
+    }
+    cook = make_cook(config)
+    cook._install_planned_packages()
+    # Only one pip call, and only for packages that we do not have yet.
+    assert cook.pip_calls == [
+        (
+            "install",
+            "configcook_extension_package",
+            "configcook_no_such_extension",
+            "configcook_no_such_recipe",
+            "egg",
+        )
+    ]
+    # The packages are not installed a second time.
+    cook._install_packages("egg", "configcook_no_such_recipe")
+    assert len(cook.pip_calls) == 1
+
+
+def test_install_planned_packages_extensions_first(monkeypatch):
+    from configcook import main
+    from configcook.utils import HookTable
+
+    config = {
+        "configcook": {
+            "extensions": ["configcook_no_such_extension"],
+            "parts": ["one"],
+            "pip": "pip",
+        },
+        "one": {"recipe": "configcook_no_such_recipe"},
+    }
+    cook = make_cook(config)
+    cook._install_planned_packages(recipes=False)
+    assert cook.pip_calls == [("install", "configcook_no_such_extension")]
+
+    # After loading the extensions, their pip hooks are called for recipes.
+    calls = []
+
+    class Extension(object):
+        def run_before(self, function_name, instance, *args):
+            calls.append(("before", function_name) + args)
+
+    monkeypatch.setattr(main, "call_or_fail", lambda cmd: calls.append(cmd))
+    cook = make_cook(config)
+    del cook.pip
+    cook.hooks = HookTable([Extension()])
+    cook._install_planned_packages(extensions=False)
+    assert calls == [
+        ("before", "pip", "install", "configcook_no_such_recipe"),
+        ["pip", "install", "configcook_no_such_recipe"],
+    ]
+
+
+def test_install_planned_packages_nothing_to_do():
+    config = {
+        "configcook": {"extensions": ["configcook:pdb"], "parts": ["one"]},
+        "one": {"recipe": "configcook:commands", "packages": "six toml"},
+    }
+    cook = make_cook(config)
+    cook._install_planned_packages()
+    assert cook.pip_calls == []
+    # Same with --force-pip.
+    cook = make_cook(config, force_pip=True)
+    cook._install_planned_packages()
+    assert cook.pip_calls == [("install", "six", "toml")]
+    # With --no-packages we do not even look.
+    config["one"]["packages"] = ["configcook_no_such_package"]
+    cook = make_cook(config, no_packages=True)
+    cook._install_planned_packages()
+    assert cook.pip_calls == []
+
+
+def test_find_entrypoint():
+    from configcook.exceptions import ConfigCookError
+
+    cook = make_cook({"configcook": {}})
+    entrypoint = cook._find_recipe_entrypoint("configcook:commands")
+    assert entrypoint.name == "configcook:commands"
+    # When the package is installed but the entrypoint is not there,
+    # we do not try to install it.
+    with pytest.raises(ConfigCookError):
+        cook._find_recipe_entrypoint("configcook:no_such_recipe")
+    assert cook.pip_calls == []
+    # When the package is not there, we try to install it, once.
+    with pytest.raises(ConfigCookError):
+        cook._find_recipe_entrypoint("configcook_no_such_package:recipe")
+    assert cook.pip_calls == [("install", "configcook_no_such_package")]
+
+
+def test_run_recipes_async(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+
+    import asyncio
+    import os
+
+    calls = []
+
+    class AsyncRecipe(BaseRecipe):
+        @entrypoint_function
+        async def install(self):
+            await asyncio.sleep(0.01)
+            calls.append(("install", self.name))
+
+        @entrypoint_function
+        async def update(self):
+            calls.append(("update", self.name))
+
+    class SyncRecipe(BaseRecipe):
+        @entrypoint_function
+        def install(self):
+            calls.append(("install", self.name))
+
+    installed = os.path.join(str(tmp_path), ".installed.json")
+    config = {
+        "configcook": {"parts": ["one", "two"], "installed": installed},
+        "one": {"recipe": "async"},
+        "two": {"recipe": "sync", "option": "${one:recipe}"},
+    }
+    for _run in range(2):
+        cook = make_cook(config, use_async=True, jobs=2)
+        cook._part_names = ["one", "two"]
+        cook._part_dependencies = {"one": set(), "two": {"one"}}
+        cook.recipes = [
+            AsyncRecipe("one", cook.config, config["one"]),
+            SyncRecipe("two", cook.config, config["two"]),
+        ]
+        cook.run_recipes()
+    assert calls == [
+        ("install", "one"),
+        ("install", "two"),
+        ("update", "one"),
+    ]
+
+
+def test_run_recipes_async_methods_without_async_option(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+
+    import asyncio
+    import os
+
+    calls = []
+
+    class AsyncRecipe(BaseRecipe):
+        @entrypoint_function
+        async def install(self):
+            await asyncio.sleep(0)
+            calls.append(("install", self.name))
+
+    installed = os.path.join(str(tmp_path), ".installed.json")
+    config = {
+        "configcook": {"parts": ["one", "two"], "installed": installed},
+        "one": {"recipe": "async"},
+        "two": {"recipe": "async"},
+    }
+    cook = make_cook(config, jobs=2)
+    cook._part_names = ["one", "two"]
+    cook._part_dependencies = {"one": set(), "two": set()}
+    cook.recipes = [
+        AsyncRecipe("one", cook.config, config["one"]),
+        AsyncRecipe("two", cook.config, config["two"]),
+    ]
+    cook.run_recipes()
+    # The coroutines were awaited, not only created.
+    assert sorted(calls) == [("install", "one"), ("install", "two")]
+    assert sorted(cook.installed.parts) == ["one", "two"]
+
+
+def test_run_recipes_async_part_hooks_with_async_option(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+    from configcook.utils import HookTable
+
+    import asyncio
+    import os
+
+    calls = []
+
+    class AsyncExtension(object):
+        def subscriptions(self):
+            return {"run_before": ["run_part"], "run_after": ["run_part"]}
+
+        async def run_before(self, function_name, instance, name):
+            await asyncio.sleep(0)
+            calls.append(("before", name))
+
+        async def run_after(self, function_name, instance, name):
+            await asyncio.sleep(0)
+            calls.append(("after", name))
+
+    class Recipe(BaseRecipe):
+        @entrypoint_function
+        def install(self):
+            calls.append(("install", self.name))
+
+    installed = os.path.join(str(tmp_path), ".installed.json")
+    config = {
+        "configcook": {"parts": ["one"], "installed": installed},
+        "one": {"recipe": "sync"},
+    }
+    cook = make_cook(config, use_async=True)
+    cook.hooks = HookTable([AsyncExtension()])
+    cook._part_names = ["one"]
+    cook._part_dependencies = {"one": set()}
+    cook.recipes = [Recipe("one", cook.config, config["one"])]
+    # This must not try to start an event loop inside the running loop.
+    cook.run_recipes()
+    assert calls == [("before", "one"), ("install", "one"), ("after", "one")]
+    assert list(cook.installed.parts) == ["one"]
+
+
+def test_run_recipes_keeps_durations_on_failure(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.installed import InstalledState
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+
+    import os
+
+    class Recipe(BaseRecipe):
+        @entrypoint_function
+        def install(self):
+            if self.options.get("fail"):
+                raise ValueError("failed")
+
+    installed = os.path.join(str(tmp_path), ".installed.json")
+    config = {
+        "configcook": {"parts": ["one", "two"], "installed": installed},
+        "one": {"recipe": "test"},
+        "two": {"recipe": "test"},
+    }
+
+    def run(config):
+        cook = make_cook(config)
+        cook._part_names = ["one", "two"]
+        cook._part_dependencies = {"one": set(), "two": {"one"}}
+        cook.recipes = [
+            Recipe("one", cook.config, config["one"]),
+            Recipe("two", cook.config, config["two"]),
+        ]
+        cook.run_recipes()
+
+    run(config)
+    state = InstalledState(installed)
+    assert sorted(state.durations) == ["one", "two"]
+    # Part one is updated, and the changed part two fails to install.
+    config["two"] = {"recipe": "test", "fail": True}
+    with pytest.raises(ValueError):
+        run(config)
+    state = InstalledState(installed)
+    assert list(state.parts) == ["one"]
+    # The durations are saved, and the failed part keeps its old ones.
+    assert state.get_duration("one", "update") is not None
+    assert state.get_duration("two", "install") is not None
+
+
+def test_run_recipes_profile_on_failure(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.extensions import ProfileExtension
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+    from configcook.utils import HookTable
+
+    import os
+    import sys
+
+    class Recipe(BaseRecipe):
+        @entrypoint_function
+        def install(self):
+            raise ValueError("failed")
+
+    directory = os.path.join(str(tmp_path), "profiles")
+    config = {
+        "configcook": {
+            "parts": ["one"],
+            "installed": os.path.join(str(tmp_path), ".installed.json"),
+        },
+        "one": {"recipe": "test"},
+    }
+    for options, filename in [
+        ({"functions": ["run_recipes"]}, "run_recipes.pstats"),
+        ({"parts": ["one"]}, "part-one.pstats"),
+    ]:
+        options["directory"] = directory
+        cook = make_cook(config)
+        cook.hooks = HookTable(
+            [ProfileExtension("configcook:profile", cook.config, options)]
+        )
+        cook._part_names = ["one"]
+        cook._part_dependencies = {"one": set()}
+        cook.recipes = [Recipe("one", cook.config, config["one"])]
+        with pytest.raises(ValueError):
+            cook.run_recipes()
+        # The profiler is stopped, and the profile is written.
+        assert sys.getprofile() is None
+        assert os.path.exists(os.path.join(directory, filename))
+
+
+def test_load_recipes_reports_all_errors():
+    from configcook.exceptions import ConfigError
+
+    config = {
+        "configcook": {"parts": ["ok", "commands", "template", "missing"]},
+        "ok": {"recipe": "configcook:commands", "commands": ["true"]},
+        "commands": {"recipe": "configcook:commands", "jobs": "many"},
+        "template": {"recipe": "configcook:template", "input": "text"},
+    }
+    cook = make_cook(config)
+    with pytest.raises(ConfigError) as exc:
+        cook.load_recipes()
+    lines = str(exc.value).splitlines()
+    assert lines == [
+        "Found 4 errors in parts:",
+        "[commands] Option commands is missing.",
+        "[commands] Option jobs must be of type {0}. Got type: {1} (many).".format(
+            (int,), str
+        ),
+        "[template] Option output is missing.",
+        "[configcook] parts option has missing, "
+        "but this is missing from the sections.",
+    ]
+
+
+def test_next_run_skips_unchanged_parts(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.recipes import BaseRecipe
+    from configcook.utils import entrypoint_function
+
+    import os
+
+    calls = []
+
+    class Recipe(BaseRecipe):
+        @entrypoint_function
+        def install(self):
+            calls.append(("install", self.name))
+
+        @entrypoint_function
+        def update(self):
+            calls.append(("update", self.name))
+
+    installed = os.path.join(str(tmp_path), ".installed.json")
+    config = {
+        "configcook": {"parts": ["one", "two"], "installed": installed},
+        "one": {"recipe": "recipe"},
+        "two": {"recipe": "recipe", "value": 1},
+    }
+
+    def run(cook):
+        cook._part_names = ["one", "two"]
+        cook._part_dependencies = {"one": set(), "two": set()}
+        cook.recipes = [
+            Recipe(name, cook.config, dict(config[name])) for name in ("one", "two")
+        ]
+        cook.run_recipes()
+
+    cook = make_cook(config)
+    run(cook)
+    run(make_cook(config))
+    # In the next run, only the changed part runs.
+    config["two"]["value"] = 2
+    next_cook = cook.next_run()
+    next_cook.config = make_cook(config).config
+    run(next_cook)
+    assert calls == [
+        ("install", "one"),
+        ("install", "two"),
+        ("update", "one"),
+        ("update", "two"),
+        ("install", "two"),
+    ]
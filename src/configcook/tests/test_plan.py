@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+
+def test_plan_estimate():
+    from configcook.plan import PartPlan
+    from configcook.plan import Plan
+
+    plan = Plan()
+    plan.parts = [
+        PartPlan("a", "recipe", "install", estimate=1.0),
+        PartPlan("b", "recipe", "install", estimate=2.0),
+        PartPlan("c", "recipe", "update", estimate=0.5),
+        PartPlan("d", "recipe", "install"),
+    ]
+    plan.dependencies = {"a": set(), "b": set(), "c": {"a"}, "d": {"b", "c"}}
+    # One part after another.
+    assert plan.estimate() == 3.5
+    # a and b at the same time, c after a, d after b.
+    plan.jobs = 2
+    assert plan.estimate() == 2.0
+    assert plan.levels() == [["a", "b"], ["c"], ["d"]]
+    lines = plan.format_lines()
+    assert "    d [recipe]: install, no estimate, after b, c" in lines
+    assert lines[-1] == (
+        "Estimated duration: 2.000 seconds with 2 job(s). No estimate for: d."
+    )
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from subprocess import CalledProcessError
+
+import logging
+import os
+import pytest
+import sys
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_command_logs_lines(caplog):
+    from configcook.process import run_command
+
+    caplog.set_level(logging.INFO, logger="configcook.process")
+    code = "import sys; print('out1'); sys.stderr.write('err1\\n'); print('out2')"
+    result = run_command(python_command(code))
+    assert result.returncode == 0
+    assert result.output is None
+    assert result.errors is None
+    messages = [
+        record.getMessage()
+        for record in caplog.records
+        if record.levelno == logging.INFO
+    ]
+    assert sorted(messages) == ["err1", "out1", "out2"]
+    # Lines from one pipe keep their order.
+    assert messages.index("out1") < messages.index("out2")
+
+
+def test_run_command_capture(caplog):
+    from configcook.process import run_command
+
+    caplog.set_level(logging.INFO, logger="configcook.process")
+    code = "import sys; print('out'); sys.stderr.write('err\\n')"
+    result = run_command(python_command(code), capture_output=True)
+    assert result.output.splitlines() == [b"out"]
+    assert result.errors is None
+    # Captured lines are not logged.
+    messages = [record.getMessage() for record in caplog.records]
+    assert "out" not in messages
+    assert "err" in messages
+    result = run_command(
+        python_command(code), capture_output=True, capture_errors=True
+    )
+    assert result.output.splitlines() == [b"out"]
+    assert result.errors.splitlines() == [b"err"]
+
+
+def test_run_command_long_output():
+    from configcook.process import MAX_LINE_LENGTH
+    from configcook.process import MAX_QUEUED_LINES
+    from configcook.process import run_command
+
+    # More lines than fit in the queue, and a line that is too long
+    # to read in one go.
+    code = (
+        "import sys\n"
+        "for i in range({0}): print(i)\n"
+        "sys.stderr.write('x' * {1} + '\\n')\n"
+    ).format(MAX_QUEUED_LINES * 3, MAX_LINE_LENGTH * 2)
+    result = run_command(
+        python_command(code), capture_output=True, capture_errors=True, log=False
+    )
+    assert result.output.splitlines() == [
+        str(i).encode("ascii") for i in range(MAX_QUEUED_LINES * 3)
+    ]
+    assert result.errors == b"x" * MAX_LINE_LENGTH * 2 + b"\n"
+
+
+def test_run_command_log_file(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.process import run_command
+
+    log_file = os.path.join(str(tmp_path), "part.log")
+    code = "import sys; print('out'); sys.stderr.write('err\\n')"
+    run_command(python_command(code), log_file=log_file, log=False)
+    run_command(python_command("print('again')"), log_file=log_file, log=False)
+    with open(log_file) as myfile:
+        lines = myfile.read().splitlines()
+    assert sorted(lines[:2]) == ["err", "out"]
+    assert lines[2:] == ["again"]
+
+
+def test_run_command_check():
+    from configcook.process import run_command
+
+    code = "import sys; print('bad'); sys.exit(3)"
+    assert run_command(python_command(code), log=False).returncode == 3
+    with pytest.raises(CalledProcessError) as exc:
+        run_command(python_command(code), capture_output=True, check=True)
+    assert exc.value.returncode == 3
+    assert exc.value.output.splitlines() == [b"bad"]
+
+
+def test_run_command_timeout():
+    from configcook.exceptions import CommandTimeoutError
+    from configcook.process import run_command
+
+    code = "import time; print('start'); time.sleep(30)"
+    with pytest.raises(CommandTimeoutError):
+        run_command(python_command(code), timeout=0.5)
+    # A fast command is fine.
+    assert run_command(python_command("pass"), timeout=30).returncode == 0
+
+
+def test_run_command_cancel():
+    from configcook.process import run_command
+
+    import threading
+
+    cancel = threading.Event()
+    timer = threading.Timer(0.3, cancel.set)
+    timer.start()
+    code = "import time\nwhile True:\n    print('busy')\n    time.sleep(0.01)"
+    result = run_command(python_command(code), cancel=cancel, log=False)
+    assert result.returncode != 0
+    assert result.duration < 10
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+from subprocess import CalledProcessError
+
+import logging
+import os
+import pytest
+import time
+
+
+def make_recipe(tmp_path, **options):
+    from configcook.recipes import CommandsRecipe
+
+    options.setdefault("recipe", "configcook:commands")
+    options.setdefault("log-file", os.path.join(str(tmp_path), "commands.log"))
+    return CommandsRecipe("commands", {}, options)
+
+
+def read_log(tmp_path):
+    with open(os.path.join(str(tmp_path), "commands.log")) as log_file:
+        return log_file.read()
+
+
+def test_commands_quoting(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    recipe = make_recipe(
+        tmp_path,
+        commands="""
+            echo "This is a listing:"
+
+            echo 'a  b' c
+            echo one | tr o O
+        """,
+    )
+    assert recipe.commands == [
+        ["echo", "This is a listing:"],
+        ["echo", "a  b", "c"],
+        ["/bin/sh", "-c", "echo one | tr o O"],
+    ]
+    recipe.install()
+    assert read_log(tmp_path) == "This is a listing:\na  b c\nOne\n"
+    # A list of arguments is used as is.
+    recipe = make_recipe(tmp_path, commands=[["echo", "a |"], "echo b"])
+    assert recipe.commands == [["echo", "a |"], ["echo", "b"]]
+
+
+def test_commands_plan(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    recipe = make_recipe(tmp_path, commands=["echo 'a b'", "true"])
+    assert recipe.plan() == ["echo 'a b'", "true"]
+    # Update does nothing.
+    assert recipe.plan("update") == []
+
+
+def test_commands_unbalanced_quote(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.exceptions import ConfigError
+
+    with pytest.raises(ConfigError) as exc:
+        make_recipe(tmp_path, commands=["echo ok", "echo it's"])
+    assert "Part commands has an invalid command in the commands option" in str(
+        exc.value
+    )
+
+
+def test_commands_without_spaces(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    output = os.path.join(str(tmp_path), "out.txt")
+    recipe = make_recipe(tmp_path, commands=["echo hi>{0}".format(output), "FOO=1 env"])
+    recipe.install()
+    with open(output) as output_file:
+        assert output_file.read() == "hi\n"
+    assert "FOO=1\n" in read_log(tmp_path)
+
+
+def test_commands_timing(tmp_path, caplog):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    caplog.set_level(logging.INFO, logger="configcook.recipes")
+    make_recipe(tmp_path, commands=["echo 'a b'"]).install()
+    messages = [record.getMessage() for record in caplog.records]
+    assert len(messages) == 1
+    assert messages[0].startswith("Part commands: command finished in ")
+    assert messages[0].endswith(" seconds: echo 'a b'")
+
+
+def test_commands_parallel(tmp_path, caplog):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    caplog.set_level(logging.INFO)
+    commands = [
+        "sh -c 'sleep 0.3; echo one'",
+        "sh -c 'echo two; sleep 0.3'",
+        "sh -c 'sleep 0.1; echo three'",
+    ]
+    start = time.time()
+    make_recipe(tmp_path, commands=commands, parallel=True).install()
+    assert time.time() - start < 0.8
+    assert sorted(read_log(tmp_path).split()) == ["one", "three", "two"]
+    # The output is shown in the order of the commands.
+    output = [
+        record.getMessage()
+        for record in caplog.records
+        if record.name == "configcook.process"
+    ]
+    assert output == ["one", "two", "three"]
+    # With one job, the commands run one after another.
+    start = time.time()
+    make_recipe(tmp_path, commands=commands, jobs=1).install()
+    assert time.time() - start >= 0.7
+    # Two jobs.
+    start = time.time()
+    make_recipe(tmp_path, commands=commands, jobs=2).install()
+    assert 0.3 <= time.time() - start < 0.8
+
+
+def test_commands_parallel_fail_fast(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    commands = ["sleep 10", "sh -c 'sleep 0.2; exit 3'", "sleep 10", "echo skipped"]
+    recipe = make_recipe(tmp_path, commands=commands, jobs=3)
+    start = time.time()
+    with pytest.raises(CalledProcessError) as exc:
+        recipe.install()
+    # The other commands were stopped.
+    assert time.time() - start < 5
+    assert exc.value.returncode == 3
+    assert "skipped" not in read_log(tmp_path)
+
+
+def test_template_unchanged(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.recipes import TemplateRecipe
+
+    output = os.path.join(str(tmp_path), "output.txt")
+    config = {"settings": {"name": "World"}}
+    options = {
+        "recipe": "configcook:template",
+        "input": "Hello ${settings:name}",
+        "output": output,
+    }
+    recipe = TemplateRecipe("template", config, dict(options))
+    recipe.install()
+    assert recipe.written == [output]
+    with open(output) as myfile:
+        assert myfile.read() == "Hello World"
+    os.utime(output, (1000, 1000))
+    # Nothing has changed, so we do not touch the file.
+    recipe.install()
+    assert recipe.written == []
+    assert recipe.unchanged == [output]
+    assert os.stat(output).st_mtime == 1000
+    # Update restores a removed file.
+    os.remove(output)
+    recipe.update()
+    assert recipe.written == [output]
+    config["settings"]["name"] = "Universe"
+    recipe = TemplateRecipe("template", config, dict(options))
+    recipe.install()
+    with open(output) as myfile:
+        assert myfile.read() == "Hello Universe"
+
+
+def test_template_input_file_foreach(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.config import ConfigCookConfig
+    from configcook.exceptions import ConfigError
+    from configcook.recipes import TemplateRecipe
+
+    tempdir = str(tmp_path)
+    template_path = os.path.join(tempdir, "vhost.conf.in")
+    with open(template_path, "w") as myfile:
+        myfile.write(
+            "server {\n"
+            "    listen ${nginx:port};\n"
+            "    server_name ${item.name};\n"
+            "    root ${item.root};\n"
+            "}  # ${index}\n"
+        )
+    config = ConfigCookConfig(
+        {
+            "nginx": {"port": 80},
+            "sites": {
+                "all": [
+                    {"name": "example.org", "root": "/srv/example"},
+                    {"name": "example.com", "root": "/srv/com"},
+                ]
+            },
+            "vhosts": {
+                "recipe": "configcook:template",
+                "input-file": template_path,
+                "output": os.path.join(tempdir, "${item.name}.conf"),
+                "foreach": "${sites:all}",
+            },
+        }
+    )
+    config.substitute_all()
+    recipe = TemplateRecipe("vhosts", config, dict(config["vhosts"]))
+    recipe.install()
+    output = os.path.join(tempdir, "example.org.conf")
+    assert recipe.written == [output, os.path.join(tempdir, "example.com.conf")]
+    with open(output) as myfile:
+        assert myfile.read() == (
+            "server {\n"
+            "    listen 80;\n"
+            "    server_name example.org;\n"
+            "    root /srv/example;\n"
+            "}  # 0\n"
+        )
+    recipe.install()
+    assert recipe.written == []
+    assert len(recipe.unchanged) == 2
+
+    # Inline input with a list of strings.
+    options = {
+        "recipe": "configcook:template",
+        "input": "Hello ${item} from ${nginx:port}",
+        "output": os.path.join(tempdir, "hello-${index}.txt"),
+        "foreach": ["World", "Universe"],
+    }
+    recipe = TemplateRecipe("hello", config, dict(options))
+    recipe.install()
+    with open(os.path.join(tempdir, "hello-1.txt")) as myfile:
+        assert myfile.read() == "Hello Universe from 80"
+
+    # Errors
+    options["output"] = os.path.join(tempdir, "hello.txt")
+    recipe = TemplateRecipe("hello", config, dict(options))
+    with pytest.raises(ConfigError):
+        # Same output file for both items.
+        recipe.install()
+    options["input-file"] = template_path
+    recipe = TemplateRecipe("hello", config, dict(options))
+    with pytest.raises(ConfigError):
+        # input and input-file
+        recipe.install()
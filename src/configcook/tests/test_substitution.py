@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def test_template():
+    from configcook.substitution import Template
+
+    template = Template("")
+    assert template.segments == ()
+    assert template.references == ()
+    template = Template("no references")
+    assert template.segments == ("no references",)
+    assert template.render(None) == "no references"
+    template = Template("${a:b}")
+    assert template.segments == (("a", "b"),)
+    assert template.references == (("a", "b"),)
+    template = Template("x ${a:b} y ${:c}${d:e}")
+    assert template.segments == ("x ", ("a", "b"), " y ", ("", "c"), ("d", "e"))
+    assert template.references == (("a", "b"), ("", "c"), ("d", "e"))
+    assert template.get_references(current_part="p") == [
+        ("a", "b"),
+        ("p", "c"),
+        ("d", "e"),
+    ]
+
+    def lookup(part, option):
+        return {"b": "one", "c": 2, "e": ["three"]}[option]
+
+    assert template.render(lookup) == "x one y 2['three']"
+    # A reference without colon is not a reference.
+    assert Template("${a} ${b:c}").references == (("b", "c"),)
+
+
+def test_compile_template():
+    from configcook.substitution import compile_template
+
+    template = compile_template("${a:b}")
+    assert compile_template("${a:b}") is template
+    assert compile_template("${a:c}") is not template
+
+
+def test_template_variables():
+    from configcook.exceptions import ConfigError
+    from configcook.substitution import Template
+    from configcook.substitution import Variable
+
+    template = Template("${a:b} ${item} ${item.name} ${other} ${index}", ["index", "item"])
+    assert template.segments == (
+        ("a", "b"),
+        " ",
+        Variable("item"),
+        " ",
+        Variable("item", "name"),
+        " ${other} ",
+        Variable("index"),
+    )
+    assert template.references == (("a", "b"),)
+
+    def lookup(part, option):
+        return "B"
+
+    variables = {"item": {"name": "x"}, "index": 2}
+    assert template.render(lookup, variables=variables) == (
+        "B {'name': 'x'} x ${other} 2"
+    )
+    # A single variable keeps its type.
+    assert Template("${item}", ["item"]).render(lookup, variables=variables) == {
+        "name": "x"
+    }
+    # Without variable names, these are just text.
+    assert Template("${item}").render(lookup) == "${item}"
+    with pytest.raises(ConfigError):
+        template.render(lookup, variables={"index": 1})
+    with pytest.raises(ConfigError):
+        template.render(lookup, variables={"index": 1, "item": "no keys"})
+
+
+def test_compile_file_template(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.substitution import compile_file_template
+
+    import os
+
+    path1 = os.path.join(str(tmp_path), "one.txt")
+    path2 = os.path.join(str(tmp_path), "two.txt")
+    for path in (path1, path2):
+        with open(path, "w") as myfile:
+            myfile.write("${a:b} ${item}")
+    template = compile_file_template(path1)
+    assert template.segments == (("a", "b"), " ${item}")
+    assert compile_file_template(path1) is template
+    # Same contents, same template.
+    assert compile_file_template(path2) is template
+    # Other variables, other template.
+    with_item = compile_file_template(path1, ("item",))
+    assert with_item is not template
+    assert with_item.segments[-1].name == "item"
+    # Changed contents, new template.
+    with open(path1, "w") as myfile:
+        myfile.write("${a:c} and more")
+    assert compile_file_template(path1).segments == (("a", "c"), " and more")
+    assert compile_file_template(path2) is template
+
+
+def test_resolver_order():
+    from configcook.substitution import Resolver
+
+    # Chained references are resolved, regardless of order.
+    config = {
+        "A": {"a": "${B:b}"},
+        "B": {"b": "${C:c} and ${:c}", "c": "bee"},
+        "C": {"c": "${:d}", "d": "sea"},
+    }
+    resolver = Resolver(config)
+    assert resolver.get("A", "a") == "sea and bee"
+    assert resolver.render("${A:a}!") == "sea and bee!"
+    assert resolver.render("${:d}", current_part="C") == "sea"
+    assert resolver.render(1) == 1
+    # The config has not been changed yet.
+    assert config["A"]["a"] == "${B:b}"
+    resolver.resolve_all()
+    assert config == {
+        "A": {"a": "sea and bee"},
+        "B": {"b": "sea and bee", "c": "bee"},
+        "C": {"c": "sea", "d": "sea"},
+    }
+
+
+def test_resolver_errors():
+    from configcook.exceptions import ConfigError
+    from configcook.substitution import Resolver
+
+    config = {
+        "A": {"a": "${B:b}", "self": "${:self}", "missing": "${B:missing}"},
+        "B": {"b": "${C:c}"},
+        "C": {"c": "${A:a}"},
+    }
+    resolver = Resolver(config)
+    with pytest.raises(ConfigError) as exc:
+        resolver.get("A", "a")
+    assert "${A:a} -> ${B:b} -> ${C:c} -> ${A:a}" in str(exc.value)
+    with pytest.raises(ConfigError) as exc:
+        resolver.get("A", "self")
+    assert "${A:self} -> ${A:self}" in str(exc.value)
+    with pytest.raises(ConfigError) as exc:
+        resolver.get("A", "missing")
+    assert "${B:missing}" in str(exc.value)
+    with pytest.raises(ConfigError):
+        resolver.get("D", "d")
+
+
+def test_resolver_long_chain():
+    from configcook.substitution import Resolver
+
+    # This would hit the recursion limit if we used recursion.
+    length = 5000
+    section = dict(("o{0}".format(i), "${:o%d}" % (i + 1)) for i in range(length))
+    section["o{0}".format(length)] = "end"
+    resolver = Resolver({"A": section})
+    assert resolver.get("A", "o0") == "end"
+
+
+def test_frozen_list():
+    from configcook.substitution import FrozenList
+    from copy import copy
+    from copy import deepcopy
+
+    import pickle
+
+    frozen = FrozenList(["a", "b"])
+    assert frozen == ["a", "b"]
+    assert isinstance(frozen, list)
+    for change in (
+        lambda: frozen.append("c"),
+        lambda: frozen.extend(["c"]),
+        lambda: frozen.insert(0, "c"),
+        lambda: frozen.pop(),
+        lambda: frozen.remove("a"),
+        lambda: frozen.sort(),
+        lambda: frozen.reverse(),
+        lambda: frozen.__setitem__(0, "c"),
+        lambda: frozen.__delitem__(0),
+        lambda: frozen.__iadd__(["c"]),
+    ):
+        with pytest.raises(TypeError):
+            change()
+    assert frozen == ["a", "b"]
+    # Making a copy is fine.
+    assert frozen + ["c"] == ["a", "b", "c"]
+    assert list(frozen) == ["a", "b"]
+    for new in (copy(frozen), deepcopy(frozen), pickle.loads(pickle.dumps(frozen))):
+        assert new == frozen
+        assert isinstance(new, FrozenList)
+
+
+def test_freeze():
+    from configcook.substitution import freeze
+    from configcook.substitution import FrozenDict
+    from configcook.substitution import FrozenList
+
+    assert freeze(1) == 1
+    assert freeze("a") == "a"
+    frozen = freeze([1, [2], {"a": [3]}])
+    assert frozen == [1, [2], {"a": [3]}]
+    assert isinstance(frozen, FrozenList)
+    assert isinstance(frozen[1], FrozenList)
+    assert isinstance(frozen[2], FrozenDict)
+    assert isinstance(frozen[2]["a"], FrozenList)
+    with pytest.raises(TypeError):
+        frozen[2]["b"] = 1
+    with pytest.raises(TypeError):
+        frozen[2].update({"b": 1})
+    assert freeze(frozen) is frozen
+
+
+def test_resolver_native_types():
+    from configcook.substitution import FrozenList
+    from configcook.substitution import Resolver
+
+    parts = ["one", "two"]
+    config = {
+        "configcook": {
+            "parts": parts,
+            "copy_parts": "${:parts}",
+            "more_parts": "${:copy_parts}",
+            "text": "Parts: ${:parts}",
+            "number": 42,
+            "copy_number": "${:number}",
+            "switch": True,
+            "copy_switch": "${:switch}",
+        }
+    }
+    Resolver(config).resolve_all()
+    ccc = config["configcook"]
+    # A whole value reference gives the same object, not a string.
+    assert ccc["copy_parts"] == parts
+    assert isinstance(ccc["copy_parts"], FrozenList)
+    assert ccc["copy_parts"] is ccc["parts"]
+    assert ccc["more_parts"] is ccc["parts"]
+    assert ccc["copy_number"] == 42
+    assert ccc["copy_switch"] is True
+    # Within a text, we interpolate.
+    assert ccc["text"] == "Parts: ['one', 'two']"
+    # The original list is not changed.
+    assert parts == ["one", "two"]
+    assert not isinstance(parts, FrozenList)
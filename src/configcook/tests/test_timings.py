@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import time
+
+
+def test_measure_without_recorder():
+    from configcook import timings
+
+    assert timings.get_recorder() is None
+    with timings.measure("phase", "nothing"):
+        pass
+    assert timings.stop() is None
+
+
+def test_timings(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook import timings
+
+    recorder = timings.start()
+    try:
+        assert timings.get_recorder() is recorder
+        with timings.measure("phase", "slow"):
+            time.sleep(0.05)
+        for _i in range(3):
+            with timings.measure("part", "fast"):
+                pass
+        try:
+            with timings.measure("part", "error"):
+                raise ValueError
+        except ValueError:
+            pass
+    finally:
+        assert timings.stop() is recorder
+    assert timings.get_recorder() is None
+    assert len(recorder.records) == 5
+    summary = recorder.summary()
+    assert [item[:3] for item in summary][0] == ("phase", "slow", 1)
+    assert ("part", "fast", 3) in [item[:3] for item in summary]
+    assert summary[0][3] >= 0.05
+    assert recorder.total >= summary[0][3]
+    lines = recorder.format_table()
+    assert lines[0].split() == ["Category", "Name", "Count", "Seconds", "%"]
+    assert lines[1].split()[:3] == ["phase", "slow", "1"]
+    assert lines[-1].startswith("total")
+    path = os.path.join(str(tmp_path), "timings.json")
+    recorder.save_json(path)
+    with open(path) as myfile:
+        data = json.load(myfile)
+    assert data["version"] == 1
+    assert data["summary"][0]["name"] == "slow"
+    assert len(data["timings"]) == 5
+    assert data["timings"][0]["category"] == "phase"
+    assert data["timings"][0]["duration"] >= 0.05
+
+
+def test_trace(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook import timings
+
+    recorder = timings.start()
+    try:
+        with timings.measure("phase", "outer") as info:
+            info["extra"] = "yes"
+            start = timings.clock()
+            timings.record("command", "inner", start, thread=42, args={"pid": 1})
+    finally:
+        timings.stop()
+    timings.record("command", "not recorded", timings.clock())
+    path = os.path.join(str(tmp_path), "trace.json")
+    recorder.save_trace(path)
+    with open(path) as myfile:
+        data = json.load(myfile)
+    events = data["traceEvents"]
+    assert events[0]["ph"] == "M"
+    assert [event["name"] for event in events[1:]] == ["configcook", "inner", "outer"]
+    run, inner, outer = events[1:]
+    assert outer["args"] == {"extra": "yes"}
+    assert outer["cat"] == "phase"
+    assert inner["tid"] == 42
+    assert inner["args"] == {"pid": 1}
+    assert run["tid"] == outer["tid"]
+    assert run["dur"] >= outer["dur"] >= inner["dur"]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import datetime
+import pickle
+import pytest
+
+
+TEXT = """
+title = "Site"
+port = 8080
+ratio = 0.5
+debug = false
+created = 1979-05-27T07:32:00-08:00
+created_utc = 1979-05-27T07:32:00Z
+local = 1979-05-27T07:32:00
+day = 1979-05-27
+time = 07:32:00
+
+[part]
+packages = ["one", "two"]
+server = { host = "localhost", ports = [1, 2] }
+"""
+
+
+def test_get_backend():
+    from configcook import tomlparser
+
+    backends = tomlparser.available_backends()
+    assert backends
+    # We use the fastest one.
+    assert tomlparser.get_backend() == backends[0]
+    with pytest.raises(ValueError):
+        tomlparser.get_loader("no_such_backend")
+
+
+def test_loads_all_backends():
+    from configcook import tomlparser
+
+    results = []
+    for backend in tomlparser.available_backends():
+        result = tomlparser.loads(TEXT, backend=backend)
+        assert result["title"] == "Site"
+        assert result["port"] == 8080
+        assert type(result["part"]["server"]) is dict
+        created = result["created"]
+        assert created.utcoffset() == datetime.timedelta(hours=-8)
+        assert isinstance(created.tzinfo, datetime.timezone)
+        assert result["local"].tzinfo is None
+        assert result["day"] == datetime.date(1979, 5, 27)
+        assert result["time"] == datetime.time(7, 32)
+        # We can pickle it, so we can cache it.
+        assert pickle.loads(pickle.dumps(result)) == result
+        results.append(result)
+    # All backends give the same result.
+    for result in results[1:]:
+        assert result == results[0]
+
+
+def test_loads_error():
+    from configcook import tomlparser
+    from configcook.exceptions import ConfigError
+
+    for backend in tomlparser.available_backends():
+        with pytest.raises(ConfigError) as exc:
+            tomlparser.loads("[part\nkey = ", location="broken.toml", backend=backend)
+        assert "broken.toml" in str(exc.value)
@@ -39,6 +39,197 @@ def test_to_path_symlink(tmp_path, safe_working_dir):
     assert to_path("destination") == source_path
 
 
+def test_join_location():
+    from configcook.utils import is_url
+    from configcook.utils import join_location
+
+    assert is_url("https://example.org/a.toml")
+    assert is_url("file:///tmp/a.toml")
+    assert not is_url("/tmp/a.toml")
+    assert not is_url("a.toml")
+    assert join_location("/tmp/a/b.toml", "c.toml") == os.path.realpath("/tmp/a/c.toml")
+    assert join_location("/tmp/a/b.toml", "../c.toml") == os.path.realpath("/tmp/c.toml")
+    assert join_location("/tmp/a/b.toml", "/d/c.toml") == os.path.realpath("/d/c.toml")
+    url = "https://example.org/configs/base.toml"
+    assert join_location("/tmp/a/b.toml", url) == url
+    assert join_location(url, "c.toml") == "https://example.org/configs/c.toml"
+    assert join_location(url, "../c.toml") == "https://example.org/c.toml"
+    assert join_location(url, "http://other/c.toml") == "http://other/c.toml"
+
+
+def test_to_list():
+    from configcook.utils import to_list
+
+    value = ["a"]
+    assert to_list(value) is value
+    assert to_list(("a", "b")) == ["a", "b"]
+    assert to_list("") == []
+    assert to_list("a b\n c") == ["a", "b", "c"]
+    with pytest.raises(ValueError):
+        to_list(1)
+
+
+def test_to_bool():
+    from configcook.utils import to_bool
+
+    for value in (True, 1, "true", "True", "yes", "on", "1", " TRUE "):
+        assert to_bool(value) is True
+    for value in (False, 0, "false", "no", "off", "0", ""):
+        assert to_bool(value) is False
+    for value in (2, "maybe", [], None):
+        with pytest.raises(ValueError):
+            to_bool(value)
+
+
+def test_to_int():
+    from configcook.utils import to_int
+
+    assert to_int(0) == 0
+    assert to_int(42) == 42
+    assert to_int(" 42 ") == 42
+    assert to_int("-1") == -1
+    for value in (True, "one", "1.5", 1.5, None):
+        with pytest.raises(ValueError):
+            to_int(value)
+
+
+def test_atomic_write(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.utils import atomic_write
+
+    str_path = str(tmp_path)
+    path = os.path.join(str_path, "file.txt")
+    atomic_write(path, "one")
+    with open(path) as myfile:
+        assert myfile.read() == "one"
+    atomic_write(path, "two")
+    with open(path) as myfile:
+        assert myfile.read() == "two"
+    # No temporary files are left.
+    assert os.listdir(str_path) == ["file.txt"]
+    with pytest.raises(TypeError):
+        atomic_write(path, 3)
+    assert os.listdir(str_path) == ["file.txt"]
+    with open(path) as myfile:
+        assert myfile.read() == "two"
+
+
+def test_atomic_write_permissions(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.utils import atomic_write
+
+    path = os.path.join(str(tmp_path), "script.sh")
+    orig_umask = os.umask(0o022)
+    try:
+        atomic_write(path, "echo 1")
+        # Not the 0600 of a temporary file.
+        assert os.stat(path).st_mode & 0o777 == 0o644
+    finally:
+        os.umask(orig_umask)
+    os.chmod(path, 0o755)
+    atomic_write(path, "echo 2")
+    assert os.stat(path).st_mode & 0o777 == 0o755
+
+
+def test_get_umask_threads(monkeypatch):
+    from configcook import utils
+
+    import threading
+
+    monkeypatch.setattr(utils, "_umask", None)
+    orig_umask = os.umask(0o027)
+    try:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(utils._get_umask()))
+            for _i in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [0o027] * 20
+        # The umask of the process is unchanged.
+        assert os.umask(0o027) == 0o027
+    finally:
+        os.umask(orig_umask)
+
+
+def test_write_if_changed(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.utils import file_has_contents
+    from configcook.utils import write_if_changed
+
+    path = os.path.join(str(tmp_path), "output.txt")
+    assert not file_has_contents(path, b"")
+    assert write_if_changed(path, u"caf\xe9")
+    with open(path, "rb") as myfile:
+        assert myfile.read() == b"caf\xc3\xa9"
+    assert file_has_contents(path, b"caf\xc3\xa9")
+    assert file_has_contents(path, b"caf\xc3\xa9", chunk_size=2)
+    # Set the modification time in the past, so we can see a change.
+    os.utime(path, (1000, 1000))
+    assert not write_if_changed(path, u"caf\xe9")
+    assert os.stat(path).st_mtime == 1000
+    # Same size, other contents.
+    assert write_if_changed(path, b"cafe!")
+    assert os.stat(path).st_mtime != 1000
+    assert not write_if_changed(path, b"cafe!")
+
+
+def test_requirement_is_satisfied():
+    from configcook.utils import requirement_is_satisfied as ris
+
+    # We need six ourselves.
+    assert ris("six")
+    assert ris("six>=1.0")
+    assert not ris("six>=1000")
+    assert not ris("configcook-no-such-package")
+    # Markers are evaluated.
+    assert ris("configcook-no-such-package; python_version < '2'")
+    # Anything that is not a plain requirement is for pip to handle.
+    assert not ris(".")
+    assert not ris("-e .")
+    assert not ris("git+https://github.com/mauritsvanrees/configcook")
+    assert not ris("six @ https://example.org/six.whl")
+
+
+def test_requirement_is_satisfied_get_version():
+    from configcook.utils import requirement_is_satisfied as ris
+
+    pytest.importorskip("packaging.requirements")
+    get_version = {"six": "1.16.0"}.get
+    assert ris("six", get_version)
+    assert ris("six>=1.0", get_version)
+    assert ris("six==1.16.*", get_version)
+    assert not ris("six>=1000", get_version)
+    assert not ris("configcook-no-such-package", get_version)
+    assert ris("configcook-no-such-package; python_version < '2'", get_version)
+    assert not ris("-e .", get_version)
+    assert not ris("six @ https://example.org/six.whl", get_version)
+
+
+def test_requirement_is_satisfied_without_pkg_resources():
+    # Importing pkg_resources is slow, so we only do that when needed.
+    import subprocess
+    import sys
+
+    pytest.importorskip("packaging.requirements")
+    code = "; ".join(
+        [
+            "import sys",
+            "from configcook.entrypoints import EntrypointIndex",
+            "from configcook.utils import requirement_is_satisfied",
+            "get_version = EntrypointIndex().get_distribution_version",
+            "assert requirement_is_satisfied('six>=1.0', get_version)",
+            "assert not requirement_is_satisfied('six>=1000', get_version)",
+            "print('pkg_resources' in sys.modules)",
+        ]
+    )
+    output = subprocess.check_output([sys.executable, "-c", code])
+    assert output.strip() == b"False"
+
+
 def test_format_command_for_print():
     from configcook.utils import format_command_for_print as fp
 
@@ -50,6 +241,39 @@ def test_format_command_for_print():
         fp("")
 
 
+def test_split_command():
+    from configcook.utils import split_command
+
+    assert split_command("ls -l") == ["ls", "-l"]
+    assert split_command("  ") == []
+    assert split_command('echo "This is a listing:"') == ["echo", "This is a listing:"]
+    assert split_command("echo 'a  b' c\\ d") == ["echo", "a  b", "c d"]
+    # Shell operators need a shell.
+    assert split_command("ls | sort") == ["/bin/sh", "-c", "ls | sort"]
+    assert split_command("echo a > b") == ["/bin/sh", "-c", "echo a > b"]
+    assert split_command("make && make test") == [
+        "/bin/sh",
+        "-c",
+        "make && make test",
+    ]
+    # Not when they are quoted.
+    assert split_command("echo '|'") == ["echo", "|"]
+    assert split_command('echo "a|b"') == ["echo", "a|b"]
+    assert split_command("echo a\\|b") == ["echo", "a|b"]
+    # Also without spaces.
+    assert split_command("echo hi>out") == ["/bin/sh", "-c", "echo hi>out"]
+    assert split_command("ls|sort") == ["/bin/sh", "-c", "ls|sort"]
+    # Variables, also in double quotes, but not in single quotes.
+    assert split_command('echo "$HOME"') == ["/bin/sh", "-c", 'echo "$HOME"']
+    assert split_command("echo '$HOME'") == ["echo", "$HOME"]
+    assert split_command("ls *.txt") == ["/bin/sh", "-c", "ls *.txt"]
+    # Environment variables for the command.
+    assert split_command("FOO=1 env") == ["/bin/sh", "-c", "FOO=1 env"]
+    assert split_command("pip install foo==1.0") == ["pip", "install", "foo==1.0"]
+    with pytest.raises(ValueError):
+        split_command("echo it's")
+
+
 def test_call_or_fail():
     from configcook.utils import call_or_fail
 
@@ -59,6 +283,25 @@ def test_call_or_fail():
     assert exc.value.returncode == 1
 
 
+def test_call_or_fail_string_command():
+    from configcook import timings
+    from configcook.utils import call_or_fail
+    from configcook.utils import call_with_output_or_fail
+
+    # A string is a command without arguments, or one for the shell.
+    assert call_or_fail("true") == 0
+    assert call_with_output_or_fail("echo hi", shell=True) == b"hi\n"
+    # The real error is not hidden.
+    with pytest.raises(CalledProcessError):
+        call_or_fail("false")
+    recorder = timings.start()
+    try:
+        assert call_with_output_or_fail("echo hi", shell=True) == b"hi\n"
+    finally:
+        timings.stop()
+    assert [record.name for record in recorder.records] == ["echo hi"]
+
+
 def test_call_with_exitcode():
     from configcook.utils import call_with_exitcode
 
@@ -73,3 +316,91 @@ def test_call_with_output_or_fail():
     with pytest.raises(CalledProcessError) as exc:
         call_with_output_or_fail(["ln"])
     assert exc.value.returncode == 1
+
+
+def test_call_with_out_and_err():
+    from configcook.utils import call_with_out_and_err
+
+    exitcode, out, err = call_with_out_and_err(["echo", "foo"])
+    assert exitcode == 0
+    assert out == "foo\n"
+    assert err == ""
+    exitcode, out, err = call_with_out_and_err(["ln"])
+    assert exitcode == 1
+    assert out == ""
+    assert "ln" in err
+
+
+def test_hook_table():
+    from configcook.extensions import PDBExtension
+    from configcook.extensions import ProfileExtension
+    from configcook.utils import HookTable
+
+    class All(object):
+        def run_before(self, function_name, instance):
+            pass
+
+    class Some(object):
+        def subscriptions(self):
+            return {"run_before": ["load_recipes"], "run_after": ["run_part"]}
+
+        def run_before(self, function_name, instance):
+            pass
+
+        def run_after(self, function_name, instance):
+            pass
+
+    first = All()
+    some = Some()
+    last = All()
+    table = HookTable([first, some, last])
+    # The order of the extensions is kept.
+    assert table.get("run_before", "load_recipes") == (
+        first.run_before,
+        some.run_before,
+        last.run_before,
+    )
+    assert table.get("run_before", "run_recipes") == (
+        first.run_before,
+        last.run_before,
+    )
+    assert table.get("run_after", "run_part") == (some.run_after,)
+    assert table.get("run_after", "run_recipes") == ()
+    assert HookTable().get("run_before", "run_recipes") == ()
+
+    # The extensions of configcook only subscribe to what is in their options.
+    pdb = PDBExtension("configcook:pdb", {}, {"before": ["run_recipes"]})
+    profile = ProfileExtension("configcook:profile", {}, {"parts": ["one"]})
+    table = HookTable([pdb, profile])
+    assert table.get("run_before", "run_recipes") == (pdb.run_before,)
+    assert table.get("run_after", "run_recipes") == ()
+    assert table.get("run_before", "run_part") == (profile.run_before,)
+    assert table.get("run_after", "run_part") == (profile.run_after,)
+    assert table.get("run_before", "load_recipes") == ()
+
+
+def test_options_validator():
+    from configcook.utils import OptionsValidator
+    from configcook.utils import to_int
+
+    validator = OptionsValidator(
+        {
+            "name": {"required": True},
+            "number": {"default": "1", "parser": to_int},
+            "names": {"default": [], "type": list},
+        }
+    )
+    options = {"name": "one"}
+    assert validator.check(options) == []
+    assert options == {"name": "one", "number": 1, "names": []}
+
+    # We get all errors, not only the first.
+    options = {"number": "many", "names": "one"}
+    assert validator.check(options) == [
+        "Option name is missing.",
+        "Option number: Cannot turn into an integer: 'many'",
+        "Option names must be of type {0}. Got type: {1} (one).".format(list, str),
+    ]
+    with pytest.raises(ValueError) as exc:
+        validator.validate(options)
+    assert len(str(exc.value).splitlines()) == 3
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pytest
+import sys
+import threading
+import time
+
+
+def change_later(path, text, delay=0.2):
+    def change():
+        time.sleep(delay)
+        with open(path, "w") as myfile:
+            myfile.write(text)
+
+    thread = threading.Thread(target=change)
+    thread.start()
+    return thread
+
+
+def check_watcher(watcher, tmp_path):
+    path = os.path.join(str(tmp_path), "cc.toml")
+    other = os.path.join(str(tmp_path), "other.toml")
+    try:
+        # Nothing changes.
+        assert watcher.wait(timeout=0.3) == []
+        # A file that we do not watch changes.
+        thread = change_later(other, "[other]")
+        assert watcher.wait(timeout=0.6) == []
+        thread.join()
+        # The watched file changes.
+        thread = change_later(path, "[configcook]\nparts = []\n")
+        assert watcher.wait(timeout=5) == [path]
+        thread.join()
+    finally:
+        watcher.close()
+
+
+def test_polling_watcher(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.watch import PollingWatcher
+
+    path = os.path.join(str(tmp_path), "cc.toml")
+    with open(path, "w") as myfile:
+        myfile.write("[configcook]")
+    check_watcher(PollingWatcher([path], interval=0.05), tmp_path)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Needs Linux")
+def test_inotify_watcher(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.watch import InotifyWatcher
+
+    path = os.path.join(str(tmp_path), "cc.toml")
+    with open(path, "w") as myfile:
+        myfile.write("[configcook]")
+    check_watcher(InotifyWatcher([path]), tmp_path)
+
+
+def test_parse_only_changed_files(tmp_path):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook.config import parse_toml_config
+    from configcook.watch import changed_since_parse
+
+    str_path = str(tmp_path)
+    base = os.path.join(str_path, "base.toml")
+    main = os.path.join(str_path, "cc.toml")
+    extra = os.path.join(str_path, "extra.toml")
+    with open(base, "w") as myfile:
+        myfile.write('[one]\nname = "base"\n')
+    with open(extra, "w") as myfile:
+        myfile.write('[two]\nname = "extra"\n')
+    with open(main, "w") as myfile:
+        myfile.write('[configcook]\nextends = ["base.toml", "extra.toml"]\n')
+    documents = {}
+    config = parse_toml_config(main, documents=documents)
+    assert config["one"]["name"] == "base"
+    assert sorted(documents) == [base, main, extra]
+    base_document = documents[base][1]
+    assert changed_since_parse(documents) == []
+
+    # Change the main file, so it no longer extends extra.toml.
+    with open(main, "w") as myfile:
+        myfile.write('[configcook]\nextends = ["base.toml"]\n[one]\nother = "main"\n')
+    assert changed_since_parse(documents) == [main]
+    config = parse_toml_config(main, documents=documents)
+    assert config["one"] == {"name": "base", "other": "main"}
+    assert "two" not in config
+    assert sorted(documents) == [base, main]
+    # The unchanged file was not parsed again.
+    assert documents[base][1] is base_document
+    assert changed_since_parse(documents) == []
+
+
+def test_watch(tmp_path, safe_working_dir):
+    # tmp_path is a pathlib/pathlib2.Path object.
+    from configcook import watch
+    from configcook.tests.test_main import make_cook
+
+    str_path = str(tmp_path)
+    os.chdir(str_path)
+    path = os.path.join(str_path, "cc.toml")
+    runs = []
+
+    class Cook(object):
+        """Fake ConfigCook."""
+
+        def __init__(self, documents=None, update_unchanged=True):
+            self.documents = documents
+            self.update_unchanged = update_unchanged
+            self.options = make_cook({}, configfile=path).options
+
+        def __call__(self):
+            runs.append(self.update_unchanged)
+            with open(path, "rb") as myfile:
+                data = myfile.read()
+            self.documents[path] = (hashlib.sha256(data).hexdigest(), {})
+            if len(runs) == 2:
+                raise ValueError("Second run fails, but we keep watching.")
+            if len(runs) == 3:
+                raise KeyboardInterrupt
+
+        def next_run(self):
+            return Cook(self.documents, update_unchanged=False)
+
+    with open(path, "w") as myfile:
+        myfile.write("one")
+    thread = change_later(path, "two", delay=0.3)
+    other = threading.Thread(target=watch.watch, args=(Cook(),))
+    other.start()
+    thread.join()
+    time.sleep(0.3)
+    change_later(path, "three").join()
+    other.join(5)
+    assert not other.is_alive()
+    assert runs == [True, False, False]
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Record how long the phases and parts of a run take.
+
+Recording only happens when a recorder is started,
+for example with the --timings or --trace option.
+Otherwise measure() does nothing, so it costs almost no time.
+"""
+import contextlib
+import os
+import threading
+import time
+
+
+# perf_counter is not available on Python 2.
+clock = getattr(time, "perf_counter", time.time)
+# The active recorder, if any.
+_recorder = None
+
+
+class Timing(object):
+    """One measured duration.
+
+    thread identifies the thread, or the asyncio task, that did the work.
+    args is a dictionary with extra information, like the pid of a command.
+    """
+
+    __slots__ = ("category", "name", "start", "end", "thread", "args")
+
+    def __init__(self, category, name, start, end, thread=None, args=None):
+        self.category = category
+        self.name = name
+        self.start = start
+        self.end = end
+        self.thread = thread
+        self.args = args or {}
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return "<Timing {0} {1} {2:.4f}>".format(self.category, self.name, self.duration)
+
+
+class Timings(object):
+    """Recorder for timings.
+
+    Times are from time.perf_counter, relative to the start of the recorder.
+    """
+
+    def __init__(self):
+        self.start = clock()
+        self.end = None
+        self.thread = threading.current_thread().ident
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, category, name, start, end, thread=None, args=None):
+        if thread is None:
+            thread = threading.current_thread().ident
+        timing = Timing(
+            category, name, start - self.start, end - self.start, thread, args
+        )
+        with self._lock:
+            self.records.append(timing)
+        return timing
+
+    @property
+    def total(self):
+        end = self.end if self.end is not None else clock()
+        return end - self.start
+
+    def summary(self):
+        """Get the timings per category and name, slowest first.
+
+        Returns a list of (category, name, count, total duration).
+        """
+        totals = {}
+        for timing in self.records:
+            key = (timing.category, timing.name)
+            count, duration = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, duration + timing.duration)
+        result = [
+            (category, name, count, duration)
+            for (category, name), (count, duration) in totals.items()
+        ]
+        result.sort(key=lambda item: (-item[3], item[0], item[1]))
+        return result
+
+    def format_table(self):
+        """Get the summary as lines of a table."""
+        summary = self.summary()
+        total = self.total
+        category_width = max([len("Category")] + [len(item[0]) for item in summary])
+        name_width = max([len("Name")] + [len(item[1]) for item in summary])
+        line = "{0:<%d}  {1:<%d}  {2:>5}  {3:>10}  {4:>6}" % (category_width, name_width)
+        lines = [line.format("Category", "Name", "Count", "Seconds", "%")]
+        for category, name, count, duration in summary:
+            percentage = 100.0 * duration / total if total else 0.0
+            lines.append(
+                line.format(
+                    category,
+                    name,
+                    count,
+                    "{0:.4f}".format(duration),
+                    "{0:.1f}".format(percentage),
+                )
+            )
+        lines.append(line.format("total", "", "", "{0:.4f}".format(total), "100.0"))
+        return lines
+
+    def as_dict(self):
+        """Get all timings in a dictionary that can be saved as json."""
+        return {
+            "version": 1,
+            "total": self.total,
+            "summary": [
+                {"category": category, "name": name, "count": count, "total": duration}
+                for category, name, count, duration in self.summary()
+            ],
+            "timings": [
+                {
+                    "category": timing.category,
+                    "name": timing.name,
+                    "start": timing.start,
+                    "duration": timing.duration,
+                    "thread": timing.thread,
+                    "args": timing.args,
+                }
+                for timing in self.records
+            ],
+        }
+
+    def save_json(self, path):
+        import json
+
+        from .utils import atomic_write
+
+        atomic_write(path, json.dumps(self.as_dict(), indent=2, sort_keys=True) + "\n")
+
+    def as_trace(self):
+        """Get all timings as Chrome trace events.
+
+        See the Trace Event Format documentation of Chrome.
+        Each timing is a complete event ("X") with microseconds.
+        Events of the same thread are shown nested in a trace viewer,
+        from the whole run, to phases, parts, and commands.
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "configcook"},
+            },
+            {
+                "name": "configcook",
+                "cat": "run",
+                "ph": "X",
+                "ts": 0,
+                "dur": int(self.total * 1000000),
+                "pid": pid,
+                "tid": self.thread,
+            },
+        ]
+        for timing in self.records:
+            events.append(
+                {
+                    "name": timing.name,
+                    "cat": timing.category,
+                    "ph": "X",
+                    "ts": int(timing.start * 1000000),
+                    "dur": int(timing.duration * 1000000),
+                    "pid": pid,
+                    "tid": timing.thread,
+                    "args": timing.args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, path):
+        """Save the timings as Chrome trace json.
+
+        Open this in chrome://tracing or https://ui.perfetto.dev
+        """
+        import json
+
+        from .utils import atomic_write
+
+        atomic_write(path, json.dumps(self.as_trace()))
+
+
+def start():
+    """Start recording timings.  Returns the recorder."""
+    global _recorder
+    _recorder = Timings()
+    return _recorder
+
+
+def stop():
+    """Stop recording timings.  Returns the recorder, or None."""
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    if recorder is not None:
+        recorder.end = clock()
+    return recorder
+
+
+def get_recorder():
+    return _recorder
+
+
+def record(category, name, start, thread=None, args=None):
+    """Record a timing that started at 'start' and ends now.
+
+    start must come from clock().
+    This does nothing when no recorder is active.
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.add(category, name, start, clock(), thread, args)
+
+
+@contextlib.contextmanager
+def measure(category, name, thread=None):
+    """Context manager that records how long its body takes.
+
+    It gives a dictionary, where you can add extra information.
+    This does nothing when no recorder is active.
+    """
+    args = {}
+    recorder = _recorder
+    if recorder is None:
+        yield args
+        return
+    start_time = clock()
+    try:
+        yield args
+    finally:
+        recorder.add(category, name, start_time, clock(), thread, args)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Parse toml with the fastest library that is available.
+
+We try these backends in order:
+
+- tomllib from the standard library, on Python 3.11 and higher
+- tomli, which is the same code for older Pythons
+- toml, which is slower, and does not support all of TOML 1.0
+
+The backends return slightly different types.
+We normalise them, so the result does not depend on the backend.
+"""
+from .exceptions import ConfigError
+
+import datetime
+
+
+# Names of the backends, fastest first.
+BACKENDS = ("tomllib", "tomli", "toml")
+# name -> loads function, filled when a backend is first used.
+_loaders = {}
+# Name of the default backend, once we have found it.
+_default = []
+
+
+def _import_loads(name):
+    """Import a backend and return its loads function and its error class."""
+    # Importing takes a bit of time, so only do it when needed.
+    if name == "tomllib":
+        import tomllib
+
+        return tomllib.loads, tomllib.TOMLDecodeError
+    if name == "tomli":
+        import tomli
+
+        return tomli.loads, tomli.TOMLDecodeError
+    if name == "toml":
+        import toml
+
+        return toml.loads, toml.TomlDecodeError
+    raise ValueError(
+        "Unknown toml backend {0!r}. Choose from: {1}".format(
+            name, ", ".join(BACKENDS)
+        )
+    )
+
+
+def get_loader(name=None):
+    """Get the loads function and error class of a backend.
+
+    Without a name, we get the first backend that can be imported.
+    Raises ImportError when the backend is not installed.
+    """
+    if name is None:
+        if not _default:
+            for backend in BACKENDS:
+                try:
+                    get_loader(backend)
+                except ImportError:
+                    continue
+                _default.append(backend)
+                break
+            else:
+                raise ImportError(
+                    "No toml library found. Install one of: {0}".format(
+                        ", ".join(BACKENDS[1:])
+                    )
+                )
+        name = _default[0]
+    if name not in _loaders:
+        _loaders[name] = _import_loads(name)
+    return _loaders[name]
+
+
+def get_backend():
+    """Get the name of the backend that we use by default."""
+    get_loader()
+    return _default[0]
+
+
+def available_backends():
+    """Get the names of the backends that can be imported."""
+    result = []
+    for name in BACKENDS:
+        try:
+            get_loader(name)
+        except ImportError:
+            continue
+        result.append(name)
+    return result
+
+
+def normalise(value):
+    """Normalise the types that a backend returns.
+
+    - toml uses dictionary subclasses for inline tables,
+      which cannot be pickled, so we could not cache them.
+      We turn all dictionaries into plain dictionaries.
+    - toml uses its own timezone class for datetimes with an offset.
+      We use datetime.timezone, like tomllib and tomli.
+    """
+    if isinstance(value, dict):
+        return dict((key, normalise(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [normalise(item) for item in value]
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        timezone = getattr(datetime, "timezone", None)
+        if timezone is not None and not isinstance(value.tzinfo, timezone):
+            return value.replace(tzinfo=timezone(value.utcoffset()))
+    return value
+
+
+def loads(text, location=None, backend=None):
+    """Parse toml text and return a dictionary.
+
+    location is only used in the error message, when the text is invalid.
+    Parse errors of all backends are raised as ConfigError.
+    """
+    function, error_class = get_loader(backend)
+    try:
+        result = function(text)
+    except error_class as exc:
+        raise ConfigError(
+            "Cannot parse toml in {0}: {1}".format(location or "text", exc)
+        )
+    return normalise(result)
@@ -1,47 +1,119 @@
 # -*- coding: utf-8 -*-
-from .exceptions import ConfigError
+from . import timings
+from .substitution import Resolver
+from .substitution import substitution_pattern  # noqa: F401
+from six.moves.urllib.parse import urljoin
+
+import contextlib
 import functools
+import inspect
 import logging
 import os
 import re
 import six
-import subprocess
-import tempfile
+import threading
 import time
 
 
 logger = logging.getLogger(__name__)
-# pattern for ${part:option}
-substitution_pattern = re.compile(r"\${([^:]*):([^}]+)}")
+# Note: we import subprocess and tempfile only in the functions that need them.
+# The same is true for our own process module, which imports subprocess.
+# This keeps the start up time of the command line script low.
+
+# Characters that mean a command must be run in a shell, when they are not quoted:
+# operators, redirects, variables, globs, and the like.
+SHELL_CHARACTERS = frozenset("|&;<>()$`*?[]{}~#\n")
+# Characters that the shell still handles within double quotes.
+SHELL_DOUBLE_QUOTED_CHARACTERS = frozenset("$`\\")
+# An environment variable for the command, like 'FOO=1 env'.
+ENV_ASSIGNMENT_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*=")
+# Directory for caches, unless the config says otherwise.
+DEFAULT_CACHE_DIRECTORY = "~/.cache/configcook"
+# Hooks that extensions can have.
+HOOK_NAMES = ("run_before", "run_after")
 
 
 def substitute(config, text, current_part=""):
     """Get substitution value.
 
     Get the real value from something like ${part:option}.
+    References in the referenced values are substituted too.
     """
-    if not isinstance(text, six.string_types):
-        # Nothing to substitute here.
-        return text
-    for part, option in substitution_pattern.findall(text):
-        template = "${%s:%s}" % (part, option)
-        if not part:
-            # ${:option} points to the current part
-            part = current_part
-        try:
-            value = config[part][option]
-        except KeyError:
-            raise ConfigError(
-                "Unable to substitute '{0}' from config.".format(template)
-            )
-        logger.debug("Substituting %r with %r", template, value)
-        # TODO: call recursively if needed.
-        # value used to be a string, but can now be a list, boolean, etc.
-        # TODO We might need to keep that.
-        if not isinstance(value, six.string_types):
-            value = "{0!r}".format(value)
-        text = text.replace(template, value)
-    return text
+    return Resolver(config).render(text, current_part=current_part)
+
+
+def _requirement_version_is_installed(requirement, get_version):
+    """Check a requirement with the packaging library.
+
+    Returns True or False, or None when we cannot tell.
+    """
+    try:
+        from packaging.requirements import InvalidRequirement
+        from packaging.requirements import Requirement
+    except ImportError:
+        return None
+    try:
+        parsed = Requirement(requirement)
+    except InvalidRequirement:
+        return False
+    if parsed.url:
+        # foo @ https://...
+        return False
+    if parsed.marker is not None and not parsed.marker.evaluate():
+        # Not needed on this Python or platform.
+        return True
+    if parsed.extras:
+        # The extras may need more distributions.
+        return None
+    version = get_version(parsed.name)
+    if version is None:
+        logger.debug("Requirement %s is not satisfied: not installed.", requirement)
+        return False
+    if not version:
+        return None
+    try:
+        return parsed.specifier.contains(version, prereleases=True)
+    except ValueError:
+        # Not a valid version.
+        return None
+
+
+def requirement_is_satisfied(requirement, get_version=None):
+    """Check if a requirement is satisfied by the installed packages.
+
+    requirement is a string like "foo" or "foo[extra]>=1.0",
+    as you would pass it to pip install.
+
+    get_version can be a function that returns the version of an installed
+    distribution, or None, like EntrypointIndex.get_distribution_version.
+    Then we check the version with the packaging library,
+    which is much faster to import than pkg_resources.
+    We trust that pip has installed the dependencies of the distribution.
+    Otherwise, or when that cannot tell, we use pkg_resources,
+    which checks the dependencies of the requirement as well.
+
+    For anything that is not a plain requirement, like a path, a url,
+    or a pip option like "-e", we return False, so pip can handle it.
+    """
+    if get_version is not None:
+        result = _requirement_version_is_installed(requirement, get_version)
+        if result is not None:
+            return result
+    import pkg_resources
+
+    try:
+        parsed = pkg_resources.Requirement.parse(requirement)
+    except ValueError:
+        return False
+    if getattr(parsed, "url", None):
+        # foo @ https://...
+        return False
+    try:
+        pkg_resources.require(requirement)
+    except pkg_resources.ResolutionError as exc:
+        logger.debug("Requirement %s is not satisfied: %s", requirement, exc)
+        return False
+    return True
 
 
 def format_command_for_print(command):
@@ -60,72 +132,156 @@ def format_command_for_print(command):
     return " ".join(args)
 
 
-def call_or_fail(command):
+def needs_shell(command):
+    """Does this command line need a shell?
+
+    This is true when it has characters that the shell handles specially,
+    like a pipe, a redirect or a variable, outside of single quotes,
+    or when it starts with an environment variable like 'FOO=1'.
+    When unsure, we say yes: the shell always does the right thing.
+    """
+    if ENV_ASSIGNMENT_PATTERN.match(command):
+        return True
+    quote = None
+    escaped = False
+    for char in command:
+        if escaped:
+            escaped = False
+        elif quote == "'":
+            if char == "'":
+                quote = None
+        elif quote == '"':
+            if char == '"':
+                quote = None
+            elif char in SHELL_DOUBLE_QUOTED_CHARACTERS:
+                return True
+        elif char == "\\":
+            escaped = True
+        elif char in "'\"":
+            quote = char
+        elif char in SHELL_CHARACTERS:
+            return True
+    return False
+
+
+def split_command(command):
+    """Split a command line into a list of arguments.
+
+    We split it like a shell would do, so quotes work.
+    We only use a shell when the command needs one, see needs_shell.
+    Otherwise the command is started directly, which is faster.
+    Raises ValueError for an unbalanced quote.
+    """
+    import shlex
+
+    command = command.strip()
+    # This raises ValueError for an unbalanced quote, also when we use a shell.
+    arguments = shlex.split(command)
+    if needs_shell(command):
+        return ["/bin/sh", "-c", command]
+    return arguments
+
+
+def call_or_fail(command, **kwargs):
     """Call a command or fail (raise an exception).
 
     Call this when you want the program to quit in case of an error.
     The most likely exceptions are OSError and subprocess.CalledProcessError.
+    The output is logged.  Keyword arguments are passed to run_command.
     """
-    return subprocess.check_call(command)
+    from .process import run_command
 
+    run_command(command, check=True, **kwargs)
+    return 0
 
-def call_with_exitcode(command):
+
+def call_with_exitcode(command, **kwargs):
     """Call a command and return the exit code.
 
     Call this when you want the user to see the output and errors,
     and the code is only interested in the exitcode.
     """
-    return subprocess.call(command)
+    from .process import run_command
+
+    return run_command(command, **kwargs).returncode
 
 
-def call_with_output_or_fail(command):
+def call_with_output_or_fail(command, **kwargs):
     """Call a command and return the output or fail (raise an exception).
 
     Call this when you want to catch the output,
     and want the program to quit in case of an error.
     The most likely exceptions are OSError and subprocess.CalledProcessError.
+    The errors are logged.
     """
-    return subprocess.check_output(command)
+    from .process import run_command
 
+    return run_command(command, capture_output=True, check=True, **kwargs).output
 
-def call_with_out_and_err(command):
+
+def call_with_out_and_err(command, **kwargs):
     """Call a command and return the exit code, output and errors.
 
     Call this when you want to use all three return values,
     for example to log the output with INFO, and the errors with DEBUG
     (or with log level ERROR), and to handle the exitcode.
     """
-    out = ""
-    err = ""
-    outfile = tempfile.mkstemp()
-    errfile = tempfile.mkstemp()
-    try:
-        exitcode = subprocess.call(command, stdout=outfile[0], stderr=errfile[0])
-    finally:
-        with open(outfile[1]) as myfile:
-            out = myfile.read()
-        with open(errfile[1]) as myfile:
-            err = myfile.read()
-        # remove the temporary files
-        os.remove(outfile[1])
-        os.remove(errfile[1])
-    return exitcode, out, err
+    from .process import run_command
+
+    result = run_command(
+        command, capture_output=True, capture_errors=True, **kwargs
+    )
+    return (
+        result.returncode,
+        result.output.decode("utf-8", "replace"),
+        result.errors.decode("utf-8", "replace"),
+    )
+
+
+def describe_instance(instance):
+    """Get a nice name to identify an extension or part/recipe."""
+    if instance.is_extension:
+        return "extension {0}".format(instance.name)
+    if instance.is_recipe:
+        return "part {0} [recipe {1}]".format(instance.name, instance.recipe_name)
+    return instance.name
+
+
+def timing_key(instance, fun):
+    """Get the category and name under which we record timings of a method."""
+    if instance.is_recipe:
+        category = "part"
+    elif instance.is_extension:
+        category = "extension"
+    else:
+        category = "entrypoint"
+    return category, "{0} {1}".format(instance.name, fun.__name__)
+
+
+def is_awaitable(value):
+    """Is this the result of calling an 'async def' function?
+
+    This is always False on Python 2.
+    """
+    isawaitable = getattr(inspect, "isawaitable", None)
+    return isawaitable is not None and isawaitable(value)
 
 
 def entrypoint_function(fun):
+    iscoroutinefunction = getattr(inspect, "iscoroutinefunction", None)
+    if iscoroutinefunction is not None and iscoroutinefunction(fun):
+        # An 'async def' method of an extension or recipe.
+        from .aio import async_entrypoint_function
+
+        return async_entrypoint_function(fun)
+
     @functools.wraps(fun)
     def wrapper_entrypoint_function(*args, **kwargs):
-        # Get a nice name to identify this extension or part/recipe.
-        instance = args[0]
-        if instance.is_extension:
-            name = "extension {0}".format(instance.name)
-        elif instance.is_recipe:
-            name = "part {0} [recipe {1}]".format(instance.name, instance.recipe_name)
-        else:
-            name = instance.name
+        name = describe_instance(args[0])
         logger.debug("Calling function %s of %s.", fun.__name__, name)
         start = time.time()
-        result = fun(*args, **kwargs)
+        with timings.measure(*timing_key(args[0], fun)):
+            result = fun(*args, **kwargs)
         end = time.time()
         run_time = end - start
         logger.debug(
@@ -136,31 +292,140 @@ def entrypoint_function(fun):
     return wrapper_entrypoint_function
 
 
+class HookTable(object):
+    """Which extension hooks to call for which configcook function.
+
+    This is built once, after the extensions are loaded,
+    so calling the hooks of a function is a dictionary lookup.
+    Functions for which no extension has a hook cost nothing.
+
+    An extension can have a subscriptions method.
+    This returns a dictionary with a hook name, like run_before,
+    and the names of the functions for which that hook must be called,
+    or None for all functions.  Parts use the function name run_part.
+    Without a subscriptions method, each hook is called for all functions.
+    """
+
+    def __init__(self, extensions=()):
+        # hook name -> list of (hook, function names or None)
+        entries = {}
+        for extension in extensions:
+            subscriptions = getattr(extension, "subscriptions", None)
+            if subscriptions is None:
+                subscriptions = dict.fromkeys(HOOK_NAMES)
+            else:
+                subscriptions = subscriptions()
+            for hook_name, function_names in subscriptions.items():
+                hook = getattr(extension, hook_name, None)
+                if hook is None:
+                    continue
+                if function_names is not None:
+                    function_names = frozenset(function_names)
+                entries.setdefault(hook_name, []).append((hook, function_names))
+        # (hook name, function name) -> tuple of hooks
+        self._hooks = {}
+        # hook name -> tuple of hooks for all functions
+        self._any = {}
+        for hook_name, hooks in entries.items():
+            self._any[hook_name] = tuple(
+                hook for hook, function_names in hooks if function_names is None
+            )
+            for _hook, function_names in hooks:
+                for function_name in function_names or ():
+                    self._hooks[(hook_name, function_name)] = tuple(
+                        hook
+                        for hook, names in hooks
+                        if names is None or function_name in names
+                    )
+
+    def get(self, hook_name, function_name):
+        """Get a tuple of hooks to call, in the order of the extensions."""
+        try:
+            return self._hooks[(hook_name, function_name)]
+        except KeyError:
+            return self._any.get(hook_name, ())
+
+
+def get_hook_table(instance):
+    """Get the hook table of an object with extensions."""
+    table = getattr(instance, "hooks", None)
+    if table is None:
+        # Not a ConfigCook instance.
+        table = HookTable(instance.extensions)
+    return table
+
+
+def start_hooks(hooks, *args, **kwargs):
+    """Call hooks, and return the awaitables of the 'async def' hooks.
+
+    Use this instead of call_hooks when an event loop is already running:
+    the caller must await the awaitables.
+    """
+    awaitables = []
+    for hook in hooks:
+        result = hook(*args, **kwargs)
+        if is_awaitable(result):
+            awaitables.append(result)
+    return awaitables
+
+
+def call_hooks(hooks, *args, **kwargs):
+    """Call hooks, for example from HookTable.get.
+
+    Normal hooks are called in order.
+    Hooks that are defined with 'async def' are run at the same time,
+    after the normal hooks.
+    """
+    awaitables = start_hooks(hooks, *args, **kwargs)
+    if awaitables:
+        from .aio import run_all
+
+        run_all(awaitables)
+
+
 def call_extensions(fun):
     @functools.wraps(fun)
     def wrapper_call_extensions(*args, **kwargs):
         instance = args[0]
         function_name = fun.__name__
-        if instance.extensions:
-            start_ext = time.time()
+        table = get_hook_table(instance)
+        before = table.get("run_before", function_name)
+        after = table.get("run_after", function_name)
+        start_ext = time.time()
+        if before:
             logger.debug(
                 "Calling extensions.run_before for function %s.", function_name
             )
-            for extension in instance.extensions:
-                if hasattr(extension, "run_before"):
-                    extension.run_before(function_name, *args, **kwargs)
+            call_hooks(before, function_name, *args, **kwargs)
         logger.debug("Calling function %s.", function_name)
         start = time.time()
-        result = fun(*args, **kwargs)
+        try:
+            with timings.measure("phase", function_name):
+                result = fun(*args, **kwargs)
+        except Exception:
+            if after:
+                # Like for parts, the after hooks are called on failure too,
+                # for example to stop a profiler.  Their errors are logged,
+                # so they do not hide the original error.
+                logger.debug(
+                    "Calling extensions.run_after for failed function %s.",
+                    function_name,
+                )
+                try:
+                    call_hooks(after, function_name, *args, **kwargs)
+                except Exception:
+                    logger.exception(
+                        "Error in extensions.run_after for function %s.",
+                        function_name,
+                    )
+            raise
         end = time.time()
         run_time = end - start
-        if instance.extensions:
+        if after:
             logger.debug("Calling extensions.run_after for function %s.", function_name)
-            for extension in instance.extensions:
-                if hasattr(extension, "run_after"):
-                    extension.run_after(function_name, *args, **kwargs)
-            end_ext = time.time()
-            ext_time = end_ext - start_ext
+            call_hooks(after, function_name, *args, **kwargs)
+        if before or after:
+            ext_time = time.time() - start_ext
             logger.debug(
                 "Finished in %.4f seconds (%.4f including extensions): function %s.",
                 run_time,
@@ -176,6 +441,180 @@ def call_extensions(fun):
     return wrapper_call_extensions
 
 
+class LogBuffer(logging.Filter):
+    """Collect log records per part, instead of showing them directly.
+
+    This is used when running parts in parallel threads:
+    without it, the log messages of the parts would be mixed up.
+    Call a function with buffer.call(name, function, *args)
+    to collect all log records from that thread under that name.
+    Call buffer.flush(name) to show them.
+    """
+
+    def __init__(self):
+        super(LogBuffer, self).__init__()
+        # thread ident -> name
+        self._threads = {}
+        # name -> list of log records
+        self._records = {}
+
+    def current_name(self):
+        """Get the name that we collect records for in this thread, or None."""
+        return self._threads.get(threading.current_thread().ident)
+
+    def filter(self, record):
+        name = self.current_name()
+        if name is None:
+            # Not a thread that we collect records for.
+            return True
+        # Several handlers may ask us about the same record.
+        # Buffers can be nested, so we remember which buffer has it.
+        if getattr(record, "_configcook_buffer", None) is not self:
+            record._configcook_buffer = self
+            self._records[name].append(record)
+        return False
+
+    def call(self, name, function, *args, **kwargs):
+        ident = threading.current_thread().ident
+        self._records.setdefault(name, [])
+        self._threads[ident] = name
+        try:
+            return function(*args, **kwargs)
+        finally:
+            del self._threads[ident]
+
+    def flush(self, name):
+        for record in self._records.pop(name, []):
+            logging.getLogger(record.name).handle(record)
+
+
+@contextlib.contextmanager
+def buffered_logs(buffer=None):
+    """Context manager that returns a LogBuffer.
+
+    The buffer is active on all handlers of the root logger.
+    You can pass your own buffer, for example an aio.TaskLogBuffer.
+    """
+    if buffer is None:
+        buffer = LogBuffer()
+    handlers = list(logging.getLogger().handlers)
+    if not handlers and getattr(logging, "lastResort", None) is not None:
+        handlers = [logging.lastResort]
+    for handler in handlers:
+        handler.addFilter(buffer)
+    try:
+        yield buffer
+    finally:
+        for handler in handlers:
+            handler.removeFilter(buffer)
+
+
+def _get_umask():
+    """Get the umask of this process.
+
+    We can only get it by setting it, so we do that once.
+    Parts may write files in several threads, so we use a lock:
+    otherwise a thread could read the temporary umask and keep it.
+    """
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            _umask = os.umask(0o022)
+            os.umask(_umask)
+    return _umask
+
+
+_umask = None
+_umask_lock = threading.Lock()
+
+
+def atomic_write(path, text, binary=False):
+    """Write text to a file atomically.
+
+    We write to a temporary file in the same directory,
+    and then rename it to the final path.
+    So readers see either the old or the new contents, never half a file.
+    With binary=True, text must be bytes.
+    An existing file keeps its permissions.
+    A new file gets the same permissions as with a normal open.
+    """
+    import tempfile
+
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~_get_umask()
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dirname or os.curdir, prefix="." + basename, suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb" if binary else "w") as tmp_file:
+            tmp_file.write(text)
+        os.chmod(tmp_path, mode)
+        # os.replace is not available on Python 2.
+        getattr(os, "replace", os.rename)(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def file_has_contents(path, data, chunk_size=64 * 1024):
+    """Check if a file has exactly these contents.
+
+    data must be bytes.  We compare the sizes first,
+    and then the hash of the file, reading it in chunks.
+    """
+    import hashlib
+
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        digest = hashlib.sha256()
+        with open(path, "rb") as myfile:
+            for chunk in iter(lambda: myfile.read(chunk_size), b""):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return False
+    return digest.digest() == hashlib.sha256(data).digest()
+
+
+def write_if_changed(path, text, encoding="utf-8"):
+    """Write text to a file, but only when the contents differ.
+
+    This keeps the modification time of unchanged files,
+    so tools that watch them are not triggered.
+    The file is written atomically.
+    Returns True when the file was written, False when it was unchanged.
+    """
+    data = text if isinstance(text, bytes) else text.encode(encoding)
+    if file_has_contents(path, data):
+        logger.debug("File %s is unchanged.", path)
+        return False
+    atomic_write(path, data, binary=True)
+    return True
+
+
+def is_url(location):
+    """Is this location a url instead of a path?"""
+    return "://" in location
+
+
+def join_location(base, location):
+    """Get the location of a file that is referenced from base.
+
+    base and location can both be a path or a url.
+    Relative locations are relative to the directory of base.
+    """
+    if is_url(location):
+        return location
+    if is_url(base):
+        return urljoin(base, location)
+    if not os.path.isabs(location):
+        location = os.path.join(os.path.dirname(base), location)
+    return to_path(location)
+
+
 def to_path(value):
     """Turn a value into an absolute path."""
     if not isinstance(value, six.string_types):
@@ -183,6 +622,57 @@ def to_path(value):
     return os.path.realpath(os.path.expanduser(value))
 
 
+def to_list(value):
+    """Turn a value into a list.
+
+    A list is returned as is, a tuple is turned into a list,
+    and a string is split on whitespace, like Buildout does.
+    """
+    if isinstance(value, list):
+        return value
+    if isinstance(value, tuple):
+        return list(value)
+    if isinstance(value, six.string_types):
+        return value.split()
+    raise ValueError("Cannot turn into a list: {0!r}".format(value))
+
+
+def to_bool(value):
+    """Turn a value into a boolean.
+
+    Strings like "true", "yes", "on" and "1" are accepted as True,
+    and "false", "no", "off", "0" and the empty string as False.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, six.integer_types) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, six.string_types):
+        lowered = value.strip().lower()
+        if lowered in ("true", "yes", "on", "1"):
+            return True
+        if lowered in ("false", "no", "off", "0", ""):
+            return False
+    raise ValueError("Cannot turn into a boolean: {0!r}".format(value))
+
+
+def to_int(value):
+    """Turn a value into an integer.
+
+    Booleans are not accepted: true + true would be 2.
+    """
+    if isinstance(value, bool):
+        raise ValueError("Cannot turn into an integer: {0!r}".format(value))
+    if isinstance(value, six.integer_types):
+        return value
+    if isinstance(value, six.string_types):
+        try:
+            return int(value.strip())
+        except ValueError:
+            pass
+    raise ValueError("Cannot turn into an integer: {0!r}".format(value))
+
+
 def set_defaults(defaults, options):
     """Add defaults to options.
 
@@ -211,34 +701,80 @@ def set_defaults(defaults, options):
     a default "bin" or "~" could be expanded to an absolute path by parser 'to_path'.
 
     This changes the dictionary in-place.  (Or raises an exception.)
+    When you call this often with the same defaults,
+    use an OptionsValidator instead.
     """
-    for key, value in defaults.items():
-        default = value.get("default")
-        parser = value.get("parser")
-        required = value.get("required", False)
-        if key in options:
-            orig_value = options[key]
-        elif required:
-            raise ValueError("Option {0} is missing.".format(key))
-        else:
-            orig_value = default
-            logger.debug("Set %s option to default %r.", key, default)
-        if parser is None:
-            new_value = orig_value
-        else:
-            new_value = parser(orig_value)
-        if required and not new_value:
-            raise ValueError(
-                "Option {0} is required to be non empty. Got: {1} (parsed as {2}).".format(
-                    key, orig_value, new_value
-                )
+    OptionsValidator(defaults).validate(options)
+
+
+class OptionsValidator(object):
+    """Compiled version of a defaults dictionary, see set_defaults.
+
+    We look at the defaults only once, so using the same validator
+    for many options dictionaries is faster than calling set_defaults.
+    """
+
+    def __init__(self, defaults):
+        self.defaults = defaults
+        # Tuples of key, default, parser, required, type.
+        self.fields = tuple(
+            (
+                key,
+                value.get("default"),
+                value.get("parser"),
+                value.get("required", False),
+                value.get("type"),
             )
-        if new_value is not None:
-            type_ = value.get("type")
-            if type_ and not isinstance(new_value, value.get("type")):
-                raise ValueError(
+            for key, value in defaults.items()
+        )
+
+    def check(self, options):
+        """Add defaults to options, and parse them.
+
+        This changes the dictionary in-place.
+        Returns a list of error messages, empty when all is well.
+        We check all options, also after an error.
+        """
+        errors = []
+        for key, default, parser, required, type_ in self.fields:
+            if key in options:
+                orig_value = options[key]
+            elif required:
+                errors.append("Option {0} is missing.".format(key))
+                continue
+            else:
+                orig_value = default
+                logger.debug("Set %s option to default %r.", key, default)
+            if parser is None:
+                new_value = orig_value
+            else:
+                try:
+                    new_value = parser(orig_value)
+                except ValueError as exc:
+                    errors.append("Option {0}: {1}".format(key, exc))
+                    continue
+            if required and not new_value:
+                errors.append(
+                    "Option {0} is required to be non empty. "
+                    "Got: {1} (parsed as {2}).".format(key, orig_value, new_value)
+                )
+                continue
+            if type_ and new_value is not None and not isinstance(new_value, type_):
+                errors.append(
                     "Option {0} must be of type {1}. Got type: {2} ({3}).".format(
                         key, type_, type(new_value), new_value
                     )
                 )
-        options[key] = new_value
+                continue
+            options[key] = new_value
+        return errors
+
+    def validate(self, options):
+        """Add defaults to options, and parse them.
+
+        This changes the dictionary in-place.
+        Raises a ValueError with all errors.
+        """
+        errors = self.check(options)
+        if errors:
+            raise ValueError("\n".join(errors))
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""Run configcook again each time that a config file changes.
+
+On Linux we use inotify, via ctypes, so we do not need extra packages.
+Elsewhere, or when inotify is not available, we check the files regularly.
+"""
+from .utils import is_url
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+# inotify constants from sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+# Events that mean that a file in a watched directory has changed.
+# We watch directories, because editors often save a file by writing
+# a new file and moving it over the old one.
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+# struct inotify_event: wd, mask, cookie, len, followed by the name.
+EVENT_HEADER = struct.Struct("iIII")
+# After a change, wait until there are no changes for this many seconds,
+# because an editor may write a file in several steps.
+QUIET_TIME = 0.1
+
+
+class PollingWatcher(object):
+    """Watch files by checking their size and modification time regularly."""
+
+    def __init__(self, paths, interval=0.5):
+        self.paths = sorted(set(paths))
+        self.interval = interval
+        self._snapshot = self.snapshot()
+
+    def snapshot(self):
+        result = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                result[path] = None
+            else:
+                result[path] = (stat.st_size, stat.st_mtime)
+        return result
+
+    def wait(self, timeout=None):
+        """Wait until files change.
+
+        Returns a list of changed paths, empty after a timeout.
+        """
+        end = None if timeout is None else time.time() + timeout
+        while end is None or time.time() < end:
+            time.sleep(self.interval)
+            snapshot = self.snapshot()
+            changed = [
+                path for path in self.paths if snapshot[path] != self._snapshot[path]
+            ]
+            self._snapshot = snapshot
+            if changed:
+                return changed
+        return []
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Watch files with inotify on Linux.
+
+    Raises OSError when inotify is not available.
+    """
+
+    def __init__(self, paths):
+        self.paths = sorted(set(paths))
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        # watch descriptor -> directory
+        self._directories = {}
+        try:
+            for directory in sorted(set(os.path.dirname(path) for path in self.paths)):
+                wd = libc.inotify_add_watch(
+                    self.fd, directory.encode(sys.getfilesystemencoding()), WATCH_MASK
+                )
+                if wd < 0:
+                    code = ctypes.get_errno()
+                    raise OSError(code, os.strerror(code), directory)
+                self._directories[wd] = directory
+        except OSError:
+            self.close()
+            raise
+
+    def _read_events(self, timeout):
+        """Read events.  Returns a set of changed paths, maybe empty."""
+        changed = set()
+        readable, _w, _x = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return changed
+            raise
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, _mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name.decode(sys.getfilesystemencoding()))
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        """Wait until files change.
+
+        Returns a list of changed paths, empty after a timeout.
+        """
+        end = None if timeout is None else time.time() + timeout
+        changed = set()
+        while not changed:
+            remaining = None if end is None else end - time.time()
+            if remaining is not None and remaining <= 0:
+                return []
+            changed = self._read_events(remaining)
+        # Wait until things are quiet.
+        while True:
+            more = self._read_events(QUIET_TIME)
+            if not more:
+                break
+            changed.update(more)
+        return sorted(changed)
+
+    def close(self):
+        if self.fd is not None and self.fd >= 0:
+            os.close(self.fd)
+        self.fd = None
+
+
+def get_watcher(paths, interval=0.5):
+    """Get a watcher for these paths: inotify when we can, otherwise polling."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as exc:
+            logger.debug("Cannot use inotify, checking files regularly: %s", exc)
+    return PollingWatcher(paths, interval=interval)
+
+
+def changed_since_parse(documents):
+    """Get the local config files that have changed since they were parsed.
+
+    documents is the dictionary that parse_toml_config has filled.
+    """
+    changed = []
+    for location, (digest, _document) in sorted(documents.items()):
+        if is_url(location):
+            continue
+        try:
+            with open(location, "rb") as config_file:
+                data = config_file.read()
+        except (IOError, OSError):
+            changed.append(location)
+            continue
+        if hashlib.sha256(data).hexdigest() != digest:
+            changed.append(location)
+    return changed
+
+
+def watch(cook, interval=0.5):
+    """Run the cook, and run again each time that a config file changes.
+
+    We watch the config file and all local files that it extends.
+    Urls are not watched.  Stop with Ctrl-C.
+
+    The next runs only parse files that have changed,
+    and skip parts that are installed with the same options.
+    See ConfigCook.next_run.
+    """
+    if cook.documents is None:
+        cook.documents = {}
+    try:
+        while True:
+            try:
+                cook()
+            except Exception as exc:
+                if cook.options.verbose:
+                    logger.exception("Run failed.")
+                else:
+                    logger.error("Run failed: %s", exc)
+            paths = [
+                location for location in cook.documents if not is_url(location)
+            ]
+            if not paths:
+                # Parsing the main config failed before we knew it.
+                paths = [os.path.abspath(cook.options.configfile)]
+            watcher = get_watcher(paths, interval=interval)
+            try:
+                # Changes during the run are not seen by the watcher.
+                changed = changed_since_parse(cook.documents)
+                if not changed:
+                    logger.info(
+                        "Watching %d config file(s) for changes. Press Ctrl-C to stop.",
+                        len(paths),
+                    )
+                    changed = watcher.wait()
+            finally:
+                watcher.close()
+            logger.info("Changed: %s", ", ".join(changed))
+            cook = cook.next_run()
+    except KeyboardInterrupt:
+        logger.info("Stopped watching.")